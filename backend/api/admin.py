@@ -3,7 +3,8 @@ from django.utils.html import format_html
 from .models import (
     Profile, AdditionalImage, Education, WorkExperience, Preference, 
     VerificationDocument, ProfileView, AnalyticsSnapshot,
-    AppConfig
+    AppConfig, MatchFeatures, PrecomputedMatch, Profession, RerankerModel,
+    FaithTag, City
 )
 
 class AdditionalImageInline(admin.TabularInline):
@@ -108,6 +109,49 @@ class AnalyticsSnapshotAdmin(admin.ModelAdmin):
     date_hierarchy = 'date'
 
 
+# Matching Admin
+@admin.register(MatchFeatures)
+class MatchFeaturesAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'gender', 'religion', 'country', 'marital_status', 'has_preference', 'updated_at')
+    list_filter = ('gender', 'religion', 'has_preference')
+    search_fields = ('profile__name', 'profile__user__username')
+    readonly_fields = ('updated_at',)
+
+
+@admin.register(Profession)
+class ProfessionAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+@admin.register(FaithTag)
+class FaithTagAdmin(admin.ModelAdmin):
+    list_display = ('name',)
+    search_fields = ('name',)
+
+
+@admin.register(City)
+class CityAdmin(admin.ModelAdmin):
+    list_display = ('name', 'country', 'latitude', 'longitude', 'population')
+    list_filter = ('country',)
+    search_fields = ('name',)
+
+
+@admin.register(PrecomputedMatch)
+class PrecomputedMatchAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'relaxation', 'is_fallback', 'complete', 'run_id', 'computed_at')
+    list_filter = ('run_id', 'is_fallback')
+    search_fields = ('profile__name', 'profile__user__username')
+    readonly_fields = ('computed_at',)
+
+
+@admin.register(RerankerModel)
+class RerankerModelAdmin(admin.ModelAdmin):
+    list_display = ('version', 'is_active', 'training_pairs', 'trained_at')
+    list_filter = ('is_active',)
+    readonly_fields = ('version', 'feature_names', 'weights', 'metrics', 'training_pairs', 'trained_at')
+
+
 # ==================== MESSAGING ADMIN ====================
 
 @admin.register(AppConfig)
@@ -0,0 +1,244 @@
+"""
+Django management command to benchmark the matching hot paths on a seeded
+synthetic population, so results can be compared between commits.
+
+For every --sizes entry the population is grown to that many synthetic
+members (api.services.synthetic_population, bulk_create based), then each
+scenario is timed on a fixed, seeded sample of viewers:
+
+    compatibility_score       MatchingService.calculate_compatibility_score
+    recommendations_strict    get_ranked_recommendations, uncached, strict filters
+    recommendations_fallback  get_ranked_recommendations, uncached, relaxed filters
+    recommendations_cached    get_ranked_recommendations from a warm cache
+    who_viewed_me             the /api/analytics/who-viewed/ view
+
+Each scenario reports wall time, p50/p95/p99 latency and database queries
+per call, and the peak Python memory allocated by one traced call. Results
+are written as JSON together with the current commit. The synthetic members
+are deleted again at the end unless --keep is given.
+
+Usage:
+    python manage.py benchmark_matching
+    python manage.py benchmark_matching --sizes 1000,10000,100000 --output bench.json
+    python manage.py benchmark_matching --sizes 1000000 --samples 20 --keep
+"""
+import json
+import random
+import resource
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Profile
+from api.services.candidate_index import CandidateIndex
+from api.services.matching_service import MatchingService
+from api.services.synthetic_population import SyntheticPopulation
+from api.views import who_viewed_me
+
+
+# Calls traced with tracemalloc per scenario (tracing slows every allocation)
+MEMORY_CALLS = 3
+
+# At most samples * CLASSIFY_FACTOR viewers are examined to find strict and fallback ones
+CLASSIFY_FACTOR = 10
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(calls):
+    """Time and count queries for each zero-argument callable in `calls`."""
+    latencies, queries = [], []
+    started = time.perf_counter()
+    for call in calls:
+        with CaptureQueriesContext(connection) as captured:
+            t0 = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        queries.append(len(captured))
+    wall = time.perf_counter() - started
+
+    # Peak memory of a few calls, traced separately so timings stay clean
+    peak = 0
+    for call in calls[:MEMORY_CALLS]:
+        tracemalloc.start()
+        call()
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    if not latencies:
+        return {'calls': 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist()
+    return {
+        'calls': len(latencies),
+        'wall_seconds': round(wall, 4),
+        'latency_ms': {
+            'mean': round(float(np.mean(latencies)), 3),
+            'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3),
+            'max': round(max(latencies), 3),
+        },
+        'queries': {'mean': round(float(np.mean(queries)), 2), 'max': max(queries)},
+        'peak_memory_bytes': peak,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark matching and recommendations on a seeded synthetic population'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000',
+            help='Comma-separated population sizes, e.g. 1000,10000,100000,1000000',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Seed for the population and the sampled viewers',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=50,
+            help='Calls per scenario',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per bulk_create batch while generating',
+        )
+        parser.add_argument(
+            '--output',
+            default=None,
+            help='Write the JSON results to this file (default: stdout)',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the synthetic members instead of deleting them afterwards',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+
+        population = SyntheticPopulation(seed=options['seed'])
+        if population.profiles().exists():
+            raise CommandError(
+                f"Synthetic members with prefix '{population.prefix}' already exist; "
+                f"delete them or use another --seed"
+            )
+
+        results = {
+            'commit': _git_commit(),
+            'started_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'samples': options['samples'],
+            'runs': [],
+        }
+
+        try:
+            generated = 0
+            for size in sizes:
+                # 1. Grow the population to `size` members
+                t0 = time.perf_counter()
+                population.generate(size - generated, batch_size=options['batch_size'])
+                generate_seconds = time.perf_counter() - t0
+                generated = size
+                self.stdout.write(f"Generated {size} members in {generate_seconds:.1f}s")
+
+                # 2. Time every scenario on this population
+                run = {
+                    'profiles': size,
+                    'generate_seconds': round(generate_seconds, 2),
+                    'scenarios': self._run_scenarios(population, options['samples'], options['seed']),
+                }
+                results['runs'].append(run)
+                for name, stats in run['scenarios'].items():
+                    if stats['calls']:
+                        self.stdout.write(
+                            f"  {name}: p50 {stats['latency_ms']['p50']}ms, "
+                            f"p99 {stats['latency_ms']['p99']}ms, {stats['queries']['mean']} queries"
+                        )
+        finally:
+            if not options['keep']:
+                population.delete()
+
+        results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+            self.stdout.write(self.style.SUCCESS(f"\n✓ Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _run_scenarios(self, population, samples, seed):
+        rnd = random.Random(seed)
+        profiles = population.profiles().filter(is_activated=True, is_deleted=False)
+        ids = sorted(profiles.values_list('id', flat=True))
+        # Examined in this order until both recommendation scenarios have their samples
+        order = rnd.sample(ids, min(len(ids), samples * CLASSIFY_FACTOR))
+        loaded = Profile.objects.select_related('preference', 'user').in_bulk(order)
+        viewers = [loaded[pid] for pid in order]
+        others = [loaded[pid] for pid in reversed(order[:samples * 2])]
+
+        # Warm the per-worker indexes so the first sample does not pay for them
+        CandidateIndex.get(fresh=True)
+
+        # 1. Pairwise scoring
+        pairs = list(zip(viewers[:samples], others))
+        scenarios = {'compatibility_score': _measure([
+            lambda v=v, o=o: MatchingService.calculate_compatibility_score(v, o) for v, o in pairs
+        ])}
+
+        # 2. Uncached recommendations, split by whether the strict filters sufficed
+        strict, fallback = [], []
+        for viewer in viewers:
+            if len(strict) >= samples and len(fallback) >= samples:
+                break
+            result = MatchingService.get_ranked_recommendations(viewer, use_cache=False)
+            (fallback if result['is_fallback'] else strict).append(viewer)
+        for name, group in (('recommendations_strict', strict), ('recommendations_fallback', fallback)):
+            scenarios[name] = _measure([
+                lambda v=v: MatchingService.get_ranked_recommendations(v, use_cache=False)
+                for v in group[:samples]
+            ])
+
+        # 3. Recommendations from a warm cache
+        for viewer in viewers[:samples]:
+            MatchingService.get_ranked_recommendations(viewer)
+        scenarios['recommendations_cached'] = _measure([
+            lambda v=v: MatchingService.get_ranked_recommendations(v) for v in viewers[:samples]
+        ])
+
+        # 4. Who viewed me
+        factory = APIRequestFactory()
+
+        def view_visitors(viewer):
+            request = factory.get('/api/analytics/who-viewed/')
+            force_authenticate(request, user=viewer.user)
+            who_viewed_me(request)
+
+        scenarios['who_viewed_me'] = _measure([
+            lambda v=v: view_visitors(v) for v in viewers[:samples]
+        ])
+        return scenarios
@@ -0,0 +1,85 @@
+"""
+Django management command to load the offline city gazetteer into the City
+table. Cities are upserted by (country, name), so the command can be re-run
+after the data file is updated. With --resolve every profile's current_city
+is resolved again and the match features of located profiles are rebuilt,
+so new cities and moved coordinates reach the scoring engine.
+
+Usage:
+    python manage.py load_cities
+    python manage.py load_cities --resolve
+    python manage.py load_cities --file /path/to/cities.csv
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Profile
+from api.services.geo_index import GAZETTEER_FILE, Gazetteer, read_gazetteer
+from api.services.map_tiles import MapService
+from api.services.match_features import MatchFeatureService
+
+
+class Command(BaseCommand):
+    help = 'Load the bundled city gazetteer and optionally re-resolve profile cities'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=str(GAZETTEER_FILE),
+            help='Gazetteer CSV (name, country, latitude, longitude, population, alternate_names)',
+        )
+        parser.add_argument(
+            '--resolve',
+            action='store_true',
+            help='Resolve every profile city again and rebuild the affected match features',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Profiles updated per batch with --resolve',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        try:
+            loaded = Gazetteer.load(read_gazetteer(options['file']))
+        except (OSError, KeyError, ValueError) as exc:
+            raise CommandError(f"Could not read {options['file']}: {exc}")
+        self.stdout.write(f"Loaded {loaded} cities from {options['file']}")
+
+        resolved = 0
+        if options['resolve']:
+            resolved = self._resolve(options['batch_size'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Loaded {loaded} cities and resolved {resolved} profiles in {elapsed:.1f}s"
+            )
+        )
+
+    def _resolve(self, batch_size):
+        # 1. Resolve every profile against the freshly loaded gazetteer
+        gazetteer = Gazetteer.get()
+        changed = []
+        located = 0
+        records = Profile.objects.values_list('id', 'current_city', 'current_country', 'gazetteer_city_id')
+        for pid, city, country, current in records.iterator(chunk_size=5000):
+            city_id = gazetteer.resolve(city, country)
+            located += city_id is not None
+            if city_id != current:
+                changed.append(Profile(id=pid, gazetteer_city_id=city_id))
+        Profile.objects.bulk_update(changed, ['gazetteer_city'], batch_size=batch_size)
+        # bulk_update skips the save signals that drop stale map tiles
+        MapService.invalidate_all()
+        self.stdout.write(f"  {located} profiles located, {len(changed)} changed city")
+
+        # 2. Coordinates are denormalized into MatchFeatures
+        queryset = Profile.objects.filter(gazetteer_city__isnull=False) | Profile.objects.filter(
+            id__in=[profile.id for profile in changed]
+        )
+        written = sum(MatchFeatureService.rebuild(queryset, batch_size=batch_size))
+        self.stdout.write(f"  {written} match feature rows rebuilt")
+        return located
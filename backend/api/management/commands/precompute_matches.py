@@ -0,0 +1,168 @@
+"""
+Django management command to precompute the top-N mutual matches of every
+activated, non-deleted profile into the PrecomputedMatch table.
+Run this nightly via cron job, so recommendations are served from the
+precomputed ranking (plus any candidates changed since) even at peak time.
+
+Viewers are processed in chunks; within a chunk they are grouped into blocks
+sharing the same hard filters, and the blocks are scored by a process pool
+that reads the candidate feature arrays from shared memory. Each chunk is
+written as soon as it is done, so an interrupted run can be continued with
+--resume (viewers already written by the same --run-id are skipped).
+
+Usage:
+    python manage.py precompute_matches
+    python manage.py precompute_matches --workers 8 --top-n 50
+    python manage.py precompute_matches --run-id 20260101 --resume
+"""
+import os
+import time
+from datetime import date
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from api.models import Profile
+from api.services.candidate_index import CandidateIndex
+from api.services.match_features import MatchFeatureService
+from api.services.match_precompute import MatchPrecomputeService
+from api.services.matching_service import MIN_MATCHES, RELAXATION_LEVELS, MatchingService
+from api.services.profession_index import ProfessionIndex
+from api.services.scoring_engine import CandidatePool
+from api.services import shared_pool
+
+
+class Command(BaseCommand):
+    help = 'Precompute the top-N mutual matches of every active profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-n',
+            type=int,
+            default=50,
+            help='Number of ranked matches stored per profile',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Scoring processes (1 = score in this process)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Viewers planned, scored and written per chunk',
+        )
+        parser.add_argument(
+            '--task-size',
+            type=int,
+            default=50,
+            help='Maximum viewers per worker task',
+        )
+        parser.add_argument(
+            '--run-id',
+            default=None,
+            help="Identifier stored on every row written (default: today's date)",
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip viewers already written by this --run-id',
+        )
+
+    def handle(self, *args, **options):
+        top_n = options['top_n']
+        workers = max(options['workers'], 1)
+        chunk_size = options['chunk_size']
+        task_size = options['task_size']
+        run_id = options['run_id'] or timezone.localdate().strftime('%Y%m%d')
+        today = date.today()
+        mutual = MatchingService.mutual_filter()
+        faith_weight = MatchingService.faith_tag_weight()
+        proximity_weight = MatchingService.proximity_weight()
+
+        # 1. Snapshot the features of every live profile into one pool.
+        # computed_at is taken first so later edits are merged in at read time.
+        computed_at = timezone.now()
+        started = time.monotonic()
+        rows = MatchFeatureService.load_rows(Profile.objects.filter(is_deleted=False))
+        rows.sort(key=lambda row: row.profile_id)
+        profession_ids = {pid for row in rows for pid in row.profession_ids}
+        pool = CandidatePool(rows, ProfessionIndex.matcher_for(profession_ids))
+        rows_by_id = {row.profile_id: row for row in rows}
+        index = CandidateIndex.get(fresh=True)
+        self.stdout.write(f"Loaded {len(pool)} candidate profiles in {time.monotonic() - started:.1f}s")
+
+        viewer_ids = list(MatchPrecomputeService.viewer_queryset(
+            run_id if options['resume'] else None
+        ).values_list('id', flat=True))
+        total = len(viewer_ids)
+        self.stdout.write(
+            f"Precomputing top {top_n} matches for {total} profiles "
+            f"(run {run_id}, {workers} workers, chunk size {chunk_size})"
+        )
+        if not total:
+            self.stdout.write(self.style.SUCCESS("\n✓ Nothing to precompute"))
+            return
+
+        # 2. Share the pool's arrays with the workers
+        segments, spec = shared_pool.share_pool(pool)
+        connections.close_all()  # never inherit an open DB connection into forked workers
+        executor = Pool(workers, initializer=shared_pool.init_worker, initargs=(spec,)) if workers > 1 else None
+        if executor is None:
+            shared_pool.init_worker(spec)
+
+        written = 0
+        pairs = 0
+        try:
+            for start in range(0, total, chunk_size):
+                chunk_started = time.monotonic()
+                chunk_ids = viewer_ids[start:start + chunk_size]
+
+                # 3. Block the chunk by hard filters and split blocks into tasks
+                viewer_filters = MatchPrecomputeService.viewer_filters(chunk_ids)
+                tasks = []
+                for positions, levels, block_viewers in MatchPrecomputeService.plan_blocks(
+                    viewer_filters, index, pool.ids
+                ):
+                    for i in range(0, len(block_viewers), task_size):
+                        viewers = [rows_by_id[pid] for pid in block_viewers[i:i + task_size] if pid in rows_by_id]
+                        tasks.append((
+                            positions, levels, viewers, len(RELAXATION_LEVELS), MIN_MATCHES, top_n, today,
+                            mutual, faith_weight, proximity_weight,
+                        ))
+                        pairs += len(viewers) * len(positions)
+
+                # 4. Score, rank and write the chunk
+                if executor is not None:
+                    batches = executor.imap_unordered(shared_pool.rank_block, tasks)
+                else:
+                    batches = map(shared_pool.rank_block, tasks)
+                results = [result for batch in batches for result in batch]
+                written += MatchPrecomputeService.store(results, viewer_filters, run_id, computed_at)
+
+                elapsed = time.monotonic() - chunk_started
+                self.stdout.write(
+                    f"  {written}/{total} profiles written "
+                    f"({len(results) / max(elapsed, 1e-9):.0f} profiles/s this chunk)"
+                )
+        finally:
+            if executor is not None:
+                executor.close()
+                executor.join()
+            else:
+                shared_pool.close_worker()
+            shared_pool.release(segments, unlink=True)
+
+        # Summary
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Precomputed matches for {written} profiles in {elapsed:.1f}s "
+                f"({written / max(elapsed, 1e-9):.0f} profiles/s, "
+                f"{pairs / max(elapsed, 1e-9):,.0f} pairs/s)"
+            )
+        )
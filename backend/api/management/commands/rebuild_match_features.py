@@ -0,0 +1,45 @@
+"""
+Django management command to rebuild the denormalized MatchFeatures table.
+Run after deploying the table, after bulk imports, or whenever rows may have
+drifted from the source Profile/Preference/WorkExperience data.
+
+Usage:
+    python manage.py rebuild_match_features
+    python manage.py rebuild_match_features --batch-size 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Profile
+from api.services.match_features import MatchFeatureService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the MatchFeatures row of every profile in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of profiles computed and upserted per batch',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = Profile.objects.count()
+        self.stdout.write(f"Rebuilding match features for {total} profiles (batch size {batch_size})")
+
+        started = time.monotonic()
+        written = 0
+        for count in MatchFeatureService.rebuild(batch_size=batch_size):
+            written += count
+            self.stdout.write(f"  {written}/{total} rows written")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Rebuilt {written} match feature rows in {elapsed:.1f}s"
+            )
+        )
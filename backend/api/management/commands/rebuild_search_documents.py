@@ -0,0 +1,45 @@
+"""
+Django management command to rebuild every profile's full-text search
+document (Profile.search_document). Run after bulk imports or updates that
+bypass the Profile/WorkExperience save signals.
+
+Usage:
+    python manage.py rebuild_search_documents
+    python manage.py rebuild_search_documents --batch-size 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Profile
+from api.services.profile_search import ProfileSearchService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search document of every profile in bulk'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of profiles updated per statement',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = Profile.objects.count()
+        self.stdout.write(f"Rebuilding search documents for {total} profiles (batch size {batch_size})")
+
+        started = time.monotonic()
+        written = 0
+        for count in ProfileSearchService.rebuild(batch_size=batch_size):
+            written += count
+            self.stdout.write(f"  {written}/{total} documents written")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Rebuilt {written} search documents in {elapsed:.1f}s"
+            )
+        )
@@ -0,0 +1,134 @@
+"""
+Django management command to train the recommendation reranker: a logistic
+model of whether a member accepts an interest, fitted on past Interest
+outcomes and stored as a new RerankerModel version. Run this weekly via
+cron job; with --activate the new version reorders recommendation pages
+from then on (see RerankerService).
+
+Interests of the last --days days are labelled accepted (1) or rejected /
+unanswered for --ignored-days (0), scored with the compatibility engine
+and fitted with NumPy. Members in the --holdout percentage are kept out of
+the fit to report holdout log loss and AUC against the compatibility score
+alone.
+
+Usage:
+    python manage.py train_reranker
+    python manage.py train_reranker --activate
+    python manage.py train_reranker --days 180 --ignored-days 14 --l2 10
+    python manage.py train_reranker --activate-version 3
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import RerankerModel
+from api.services.matching_service import MatchingService
+from api.services.reranker import FEATURE_NAMES, RerankerService
+
+
+class Command(BaseCommand):
+    help = 'Train the recommendation reranker on past interest outcomes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=365,
+            help='Train on interests sent in the last N days',
+        )
+        parser.add_argument(
+            '--ignored-days',
+            type=int,
+            default=30,
+            help='Unanswered interests older than N days count as declined',
+        )
+        parser.add_argument(
+            '--l2',
+            type=float,
+            default=1.0,
+            help='L2 regularization strength',
+        )
+        parser.add_argument(
+            '--holdout',
+            type=int,
+            default=10,
+            help='Percentage of senders held out for evaluation',
+        )
+        parser.add_argument(
+            '--min-pairs',
+            type=int,
+            default=100,
+            help='Do not train on fewer labelled pairs than this',
+        )
+        parser.add_argument(
+            '--activate',
+            action='store_true',
+            help='Make the new version the active reranker',
+        )
+        parser.add_argument(
+            '--activate-version',
+            type=int,
+            default=None,
+            help='Only switch the active reranker to an existing version (0 = none)',
+        )
+
+    def handle(self, *args, **options):
+        if options['activate_version'] is not None:
+            version = options['activate_version'] or None
+            if version and not RerankerModel.objects.filter(version=version).exists():
+                raise CommandError(f"Reranker version {version} does not exist")
+            RerankerService.activate(version)
+            self.stdout.write(self.style.SUCCESS(
+                f"\n✓ Active reranker: {f'v{version}' if version else 'none'}"
+            ))
+            return
+
+        now = timezone.now()
+        started = time.monotonic()
+
+        # 1. Labelled (sender, receiver) pairs
+        senders, receivers, labels = RerankerService.training_pairs(
+            now - timedelta(days=options['days']), now - timedelta(days=options['ignored_days'])
+        )
+        if len(labels) < options['min_pairs']:
+            raise CommandError(f"Only {len(labels)} labelled interests; at least {options['min_pairs']} needed")
+        self.stdout.write(f"Loaded {len(labels)} interests ({int(labels.sum())} accepted)")
+
+        # 2. Feature matrix from the compatibility engine
+        features, keep = RerankerService.pair_features(
+            senders, receivers, faith_weight=MatchingService.faith_tag_weight(),
+            proximity_weight=MatchingService.proximity_weight(),
+        )
+        senders, labels = senders[keep], labels[keep]
+        self.stdout.write(f"Built {features.shape[0]} x {features.shape[1]} features in {time.monotonic() - started:.1f}s")
+
+        # 3. Fit on most senders, evaluate on the held-out ones
+        holdout = (senders * 2654435761) % 100 < options['holdout']
+        weights = RerankerService.fit(features[~holdout], labels[~holdout], l2=options['l2'])
+        metrics = {
+            'train': RerankerService.evaluate(features[~holdout], labels[~holdout], weights),
+            'holdout': RerankerService.evaluate(features[holdout], labels[holdout], weights),
+            'l2': options['l2'],
+            'days': options['days'],
+            'ignored_days': options['ignored_days'],
+        }
+
+        # 4. Store the next version
+        model = RerankerService.save(weights, metrics, len(labels), activate=options['activate'])
+
+        for name, weight in zip(FEATURE_NAMES, weights):
+            self.stdout.write(f"  {name:<18} {weight:+.4f}")
+        holdout_metrics = metrics['holdout']
+        self.stdout.write(
+            f"Holdout: {holdout_metrics.get('pairs', 0)} pairs, log loss {holdout_metrics.get('log_loss')}, "
+            f"AUC {holdout_metrics.get('auc')} (score alone {holdout_metrics.get('baseline_auc')})"
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✓ Trained reranker v{model.version} on {len(labels)} pairs in {elapsed:.1f}s"
+                f"{' (active)' if options['activate'] else ''}"
+            )
+        )
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-17 17:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0042_profile_onboarding_completed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchFeatures',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='match_features', serialize=False, to='api.profile')),
+                ('gender', models.CharField(blank=True, default='', help_text='Lowercased gender', max_length=10)),
+                ('birth_ordinal', models.PositiveIntegerField(default=0, help_text='date_of_birth.toordinal(), 0 if unknown')),
+                ('height_inches', models.PositiveSmallIntegerField(default=0)),
+                ('religion', models.CharField(blank=True, default='', help_text='Lowercased religion', max_length=20)),
+                ('country', models.CharField(blank=True, default='', help_text='Uppercased current country', max_length=100)),
+                ('marital_status', models.CharField(blank=True, default='', max_length=20)),
+                ('professions', models.JSONField(blank=True, default=list, help_text='Lowercased work experience titles')),
+                ('has_preference', models.BooleanField(default=False)),
+                ('pref_min_age', models.PositiveSmallIntegerField(default=0)),
+                ('pref_max_age', models.PositiveSmallIntegerField(default=0)),
+                ('pref_min_height', models.PositiveSmallIntegerField(default=0)),
+                ('pref_religion', models.CharField(blank=True, default='', max_length=20)),
+                ('pref_countries', models.JSONField(blank=True, default=list)),
+                ('pref_marital_statuses', models.JSONField(blank=True, default=list)),
+                ('pref_professions', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Match Features',
+                'verbose_name_plural': 'Match Features',
+            },
+        ),
+    ]
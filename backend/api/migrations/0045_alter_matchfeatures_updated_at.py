@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0044_alter_profile_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='matchfeatures',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
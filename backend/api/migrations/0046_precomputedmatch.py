@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0045_alter_matchfeatures_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedMatch',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='precomputed_matches', serialize=False, to='api.profile')),
+                ('candidate_ids', models.JSONField(default=list, help_text='Ranked candidate profile IDs, best first')),
+                ('scores', models.JSONField(default=list)),
+                ('reasons', models.JSONField(default=list, help_text='Match reason bitmasks (see scoring_engine.REASON_LABELS)')),
+                ('complete', models.BooleanField(default=True, help_text='False if the ranking was truncated to the top N')),
+                ('strict_count', models.PositiveIntegerField(default=0, help_text='Matches before the location filter was relaxed')),
+                ('is_fallback', models.BooleanField(default=False)),
+                ('fallback_message', models.TextField(blank=True, null=True)),
+                ('run_id', models.CharField(db_index=True, help_text='Precompute run that wrote this row (for --resume)', max_length=32)),
+                ('computed_at', models.DateTimeField(help_text='When the features this ranking was computed from were read')),
+            ],
+            options={
+                'verbose_name': 'Precomputed Match',
+                'verbose_name_plural': 'Precomputed Matches',
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+def fill_profession_ids(apps, schema_editor):
+    """Build the vocabulary from existing MatchFeatures titles and map every row to it."""
+    Profession = apps.get_model('api', 'Profession')
+    MatchFeatures = apps.get_model('api', 'MatchFeatures')
+    rows = list(MatchFeatures.objects.exclude(professions=[]))
+    names = {' '.join(title.split())[:120] for row in rows for title in row.professions}
+    Profession.objects.bulk_create([Profession(name=name) for name in names], ignore_conflicts=True)
+    ids = dict(Profession.objects.values_list('name', 'id'))
+    for row in rows:
+        row.profession_ids = [ids[' '.join(title.split())[:120]] for title in row.professions]
+    MatchFeatures.objects.bulk_update(rows, ['profession_ids'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0046_precomputedmatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Profession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Lowercased, single-spaced job title', max_length=120, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='matchfeatures',
+            name='profession_ids',
+            field=models.JSONField(blank=True, default=list, help_text='Profession vocabulary IDs of the titles'),
+        ),
+        migrations.RunPython(fill_profession_ids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0047_profession_matchfeatures_profession_ids'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='precomputedmatch',
+            name='strict_count',
+        ),
+        migrations.AddField(
+            model_name='precomputedmatch',
+            name='level_counts',
+            field=models.JSONField(blank=True, default=list, help_text='Matches available at each relaxation level'),
+        ),
+        migrations.AddField(
+            model_name='precomputedmatch',
+            name='relaxation',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Filter relaxation level used (0 = all hard filters)'),
+        ),
+    ]
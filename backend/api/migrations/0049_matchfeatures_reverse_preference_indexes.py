@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:05
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0048_remove_precomputedmatch_strict_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='precomputedmatch',
+            name='mutual',
+            field=models.BooleanField(default=False, help_text='Only candidates whose preferences accept this profile'),
+        ),
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['pref_countries'], name='matchfeat_pref_countries_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['pref_marital_statuses'], name='matchfeat_pref_statuses_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['pref_professions'], name='matchfeat_pref_profs_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=models.Index(fields=['has_preference', 'pref_min_age', 'pref_max_age'], name='matchfeat_pref_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=models.Index(fields=['pref_min_height'], name='matchfeat_pref_height_idx'),
+        ),
+    ]
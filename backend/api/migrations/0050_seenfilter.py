@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0049_matchfeatures_reverse_preference_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SeenFilter',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seen_filter', serialize=False, to='api.profile')),
+                ('bits', models.BinaryField(help_text='Filter bit array')),
+                ('num_bits', models.PositiveIntegerField()),
+                ('num_hashes', models.PositiveSmallIntegerField()),
+                ('capacity', models.PositiveIntegerField(help_text='Profiles the filter was sized for')),
+                ('fp_rate', models.FloatField(help_text='False-positive rate the filter was sized for')),
+                ('count', models.PositiveIntegerField(default=0, help_text='Profiles added (upper bound)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Seen Filter',
+                'verbose_name_plural': 'Seen Filters',
+            },
+        ),
+    ]
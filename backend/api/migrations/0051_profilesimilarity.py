@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0050_seenfilter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileSimilarity',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='similarity', serialize=False, to='api.profile')),
+                ('similar_ids', models.JSONField(default=list, help_text='Neighbour profile IDs, most similar first')),
+                ('scores', models.JSONField(default=list, help_text='Cosine co-view similarity of each neighbour')),
+                ('coviews', models.JSONField(default=list, help_text='Viewers who viewed both profiles')),
+                ('run_id', models.CharField(db_index=True, help_text='Build run that wrote this row', max_length=32)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Profile Similarity',
+                'verbose_name_plural': 'Profile Similarities',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0051_profilesimilarity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RerankerModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(unique=True)),
+                ('feature_names', models.JSONField(default=list, help_text='Feature of each weight (see reranker.FEATURE_NAMES)')),
+                ('weights', models.JSONField(default=list, help_text='Logistic weights, bias first')),
+                ('metrics', models.JSONField(blank=True, default=dict, help_text='Training and holdout metrics')),
+                ('training_pairs', models.PositiveIntegerField(default=0)),
+                ('is_active', models.BooleanField(db_index=True, default=False)),
+                ('trained_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Reranker Model',
+                'verbose_name_plural': 'Reranker Models',
+                'ordering': ['-version'],
+            },
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:30
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+def _names(tags):
+    if not isinstance(tags, list):
+        tags = [tags] if tags else []
+    names = (' '.join(tag.lower().split())[:60] for tag in tags if isinstance(tag, str))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def fill_faith_tag_ids(apps, schema_editor):
+    """Build the vocabulary from existing Profile.faith_tags and map profiles and MatchFeatures rows to it."""
+    FaithTag = apps.get_model('api', 'FaithTag')
+    Profile = apps.get_model('api', 'Profile')
+    MatchFeatures = apps.get_model('api', 'MatchFeatures')
+    tags = {pid: _names(value) for pid, value in Profile.objects.exclude(faith_tags=None).values_list('id', 'faith_tags')}
+    tags = {pid: names for pid, names in tags.items() if names}
+    FaithTag.objects.bulk_create(
+        [FaithTag(name=name) for name in {name for names in tags.values() for name in names}],
+        ignore_conflicts=True,
+    )
+    ids = dict(FaithTag.objects.values_list('name', 'id'))
+    profiles = list(Profile.objects.filter(id__in=list(tags)).only('id'))
+    for profile in profiles:
+        profile.faith_tag_ids = sorted(ids[name] for name in tags[profile.id])
+    Profile.objects.bulk_update(profiles, ['faith_tag_ids'], batch_size=1000)
+    rows = list(MatchFeatures.objects.filter(profile_id__in=list(tags)).only('profile_id'))
+    for row in rows:
+        row.faith_tag_ids = sorted(ids[name] for name in tags[row.profile_id])
+    MatchFeatures.objects.bulk_update(rows, ['faith_tag_ids'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0052_rerankermodel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaithTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Lowercased, single-spaced tag', max_length=60, unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='matchfeatures',
+            name='faith_tag_ids',
+            field=models.JSONField(blank=True, default=list, help_text='FaithTag vocabulary IDs'),
+        ),
+        migrations.AddField(
+            model_name='precomputedmatch',
+            name='faith_tag_weight',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Faith-tag similarity weight the scores were computed with'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='faith_tag_ids',
+            field=models.JSONField(blank=True, default=list, help_text='FaithTag vocabulary IDs of faith_tags (set on save)'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['faith_tag_ids'], name='profile_faith_tag_ids_gin'),
+        ),
+        migrations.RunPython(fill_faith_tag_ids, migrations.RunPython.noop),
+    ]
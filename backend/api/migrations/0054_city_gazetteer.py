@@ -0,0 +1,119 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:07
+
+import csv
+import re
+from pathlib import Path
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+GAZETTEER_FILE = Path(__file__).resolve().parent.parent / 'data' / 'cities.csv'
+
+
+def _key(name):
+    name = re.sub(r"[.'’]", '', name.split(',')[0])
+    return ' '.join(name.lower().split())
+
+
+def load_gazetteer(apps, schema_editor):
+    """Load the bundled cities, resolve existing profiles and copy coordinates into MatchFeatures."""
+    City = apps.get_model('api', 'City')
+    Profile = apps.get_model('api', 'Profile')
+    MatchFeatures = apps.get_model('api', 'MatchFeatures')
+    Preference = apps.get_model('api', 'Preference')
+
+    with open(GAZETTEER_FILE, newline='', encoding='utf-8') as handle:
+        records = list(csv.DictReader(handle))
+    City.objects.bulk_create([
+        City(
+            name=record['name'].strip(),
+            country=record['country'].strip().upper(),
+            latitude=float(record['latitude']),
+            longitude=float(record['longitude']),
+            population=int(record['population'] or 0),
+            alternate_names=[n.strip() for n in record['alternate_names'].split('|') if n.strip()],
+        )
+        for record in records
+    ], ignore_conflicts=True)
+
+    cities = {}
+    by_name = {}
+    coordinates = {}
+    for city in City.objects.order_by('-population'):
+        coordinates[city.id] = (city.latitude, city.longitude)
+        for key in {_key(name) for name in [city.name, *city.alternate_names]}:
+            cities.setdefault((city.country, key), city.id)
+            by_name.setdefault(key, city.id)
+
+    located = {}
+    profiles = []
+    for pid, city, country in Profile.objects.exclude(current_city=None).values_list('id', 'current_city', 'current_country'):
+        if country and country.strip():
+            city_id = cities.get((country.strip().upper(), _key(city)))
+        else:
+            city_id = by_name.get(_key(city))
+        if city_id is not None:
+            located[pid] = city_id
+            profiles.append(Profile(id=pid, gazetteer_city_id=city_id))
+    Profile.objects.bulk_update(profiles, ['gazetteer_city'], batch_size=1000)
+
+    nearby = set(Preference.objects.filter(location_preference='near_me').values_list('profile_id', flat=True))
+    rows = list(MatchFeatures.objects.filter(profile_id__in=list(set(located) | nearby)).only('profile_id'))
+    for row in rows:
+        row.latitude, row.longitude = coordinates[located[row.profile_id]] if row.profile_id in located else (None, None)
+        row.pref_nearby = row.profile_id in nearby
+    MatchFeatures.objects.bulk_update(rows, ['latitude', 'longitude', 'pref_nearby'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0053_faith_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchfeatures',
+            name='latitude',
+            field=models.FloatField(blank=True, help_text='Gazetteer city latitude, null if unresolved', null=True),
+        ),
+        migrations.AddField(
+            model_name='matchfeatures',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='matchfeatures',
+            name='pref_nearby',
+            field=models.BooleanField(default=False, help_text="location_preference is 'near_me'"),
+        ),
+        migrations.AddField(
+            model_name='precomputedmatch',
+            name='proximity_weight',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Distance weight the scores were computed with'),
+        ),
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('country', models.CharField(help_text='ISO-3166 alpha-2 code', max_length=2)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('population', models.PositiveIntegerField(default=0)),
+                ('alternate_names', models.JSONField(blank=True, default=list, help_text='Other spellings the city is known by')),
+            ],
+            options={
+                'verbose_name_plural': 'Cities',
+                'ordering': ['country', 'name'],
+                'constraints': [models.UniqueConstraint(fields=('country', 'name'), name='city_country_name_unique')],
+            },
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='gazetteer_city',
+            field=models.ForeignKey(blank=True, help_text='Gazetteer city of current_city/current_country (resolved on save)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='profiles', to='api.city'),
+        ),
+        migrations.RunPython(load_gazetteer, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:16
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def build_search_documents(apps, schema_editor):
+    """Fill search_document for existing profiles (as ProfileSearchService.rebuild does)."""
+    Profile = apps.get_model('api', 'Profile')
+    WorkExperience = apps.get_model('api', 'WorkExperience')
+    titles = (
+        WorkExperience.objects.filter(profile=OuterRef('pk'))
+        .order_by().values('profile')
+        .annotate(titles=StringAgg('title', ' '))
+        .values('titles')
+    )
+    document = (
+        SearchVector('name', weight='A', config='english')
+        + SearchVector('current_city', 'origin_city', weight='B', config='english')
+        + SearchVector(Subquery(titles), 'looking_for', weight='C', config='english')
+        + SearchVector('about', weight='D', config='english')
+    )
+    ids = list(Profile.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), 5000):
+        Profile.objects.filter(id__in=ids[start:start + 5000]).update(search_document=document)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0054_city_gazetteer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='profile',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, help_text='Weighted tsvector of name, cities, job titles, looking_for and about (see ProfileSearchService)', null=True),
+        ),
+        # Filled before the indexes are built
+        migrations.RunPython(build_search_documents, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='profile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='profile_search_document_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='profile_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['current_city'], name='profile_current_city_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
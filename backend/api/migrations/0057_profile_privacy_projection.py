@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:23
+
+from django.db import migrations, models
+
+from api.utils.privacy import CONTACT_FIELDS, contact_flags, image_visibility, mask_name
+
+
+def project_privacy(apps, schema_editor):
+    """Compute the stored privacy projection of existing profiles (as Profile.save does)."""
+    Profile = apps.get_model('api', 'Profile')
+    fields = ('id', 'name', 'profile_image', 'profile_image_privacy', *CONTACT_FIELDS)
+    batch = []
+    for profile in Profile.objects.only(*fields).order_by('id').iterator(chunk_size=2000):
+        profile.masked_name = mask_name(profile.name)
+        profile.contact_flags = contact_flags(profile)
+        profile.image_visibility = image_visibility(profile)
+        batch.append(profile)
+        if len(batch) == 2000:
+            Profile.objects.bulk_update(batch, ['masked_name', 'contact_flags', 'image_visibility'])
+            batch = []
+    Profile.objects.bulk_update(batch, ['masked_name', 'contact_flags', 'image_visibility'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0056_profile_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='contact_flags',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Bitmask of filled contact fields (shown as LOCKED)'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='image_visibility',
+            field=models.CharField(choices=[('none', 'No image'), ('public', 'Public'), ('matches', 'Matches Only')], default='none', editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='masked_name',
+            field=models.CharField(blank=True, editable=False, help_text='Display name before a match', max_length=100),
+        ),
+        migrations.RunPython(project_privacy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-17 19:35
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0057_profile_privacy_projection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='matchfeatures',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['profession_ids'], name='matchfeat_profession_ids_gin'),
+        ),
+    ]
@@ -1,8 +1,14 @@
-from django.db import models
+import copy
+
+from django.db import models, transaction
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from datetime import date
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+from api.utils.privacy import PROJECTION_FIELDS, PROJECTION_SOURCES, project as project_privacy
 
 # --- Enums ---
 class Religion(models.TextChoices):
@@ -36,6 +42,62 @@ class SkinComplexion(models.TextChoices):
 from api.storage import SupabaseStorage
 
 # --- Core ---
+# Profile fields deciding whether and where the profile is on the global map
+MAP_FIELDS = {'show_on_map', 'is_activated', 'is_deleted', 'gazetteer_city_id'}
+MAP_UNKNOWN = object()
+
+
+class ProfileQuerySet(models.QuerySet):
+    """
+    Bulk writes that change a privacy projection source (see api.utils.privacy)
+    refresh the stored projection as Profile.save does, and bulk writes of a
+    column the candidate index reads stamp updated_at as auto_now would.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for profile in objs:
+            project_privacy(profile)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    @staticmethod
+    def _stamps_updated_at(fields):
+        """Whether a bulk write of `fields` sets updated_at, which the in-memory indexes delta-sync by."""
+        from api.services.candidate_index import SYNCED_FIELDS
+        return 'updated_at' not in fields and not SYNCED_FIELDS.isdisjoint(fields)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if self._stamps_updated_at(fields):
+            now = timezone.now()
+            for profile in objs:
+                profile.updated_at = now
+            fields = [*fields, 'updated_at']
+        if not PROJECTION_SOURCES.isdisjoint(fields):
+            for profile in objs:
+                project_privacy(profile)
+            fields = [*fields, *(field for field in PROJECTION_FIELDS if field not in fields)]
+        # The plain queryset, so its internal update() does not project again
+        return self.model._base_manager.db_manager(self.db).bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        if self._stamps_updated_at(kwargs):
+            kwargs['updated_at'] = timezone.now()
+        if PROJECTION_SOURCES.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        # Values may be expressions, so the rows are projected as written
+        with transaction.atomic(using=self.db):
+            ids = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            profiles = list(
+                self.model._base_manager.db_manager(self.db).filter(pk__in=ids).only('pk', *PROJECTION_SOURCES)
+            )
+            for profile in profiles:
+                project_privacy(profile)
+            self.model._base_manager.db_manager(self.db).bulk_update(profiles, PROJECTION_FIELDS)
+        return rows
+
+
 class Profile(models.Model):
     PROFILE_FOR_CHOICES = [
         ('self', 'Myself'),
@@ -95,6 +157,7 @@ class Profile(models.Model):
     # Faith & lifestyle
     religion = models.CharField(max_length=20, choices=Religion.choices, blank=True, null=True)
     faith_tags = models.JSONField(default=list, blank=True, null=True, help_text="User's faith and lifestyle tags")
+    faith_tag_ids = models.JSONField(default=list, blank=True, help_text="FaithTag vocabulary IDs of faith_tags (set on save)")
 
 
 
@@ -103,6 +166,16 @@ class Profile(models.Model):
     current_country = models.CharField(max_length=100, blank=True, null=True)
     origin_city = models.CharField(max_length=100, blank=True, null=True)
     origin_country = models.CharField(max_length=100, blank=True, null=True)
+    gazetteer_city = models.ForeignKey(
+        'City', on_delete=models.SET_NULL, blank=True, null=True, related_name='profiles',
+        help_text="Gazetteer city of current_city/current_country (resolved on save)",
+    )
+
+    # Search
+    search_document = SearchVectorField(
+        blank=True, null=True, editable=False,
+        help_text="Weighted tsvector of name, cities, job titles, looking_for and about (see ProfileSearchService)",
+    )
 
     # Immigration (keep simple text now; can normalize later)
     visa_status = models.CharField(max_length=100, blank=True, null=True)
@@ -150,17 +223,32 @@ class Profile(models.Model):
     additional_images_privacy = models.CharField(max_length=20, choices=PRIVACY_CHOICES, default='matches')
     show_on_map = models.BooleanField(default=True, help_text="Show profile on the global map")
 
+    # Privacy projection shown to viewers the profile is locked for (set on save, see api.utils.privacy)
+    masked_name = models.CharField(max_length=100, blank=True, editable=False, help_text="Display name before a match")
+    contact_flags = models.PositiveSmallIntegerField(default=0, editable=False, help_text="Bitmask of filled contact fields (shown as LOCKED)")
+    image_visibility = models.CharField(
+        max_length=10, default='none', editable=False,
+        choices=[('none', 'No image'), ('public', 'Public'), ('matches', 'Matches Only')],
+    )
+
 
     # Lifecycle
     is_deleted = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # delta sync of in-memory indexes
+
+    objects = ProfileQuerySet.as_manager()
 
     class Meta:
         indexes = [
             models.Index(fields=['current_country', 'current_city']),
             models.Index(fields=['marital_status', 'religion']),
             models.Index(fields=['birth_year']),
+            GinIndex(fields=['faith_tag_ids'], name='profile_faith_tag_ids_gin'),
+            models.Index(fields=['created_at', 'id'], name='profile_created_id_idx'),
+            GinIndex(fields=['search_document'], name='profile_search_document_gin'),
+            GinIndex(fields=['name'], name='profile_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['current_city'], name='profile_current_city_trgm', opclasses=['gin_trgm_ops']),
         ]
 
     def __str__(self):
@@ -184,8 +272,52 @@ class Profile(models.Model):
 
     def save(self, *args, **kwargs):
         self.birth_year = self.date_of_birth.year if self.date_of_birth else None
+        # Derived columns are recomputed (and written) only with the columns
+        # they come from, so an unrelated update_fields save does no lookups
+        update_fields = kwargs.get('update_fields')
+        saving = None if update_fields is None else set(update_fields)
+        derived = []
+        # Tags are mapped to vocabulary IDs at write time (see FaithTagService),
+        # with no vocabulary query when they are unchanged since loading
+        if saving is None or 'faith_tags' in saving:
+            if self._state.adding or not hasattr(self, '_faith_tags') or self.faith_tags != self._faith_tags:
+                from .services.faith_tags import FaithTagService
+                self.faith_tag_ids = FaithTagService.canonical_ids(self.faith_tags)
+                derived.append('faith_tag_ids')
+        # The free-text city is resolved against the offline gazetteer (see Gazetteer)
+        if saving is None or saving & {'current_city', 'current_country'}:
+            from .services.geo_index import Gazetteer
+            self.gazetteer_city_id = Gazetteer.get().resolve(self.current_city, self.current_country)
+            derived.append('gazetteer_city')
+        # What a locked viewer sees is projected once here, not per response
+        if saving is None or saving & PROJECTION_SOURCES:
+            project_privacy(self)
+            derived.extend(PROJECTION_FIELDS)
+        if saving is not None:
+            kwargs['update_fields'] = saving.union(derived)
 
         super().save(*args, **kwargs)
+        if saving is None or 'faith_tags' in saving:
+            self._faith_tags = copy.deepcopy(self.faith_tags)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        deferred = instance.get_deferred_fields()
+        # Tags as loaded, so an unchanged save skips the vocabulary lookup
+        if 'faith_tags' not in deferred:
+            instance._faith_tags = copy.deepcopy(instance.faith_tags)
+        # Where the profile appeared on the map when loaded, to invalidate tiles on change (see MapService)
+        if not deferred & MAP_FIELDS:
+            instance._map_city = instance.map_city
+        return instance
+
+    @property
+    def map_city(self):
+        """Gazetteer city this profile is counted in on the global map, or None."""
+        if self.show_on_map and self.is_activated and not self.is_deleted:
+            return self.gazetteer_city_id
+        return None
 
 # --- Normalized child tables ---
 class Education(models.Model):
@@ -473,6 +605,265 @@ class VerificationDocument(models.Model):
         return f"Verification document for {self.profile.name} - {self.status}"
 
 
+# ==================== MATCHING MODELS ====================
+
+class Profession(models.Model):
+    """
+    Canonical job-title vocabulary. Work experience titles are mapped to these
+    IDs when a profile's MatchFeatures row is written, so profession matching
+    compares ID sets instead of substrings of joined titles.
+    """
+    name = models.CharField(max_length=120, unique=True, help_text="Lowercased, single-spaced job title")
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class FaithTag(models.Model):
+    """
+    Canonical faith/lifestyle tag vocabulary. Profile.faith_tags are mapped to
+    these IDs on save, so tag filters and similarity compare integer sets.
+    """
+    name = models.CharField(max_length=60, unique=True, help_text="Lowercased, single-spaced tag")
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class City(models.Model):
+    """
+    Offline gazetteer entry, loaded from the bundled api/data/cities.csv
+    (`manage.py load_cities`). Profile.current_city is resolved to one of
+    these on save, so distances never need a geocoding service.
+    """
+    name = models.CharField(max_length=100)
+    country = models.CharField(max_length=2, help_text="ISO-3166 alpha-2 code")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    population = models.PositiveIntegerField(default=0)
+    alternate_names = models.JSONField(default=list, blank=True, help_text="Other spellings the city is known by")
+
+    class Meta:
+        ordering = ['country', 'name']
+        verbose_name_plural = "Cities"
+        constraints = [
+            models.UniqueConstraint(fields=['country', 'name'], name='city_country_name_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.name}, {self.country}"
+
+
+class MatchFeatures(models.Model):
+    """
+    Denormalized, pre-normalized matching attributes: one compact row per profile.
+    Kept in sync from Profile/Preference/WorkExperience signals so scoring never
+    has to load the full model instances. Rebuild with `manage.py rebuild_match_features`.
+    """
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True, related_name='match_features'
+    )
+
+    # Profile attributes (normalized the way the scoring criteria compare them)
+    gender = models.CharField(max_length=10, blank=True, default='', help_text="Lowercased gender")
+    birth_ordinal = models.PositiveIntegerField(default=0, help_text="date_of_birth.toordinal(), 0 if unknown")
+    height_inches = models.PositiveSmallIntegerField(default=0)
+    religion = models.CharField(max_length=20, blank=True, default='', help_text="Lowercased religion")
+    country = models.CharField(max_length=100, blank=True, default='', help_text="Uppercased current country")
+    marital_status = models.CharField(max_length=20, blank=True, default='')
+    professions = models.JSONField(default=list, blank=True, help_text="Lowercased work experience titles")
+    profession_ids = models.JSONField(default=list, blank=True, help_text="Profession vocabulary IDs of the titles")
+    faith_tag_ids = models.JSONField(default=list, blank=True, help_text="FaithTag vocabulary IDs")
+    latitude = models.FloatField(blank=True, null=True, help_text="Gazetteer city latitude, null if unresolved")
+    longitude = models.FloatField(blank=True, null=True)
+
+    # Preference ranges and sets (0 / empty = not set)
+    has_preference = models.BooleanField(default=False)
+    pref_min_age = models.PositiveSmallIntegerField(default=0)
+    pref_max_age = models.PositiveSmallIntegerField(default=0)
+    pref_min_height = models.PositiveSmallIntegerField(default=0)
+    pref_religion = models.CharField(max_length=20, blank=True, default='')
+    pref_countries = models.JSONField(default=list, blank=True)
+    pref_marital_statuses = models.JSONField(default=list, blank=True)
+    pref_professions = models.JSONField(default=list, blank=True)
+    pref_nearby = models.BooleanField(default=False, help_text="location_preference is 'near_me'")
+
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # cached rankings merge rows changed since
+
+    class Meta:
+        verbose_name = "Match Features"
+        verbose_name_plural = "Match Features"
+        indexes = [
+            # Reverse-preference index: "whose preferences accept this profile"
+            GinIndex(fields=['pref_countries'], name='matchfeat_pref_countries_gin'),
+            GinIndex(fields=['pref_marital_statuses'], name='matchfeat_pref_statuses_gin'),
+            GinIndex(fields=['pref_professions'], name='matchfeat_pref_profs_gin'),
+            # Profession filter of the discovery list (ProfessionIndex.profile_filter)
+            GinIndex(fields=['profession_ids'], name='matchfeat_profession_ids_gin'),
+            models.Index(fields=['has_preference', 'pref_min_age', 'pref_max_age'], name='matchfeat_pref_age_idx'),
+            models.Index(fields=['pref_min_height'], name='matchfeat_pref_height_idx'),
+        ]
+
+    def __str__(self):
+        return f"Match features for profile {self.profile_id}"
+
+
+class PrecomputedMatch(models.Model):
+    """
+    Nightly top-N mutual matches for one viewer: ranked candidate IDs with
+    scores and reason bitmasks, written by `manage.py precompute_matches`.
+    get_ranked_recommendations starts from this row (patching in candidates
+    changed since computed_at) before computing a ranking from scratch.
+    """
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True, related_name='precomputed_matches'
+    )
+    candidate_ids = models.JSONField(default=list, help_text="Ranked candidate profile IDs, best first")
+    scores = models.JSONField(default=list)
+    reasons = models.JSONField(default=list, help_text="Match reason bitmasks (see scoring_engine.REASON_LABELS)")
+    complete = models.BooleanField(default=True, help_text="False if the ranking was truncated to the top N")
+    relaxation = models.PositiveSmallIntegerField(default=0, help_text="Filter relaxation level used (0 = all hard filters)")
+    level_counts = models.JSONField(default=list, blank=True, help_text="Matches available at each relaxation level")
+    mutual = models.BooleanField(default=False, help_text="Only candidates whose preferences accept this profile")
+    faith_tag_weight = models.PositiveSmallIntegerField(default=0, help_text="Faith-tag similarity weight the scores were computed with")
+    proximity_weight = models.PositiveSmallIntegerField(default=0, help_text="Distance weight the scores were computed with")
+    is_fallback = models.BooleanField(default=False)
+    fallback_message = models.TextField(blank=True, null=True)
+
+    run_id = models.CharField(max_length=32, db_index=True, help_text="Precompute run that wrote this row (for --resume)")
+    computed_at = models.DateTimeField(help_text="When the features this ranking was computed from were read")
+
+    class Meta:
+        verbose_name = "Precomputed Match"
+        verbose_name_plural = "Precomputed Matches"
+
+    def __str__(self):
+        return f"Top {len(self.candidate_ids)} matches for profile {self.profile_id}"
+
+
+class ProfileSimilarity(models.Model):
+    """
+    Top-K "viewers also viewed" neighbours of one profile, from ProfileView
+    co-occurrence (written by `manage.py build_profile_similarity`).
+    """
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True, related_name='similarity'
+    )
+    similar_ids = models.JSONField(default=list, help_text="Neighbour profile IDs, most similar first")
+    scores = models.JSONField(default=list, help_text="Cosine co-view similarity of each neighbour")
+    coviews = models.JSONField(default=list, help_text="Viewers who viewed both profiles")
+    run_id = models.CharField(max_length=32, db_index=True, help_text="Build run that wrote this row")
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Profile Similarity"
+        verbose_name_plural = "Profile Similarities"
+
+    def __str__(self):
+        return f"{len(self.similar_ids)} similar profiles for profile {self.profile_id}"
+
+
+class SeenFilter(models.Model):
+    """
+    Bloom filter of the profiles a member has already been shown, viewed or
+    exchanged interests with; recommendations skip them (see SeenFilterService).
+    """
+    profile = models.OneToOneField(
+        Profile, on_delete=models.CASCADE, primary_key=True, related_name='seen_filter'
+    )
+    bits = models.BinaryField(help_text="Filter bit array")
+    num_bits = models.PositiveIntegerField()
+    num_hashes = models.PositiveSmallIntegerField()
+    capacity = models.PositiveIntegerField(help_text="Profiles the filter was sized for")
+    fp_rate = models.FloatField(help_text="False-positive rate the filter was sized for")
+    count = models.PositiveIntegerField(default=0, help_text="Profiles added (upper bound)")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Seen Filter"
+        verbose_name_plural = "Seen Filters"
+
+    def __str__(self):
+        return f"Seen filter for profile {self.profile_id} ({self.count} profiles)"
+
+
+class RerankerModel(models.Model):
+    """
+    Versioned logistic model of interest acceptance, trained offline on past
+    Interest outcomes (`manage.py train_reranker`). The active version reorders
+    each recommendations page (see RerankerService).
+    """
+    version = models.PositiveIntegerField(unique=True)
+    feature_names = models.JSONField(default=list, help_text="Feature of each weight (see reranker.FEATURE_NAMES)")
+    weights = models.JSONField(default=list, help_text="Logistic weights, bias first")
+    metrics = models.JSONField(default=dict, blank=True, help_text="Training and holdout metrics")
+    training_pairs = models.PositiveIntegerField(default=0)
+    is_active = models.BooleanField(default=False, db_index=True)
+    trained_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-version']
+        verbose_name = "Reranker Model"
+        verbose_name_plural = "Reranker Models"
+
+    def __str__(self):
+        return f"Reranker v{self.version}{' (active)' if self.is_active else ''}"
+
+
+@receiver(post_save, sender=Profile)
+def sync_profile_on_save(sender, instance, created, raw=False, **kwargs):
+    """Queue the refresh of everything derived from the profile (run once on commit, see ProfileSyncService)."""
+    if raw:
+        return
+    from .services.profile_sync import FEATURES, SEARCH, ProfileSyncService
+    # Cities the profile left or joined on the map (see MapService)
+    previous = None if created else getattr(instance, '_map_city', MAP_UNKNOWN)
+    current = instance.map_city
+    instance._map_city = current
+    moved = previous is not MAP_UNKNOWN and previous != current
+    ProfileSyncService.schedule(
+        instance.pk, refresh=(FEATURES, SEARCH), instance=instance,
+        map_all=previous is MAP_UNKNOWN,
+        map_cities=[city for city in (previous, current) if city is not None] if moved else (),
+    )
+
+
+@receiver(post_delete, sender=Profile)
+def sync_profile_on_delete(sender, instance, **kwargs):
+    from .services.profile_sync import ProfileSyncService
+    map_city = instance.map_city
+    ProfileSyncService.schedule(instance.pk, deleted=True, map_cities=[map_city] if map_city is not None else ())
+
+
+@receiver(post_save, sender=Preference)
+@receiver(post_delete, sender=Preference)
+@receiver(post_save, sender=WorkExperience)
+@receiver(post_delete, sender=WorkExperience)
+def sync_profile_on_related_change(sender, instance, raw=False, **kwargs):
+    """Preferences feed the matching features; job titles also feed the search document."""
+    if raw:
+        return
+    from .services.profile_sync import FEATURES, SEARCH, ProfileSyncService
+    refresh = (FEATURES, SEARCH) if sender is WorkExperience else (FEATURES,)
+    ProfileSyncService.schedule(instance.profile_id, refresh=refresh)
+
+
+@receiver(post_save, sender=Interest)
+def mark_interest_seen(sender, instance, created, raw=False, **kwargs):
+    """Both sides of an interest stop recommending each other."""
+    if raw or not created:
+        return
+    from .services.seen_filter import SeenFilterService
+    SeenFilterService.add(instance.sender_id, [instance.receiver_id])
+    SeenFilterService.add(instance.receiver_id, [instance.sender_id])
+
+
 # ==================== ANALYTICS MODELS ====================
 
 class ProfileView(models.Model):
@@ -510,6 +901,15 @@ class ProfileView(models.Model):
         return f"{self.viewer.user.username} viewed {self.viewed_profile.user.username}"
 
 
+@receiver(post_save, sender=ProfileView)
+def mark_profile_view_seen(sender, instance, created, raw=False, **kwargs):
+    """A profile the member opened is no longer recommended to them."""
+    if raw or not created:
+        return
+    from .services.seen_filter import SeenFilterService
+    SeenFilterService.add(instance.viewer_id, [instance.viewed_profile_id])
+
+
 class AnalyticsSnapshot(models.Model):
     """Daily analytics snapshot for performance tracking"""
     profile = models.ForeignKey(
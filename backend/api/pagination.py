@@ -0,0 +1,145 @@
+"""
+Keyset (cursor) pagination for the profile discovery list.
+
+With ?limit= or ?cursor= the list is paged by position instead of by page
+number: the queryset is ordered by (key, id) - its relevance annotation when
+it was ranked by a search, otherwise (-created_at, -id), which the
+profile_created_id_idx index serves - and a page is the `limit` rows after
+(or, for a previous_cursor, before) the cursor row. No page runs a COUNT or
+an OFFSET. ?include_total=true adds an approximate total: the count of the
+filtered queryset, cached for APPROXIMATE_TOTAL_TTL seconds.
+
+Without either parameter the viewset keeps its page-number behaviour.
+"""
+import datetime
+import hashlib
+
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+
+
+CURSOR_SALT = 'discovery.cursor'
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Ordering of a queryset that was not ranked by a search
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+# Seconds an approximate total is reused for the same filtered queryset
+APPROXIMATE_TOTAL_TTL = 5 * 60
+
+
+def _field(term):
+    """(name, descending) of an order_by() term."""
+    return (term[1:], True) if term.startswith('-') else (term, False)
+
+
+class DiscoveryPagination(PageNumberPagination):
+    """Page-number pagination, or keyset pagination when ?limit= or ?cursor= is given."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = 'limit' in request.query_params or 'cursor' in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        # 1. Page size and position
+        try:
+            self.limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': 'Must be an integer'})
+        cursor = request.query_params.get('cursor')
+        try:
+            position = self.decode_cursor(cursor) if cursor else None
+        except (signing.BadSignature, ValueError, TypeError):
+            raise ValidationError({'cursor': 'Invalid cursor'})
+
+        # 2. Ordering: the search ranking (key, id) if there is one, else DEFAULT_ORDERING
+        ordering = tuple(queryset.query.order_by) or DEFAULT_ORDERING
+        if len(ordering) != 2 or _field(ordering[1])[0] != 'id':
+            ordering = DEFAULT_ORDERING
+        self.key = _field(ordering[0])[0]
+        queryset = queryset.order_by(*ordering)
+        self.total = self.approximate_total(queryset) if self._wants_total(request) else None
+
+        # 3. Rows after the cursor (or, going back, before it - read in reverse)
+        backwards = position is not None and position[2]
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position[0], position[1], backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.limit + 1])
+        more = len(rows) > self.limit
+        rows = rows[:self.limit]
+        if backwards:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if more or backwards:
+                self.next_cursor = self.encode_cursor(self._key_of(rows[-1]), rows[-1].pk)
+            if position is not None and (more or not backwards):
+                self.previous_cursor = self.encode_cursor(self._key_of(rows[0]), rows[0].pk, backwards=True)
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = {
+            'results': data,
+            'next_cursor': self.next_cursor,
+            'previous_cursor': self.previous_cursor,
+        }
+        if self.total is not None:
+            response['approximate_total'] = self.total
+        return Response(response)
+
+    # --- Cursors ------------------------------------------------------------
+
+    @staticmethod
+    def encode_cursor(key, profile_id, backwards=False):
+        """Opaque, signed cursor for the list position (key, profile_id)."""
+        if isinstance(key, datetime.datetime):
+            key = key.isoformat()
+        return signing.dumps([key, int(profile_id), bool(backwards)], salt=CURSOR_SALT, compress=True)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(key, profile_id, backwards) of a cursor; raises signing.BadSignature if tampered with."""
+        key, profile_id, backwards = signing.loads(cursor, salt=CURSOR_SALT)
+        return key, int(profile_id), bool(backwards)
+
+    def _key_of(self, profile):
+        return getattr(profile, self.key)
+
+    @staticmethod
+    def _after(ordering, key, profile_id, backwards):
+        """Rows ordered after (key, profile_id) - or before it, when going backwards."""
+        (key_field, key_descending), (_, id_descending) = _field(ordering[0]), _field(ordering[1])
+        key_lookup = 'lt' if key_descending != backwards else 'gt'
+        id_lookup = 'lt' if id_descending != backwards else 'gt'
+        # The redundant `key <=/>= cursor` bound lets the planner range-scan the ordering index
+        return Q(**{f'{key_field}__{key_lookup}e': key}) & (
+            Q(**{f'{key_field}__{key_lookup}': key}) | Q(**{key_field: key, f'id__{id_lookup}': profile_id})
+        )
+
+    # --- Approximate total --------------------------------------------------
+
+    @staticmethod
+    def _wants_total(request):
+        return request.query_params.get('include_total', 'false').lower() == 'true'
+
+    @staticmethod
+    def approximate_total(queryset):
+        """COUNT of the (unpaged) queryset, shared for APPROXIMATE_TOTAL_TTL between requests with the same filters."""
+        sql, params = queryset.order_by().values('id').query.sql_with_params()
+        key = 'discovery:total:' + hashlib.md5(repr((sql, params)).encode()).hexdigest()
+        total = cache.get(key)
+        if total is None:
+            total = queryset.order_by().count()
+            cache.set(key, total, APPROXIMATE_TOTAL_TTL)
+        return total
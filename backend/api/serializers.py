@@ -2,14 +2,18 @@ import json
 from datetime import date
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
 from .models import (
     Profile, AdditionalImage, Education, WorkExperience, Preference, Interest, 
     Notification, VerificationDocument, AppConfig
 )
 from subscription.models import Transaction
 from .services.matching_service import MatchingService
-
+from .services.match_features import MatchFeatureService
+from .services.profile_sync import FEATURES, SEARCH, ProfileSyncService
+from .services.pair_score_cache import PairScoreCache
+from .services.viewer_context import ViewerContext
+from .utils.privacy import display_name, image_is_public, locked_contacts
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -84,36 +88,18 @@ class NestedProfileSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         """Apply privacy logic to nested profile data"""
         representation = super().to_representation(instance)
-        request = self.context.get('request')
-        
-        # Initialize defaults
-        is_owner = False
-        has_accepted_interest = False
-        share_type = 'none'
-        
-        if request and request.user.is_authenticated:
-            try:
-                user_profile = request.user.profile
-                is_owner = (user_profile == instance)
-                
-                # Check for accepted interest between the two profiles
-                active_interest = Interest.objects.filter(
-                    (models.Q(sender=user_profile, receiver=instance) |
-                     models.Q(sender=instance, receiver=user_profile)),
-                    status='accepted'
-                ).first()
-                
-                if active_interest:
-                    has_accepted_interest = True
-                    share_type = active_interest.share_type
-            except (AttributeError, Profile.DoesNotExist):
-                pass
+        # Viewer and interests come from the request's ViewerContext (one query per page)
+        viewer = ViewerContext.of(self.context.get('request'))
+        is_owner = viewer.is_viewer(instance)
+        active_interest = viewer.accepted_interest(instance.pk)
+        has_accepted_interest = active_interest is not None
+        share_type = active_interest.share_type if active_interest else 'none'
         
         # Apply image visibility logic
         # Show profile image if: owner, OR (matched AND share_type is full), OR privacy is public
         show_profile_image = is_owner or \
                             (has_accepted_interest and share_type == 'full') or \
-                            (instance.profile_image_privacy == 'public')
+                            image_is_public(instance)
         
         if not show_profile_image:
             representation['profile_image'] = None
@@ -121,6 +107,17 @@ class NestedProfileSerializer(serializers.ModelSerializer):
         return representation
 
 
+class InterestListSerializer(serializers.ListSerializer):
+    """Loads the viewer's interests with every sender and receiver of the page in one query."""
+
+    def to_representation(self, data):
+        interests = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        ViewerContext.of(self.context.get('request')).load_interests(
+            {i.sender_id for i in interests} | {i.receiver_id for i in interests}
+        )
+        return super().to_representation(interests)
+
+
 class InterestSerializer(serializers.ModelSerializer):
     sender = NestedProfileSerializer(read_only=True)
     receiver = NestedProfileSerializer(read_only=True)
@@ -129,9 +126,69 @@ class InterestSerializer(serializers.ModelSerializer):
         model = Interest
         fields = ('id', 'sender', 'receiver',
                   'status', 'share_type', 'created_at', 'updated_at')
+        list_serializer_class = InterestListSerializer
+
+
+class CompatibilityScoreMixin:
+    """compatibility_score field of profile serializers, scored per page by their list serializer."""
+
+    def get_compatibility_score(self, obj):
+        """
+        Calculate compatibility score between authenticated user and profile.
+        Returns 0-100 score based on weighted preference matching.
+        Uses mutual compatibility (average of both directions).
+        """
+        viewer = ViewerContext.of(self.context.get('request'))
+        
+        # Validation checks
+        if viewer.profile is None or viewer.is_viewer(obj):
+            return None
+        
+        # Rows of a list were scored together by prefetch_compatibility_scores
+        scores = self.context.get('_compatibility_scores')
+        if scores is None or obj.pk not in scores:
+            scores = self.prefetch_compatibility_scores([obj])
+        result = scores.get(obj.pk)
+        
+        # Extract score from dict (new format) or return raw value (backwards compatibility)
+        if result and isinstance(result, dict):
+            return result.get('score')
+        return result
+
+    def prefetch_compatibility_scores(self, profiles):
+        """
+        Score `profiles` against the viewer through the pair-score cache (one
+        batch for all misses) and keep the results in the serializer context.
+        """
+        user_profile = ViewerContext.of(self.context.get('request')).profile
+        if user_profile is None:
+            return {}
+
+        # The viewer's feature row is loaded once and shared by every batch
+        viewer_row = self.context.get('_viewer_match_row')
+        if viewer_row is None:
+            viewer_row = MatchFeatureService.get_row(user_profile)
+            self.context['_viewer_match_row'] = viewer_row
+
+        scores = self.context.setdefault('_compatibility_scores', {})
+        scores.update(PairScoreCache.get_many(user_profile, profiles, viewer_row=viewer_row))
+        return scores
+
+
+class ProfileListSerializer(serializers.ListSerializer):
+    """
+    Scores a whole page against the viewer and loads the viewer's interests
+    with it (one query) before its rows are serialized.
+    """
 
+    def to_representation(self, data):
+        profiles = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        ViewerContext.of(self.context.get('request')).load_interests(p.pk for p in profiles)
+        self.child.prefetch_compatibility_scores(profiles)
+        return super().to_representation(profiles)
 
-class ProfileSerializer(serializers.ModelSerializer):
+
+class ProfileSerializer(CompatibilityScoreMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     compatibility_score = serializers.SerializerMethodField()
     interest = serializers.SerializerMethodField()
@@ -175,12 +232,14 @@ class ProfileSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('user', 'is_verified', 'is_activated', 'birth_year',
                             'additional_images', 'created_at', 'updated_at', 'interest', 'credits')
+        list_serializer_class = ProfileListSerializer
 
     def get_credits(self, obj):
-        try:
-            return obj.user.wallet.balance
-        except:
-            return 0
+        # Only the viewer's own balance is shown (read once per request)
+        viewer = ViewerContext.of(self.context.get('request'))
+        if not viewer.is_viewer(obj):
+            return None
+        return viewer.wallet_balance
 
     def to_internal_value(self, data):
         # Create a mutable copy of the data
@@ -264,6 +323,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         except (ValueError, TypeError):
             return []
 
+    @transaction.atomic
     def create(self, validated_data):
         education_data = validated_data.pop('education', [])
         work_experience_data = validated_data.pop('work_experience', [])
@@ -286,6 +346,7 @@ class ProfileSerializer(serializers.ModelSerializer):
 
         return profile
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         # Pop nested data before calling super().update()
         uploaded_images = validated_data.pop('uploaded_images', [])
@@ -391,6 +452,11 @@ class ProfileSerializer(serializers.ModelSerializer):
             else:
                 WorkExperience.objects.create(profile=instance, title=profession_simple, company="Not specified")
 
+        # Nested rows above are partly written with queryset.update(), which
+        # bypasses the save signals - queue the resync explicitly (merged with
+        # the signals' into one refresh when the update commits)
+        ProfileSyncService.schedule(instance.pk, refresh=(FEATURES, SEARCH))
+
         return instance
 
     def get_age(self, obj):
@@ -401,57 +467,12 @@ class ProfileSerializer(serializers.ModelSerializer):
             return date.today().year - obj.birth_year
         return None
 
-    def get_compatibility_score(self, obj):
-        """
-        Calculate compatibility score between authenticated user and profile.
-        Returns 0-100 score based on weighted preference matching.
-        Uses mutual compatibility (average of both directions).
-        """
-        request = self.context.get('request')
-        
-        # Validation checks
-        if not request or not request.user.is_authenticated:
-            return None
-        if not hasattr(request.user, 'profile'):
-            return None
-        if obj == request.user.profile:
-            return None
-        
-        user_profile = request.user.profile
-        other_profile = obj
-        
-        result = MatchingService.calculate_compatibility_score(user_profile, other_profile)
-        
-        # Extract score from dict (new format) or return raw value (backwards compatibility)
-        if result and isinstance(result, dict):
-            return result.get('score')
-        return result
-    
-
     def get_interest(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            user_profile = request.user.profile
-            interest = Interest.objects.filter(
-                (models.Q(sender=user_profile, receiver=obj) |
-                 models.Q(sender=obj, receiver=user_profile))
-            ).first()
-            if interest:
-                return InterestSerializer(interest).data
+        interest = ViewerContext.of(self.context.get('request')).first_interest(obj.pk)
+        if interest:
+            return InterestSerializer(interest).data
         return None
 
-    def _get_interest(self, requesting_user_profile, profile_owner):
-        if not requesting_user_profile or not profile_owner:
-            return None
-        return Interest.objects.filter(
-            (models.Q(sender=requesting_user_profile, receiver=profile_owner) |
-             models.Q(sender=profile_owner, receiver=requesting_user_profile)),
-            status='accepted'
-        ).first()
-
-    def _has_accepted_interest(self, requesting_user_profile, profile_owner):
-        return self._get_interest(requesting_user_profile, profile_owner) is not None
-
     def get_current_country_name(self, obj):
         from .utils.country_utils import get_country_name
         return get_country_name(obj.current_country)
@@ -470,18 +491,13 @@ class ProfileSerializer(serializers.ModelSerializer):
         has_accepted_interest = False
         share_type = 'none'
 
-        if request and request.user.is_authenticated:
-            try:
-                user_profile = request.user.profile
-                is_owner = (user_profile == instance)
-                
-                # Use the _get_interest helper which checks for 'accepted' status
-                active_interest = self._get_interest(user_profile, instance)
-                if active_interest:
-                    has_accepted_interest = True
-                    share_type = active_interest.share_type
-            except (AttributeError, Profile.DoesNotExist):
-                pass
+        # Viewer and accepted interest come from the request's ViewerContext
+        viewer = ViewerContext.of(request)
+        is_owner = viewer.is_viewer(instance)
+        active_interest = viewer.accepted_interest(instance.pk)
+        if active_interest:
+            has_accepted_interest = True
+            share_type = active_interest.share_type
             
         # Profile is "unlocked" (full bio-data/locked fields) if owner or matched
         representation['is_unlocked'] = is_owner or has_accepted_interest
@@ -491,7 +507,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         # Show profile image if: owner, OR (matched AND share_type is full), OR privacy is public
         show_profile_image = is_owner or \
                             (has_accepted_interest and share_type == 'full') or \
-                            (instance.profile_image_privacy == 'public')
+                            image_is_public(instance)
         
         # Show additional gallery images if: owner, OR (matched AND share_type is full), OR privacy is public
         show_additional_images = is_owner or \
@@ -505,40 +521,82 @@ class ProfileSerializer(serializers.ModelSerializer):
             representation['additional_images'] = []
 
         # --- Name and Contact Masking ---
+        # Masked from the row's own values; the stored projection can only add masking (api.utils.privacy)
         if not show_full_details:
-             # Handle Name Privacy (Hybrid: Common Surnames + Initial Fallback)
-            full_name = representation.get('name', '')
-            common_surnames = [
-                'Chowdhury', 'Syed', 'Khan', 'Ali', 'Zaman', 'Haque', 'Ahmed', 
-                'Hussain', 'Majumder', 'Talukdar', 'Bhuiyan', 'Rahman', 'Islam', 'Uddin',
-                'Siddique', 'Miah', 'Sheikh', 'Ghosh', 'Das', 'Roy'
-            ]
-            
-            words = full_name.split()
-            found_surname = None
-            for word in words:
-                # Clean punctuation from word
-                clean_word = "".join(filter(str.isalpha, word))
-                if clean_word.capitalize() in common_surnames:
-                    found_surname = clean_word.capitalize()
-                    break
-            
-            if found_surname:
-                representation['name'] = found_surname
-            elif words:
-                first_word = words[0]
-                representation['name'] = f"{first_word[0].upper()}. {'*' * 5}"
-            else:
-                representation['name'] = "Member"
+            representation['name'] = display_name(instance)
 
             # Mask Social Links and Phone but indicate presence
-            social_fields = ['facebook_profile', 'instagram_profile', 'linkedin_profile', 'phone']
-            for field in social_fields:
-                if representation.get(field):
-                    representation[field] = "LOCKED"
+            representation.update(locked_contacts(instance))
+
+        return representation
+
+class ProfileCardSerializer(CompatibilityScoreMixin, serializers.ModelSerializer):
+    """
+    Read-only card of a profile for list pages (discovery, recommendations):
+    no nested rows or long text. Querysets should load only CARD_FIELDS
+    (see card_queryset); privacy, compatibility and the interest state are
+    resolved for a whole page at once by ProfileListSerializer.
+    """
+    # Profile columns the card reads
+    CARD_FIELDS = (
+        'id', 'name', 'masked_name', 'date_of_birth', 'birth_year', 'gender', 'profile_image', 'profile_image_privacy',
+        'image_visibility', 'religion', 'marital_status', 'current_city', 'current_country', 'is_verified',
+        'created_at', 'updated_at',
+    )
+
+    age = serializers.SerializerMethodField()
+    current_country_name = serializers.SerializerMethodField()
+    compatibility_score = serializers.SerializerMethodField()
+    interest = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Profile
+        fields = (
+            'id', 'name', 'age', 'gender', 'profile_image', 'religion', 'marital_status',
+            'current_city', 'current_country', 'current_country_name', 'is_verified',
+            'created_at', 'updated_at', 'compatibility_score', 'interest',
+        )
+        read_only_fields = fields
+        list_serializer_class = ProfileListSerializer
 
+    @classmethod
+    def card_queryset(cls, queryset):
+        """`queryset` reduced to the card columns, without joins or prefetches."""
+        return queryset.select_related(None).prefetch_related(None).only(*cls.CARD_FIELDS)
+
+    get_age = ProfileSerializer.get_age
+    get_current_country_name = ProfileSerializer.get_current_country_name
+
+    def get_interest(self, obj):
+        viewer = ViewerContext.of(self.context.get('request'))
+        interest = viewer.first_interest(obj.pk)
+        if interest is None:
+            return None
+        return {
+            'id': interest.id,
+            'status': interest.status,
+            'share_type': interest.share_type,
+            'sent_by_me': interest.sender_id == viewer.profile.pk,
+        }
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        viewer = ViewerContext.of(self.context.get('request'))
+        is_owner = viewer.is_viewer(instance)
+        accepted = viewer.accepted_interest(instance.pk)
+
+        # Same rules as ProfileSerializer: unlocked if owner or matched
+        representation['is_unlocked'] = is_owner or accepted is not None
+        show_profile_image = is_owner or \
+                            (accepted is not None and accepted.share_type == 'full') or \
+                            image_is_public(instance)
+        if not show_profile_image:
+            representation['profile_image'] = None
+        if not representation['is_unlocked']:
+            representation['name'] = display_name(instance)
         return representation
 
+
 class NotificationSerializer(serializers.ModelSerializer):
     """
     Serializer for the Notification model.
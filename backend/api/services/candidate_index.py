@@ -0,0 +1,314 @@
+"""
+Per-worker inverted index over the hard-filter attributes of profiles.
+
+Each attribute value maps to a sorted NumPy array of profile IDs, so the
+candidate set for a set of hard filters is computed with sorted-array
+intersections/differences in memory instead of an ORM query per request.
+
+The index is kept fresh from Profile save/delete signals in this worker and
+by a periodic delta sync (profiles whose updated_at moved) for changes made
+by other workers; a periodic full rebuild catches hard deletes elsewhere.
+QuerySet.update and bulk_update skip the signals and auto_now, so the Profile
+queryset stamps updated_at itself when they write one of SYNCED_FIELDS: such
+writes reach every worker, this one included, with the next delta sync. Raw
+SQL that does not set updated_at is only seen by the next full rebuild.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Profile
+
+
+# Case-insensitive fields whose raw spellings are remembered (see variants())
+CASE_INSENSITIVE_FIELDS = ('gender', 'religion')
+
+# Seconds between delta syncs / full rebuilds of a worker's index
+SYNC_INTERVAL_SECONDS = 30
+REBUILD_INTERVAL_SECONDS = 15 * 60
+
+# Indexed attribute -> how its values are normalized into keys.
+# gender/religion are filtered case-insensitively (iexact), country and
+# marital status exactly, mirroring the ORM hard filters they replace.
+INDEXED_FIELDS = {
+    'gender': str.lower,
+    'religion': str.lower,
+    'current_country': str,
+    'marital_status': str,
+}
+
+# Profile columns the index reads (bulk writes of them stamp updated_at, see ProfileQuerySet)
+SYNCED_FIELDS = frozenset({*INDEXED_FIELDS, 'is_activated', 'is_deleted'})
+
+EMPTY = np.zeros(0, dtype=np.int64)
+
+
+def intersect(a, b):
+    """Intersection of two sorted unique ID arrays (probes the smaller into the larger)."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return EMPTY
+    pos = np.searchsorted(b, a)
+    hit = pos < len(b)
+    hit[hit] = b[pos[hit]] == a[hit]
+    return a[hit]
+
+
+def difference(a, b):
+    """Elements of sorted array a that are not in sorted array b."""
+    if not len(a) or not len(b):
+        return a
+    pos = np.searchsorted(b, a)
+    inside = pos < len(b)
+    inside[inside] = b[pos[inside]] == a[inside]
+    return a[~inside]
+
+
+def union(arrays):
+    arrays = [a for a in arrays if len(a)]
+    if not arrays:
+        return EMPTY
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
+
+
+def _sorted_unique(values):
+    """values as a sorted unique int64 array (skipping the sort if it already is one)."""
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) > 1 and not (values[1:] > values[:-1]).all():
+        values = np.unique(values)
+    return values
+
+
+def _insert(arr, pid):
+    i = np.searchsorted(arr, pid)
+    if i < len(arr) and arr[i] == pid:
+        return arr
+    return np.insert(arr, i, pid)
+
+
+def _remove(arr, pid):
+    i = np.searchsorted(arr, pid)
+    if i < len(arr) and arr[i] == pid:
+        return np.delete(arr, i)
+    return arr
+
+
+class CandidateIndex:
+    """Inverted index of profile IDs by hard-filter attribute value."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.postings = {field: {} for field in INDEXED_FIELDS}
+        self.spellings = {field: {} for field in CASE_INSENSITIVE_FIELDS}
+        self.live = EMPTY        # not soft-deleted
+        self.activated = EMPTY   # paid activation fee
+        self.synced_at = None
+        self._synced_monotonic = 0.0
+        self._built_monotonic = 0.0
+
+    # --- Access -------------------------------------------------------------
+
+    @classmethod
+    def get(cls, fresh=False):
+        """
+        This worker's index, built on first use and synced when stale.
+        fresh=True forces a delta sync, for callers that must see changes
+        other workers made within the last sync interval.
+        """
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.rebuild()
+            elif fresh:
+                cls._instance.sync()
+            else:
+                cls._instance._sync_if_stale()
+            return cls._instance
+
+    @classmethod
+    def notify_saved(cls, profile):
+        """Apply a profile change to this worker's index (if it was built)."""
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.update(profile.pk, cls._attributes_of(profile))
+
+    @classmethod
+    def notify_deleted(cls, profile_id):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.remove(profile_id)
+
+    # --- Maintenance --------------------------------------------------------
+
+    @staticmethod
+    def _attributes_of(profile):
+        values = {field: getattr(profile, field) for field in INDEXED_FIELDS}
+        values['is_activated'] = profile.is_activated
+        values['is_deleted'] = profile.is_deleted
+        return values
+
+    def rebuild(self):
+        """Load every profile's indexed attributes in one query."""
+        started_at = timezone.now()
+        fields = tuple(INDEXED_FIELDS) + ('is_activated', 'is_deleted')
+        self.spellings = {field: {} for field in CASE_INSENSITIVE_FIELDS}
+        records = Profile.objects.order_by('id').values_list('id', *fields)
+
+        grouped = {field: {} for field in INDEXED_FIELDS}
+        live, activated = [], []
+        for pid, *values in records:
+            for (field, normalize), value in zip(INDEXED_FIELDS.items(), values):
+                if value is not None:
+                    grouped[field].setdefault(normalize(value), []).append(pid)
+                    if field in self.spellings:
+                        self.spellings[field].setdefault(normalize(value), set()).add(value)
+            is_activated, is_deleted = values[-2:]
+            if not is_deleted:
+                live.append(pid)
+            if is_activated:
+                activated.append(pid)
+
+        # IDs arrive in ascending order, so every posting list is already sorted
+        self.postings = {
+            field: {key: np.array(ids, dtype=np.int64) for key, ids in keys.items()}
+            for field, keys in grouped.items()
+        }
+        self.live = np.array(live, dtype=np.int64)
+        self.activated = np.array(activated, dtype=np.int64)
+        self.synced_at = started_at
+        self._synced_monotonic = self._built_monotonic = time.monotonic()
+
+    def _sync_if_stale(self):
+        now = time.monotonic()
+        if now - self._built_monotonic > REBUILD_INTERVAL_SECONDS:
+            self.rebuild()
+        elif now - self._synced_monotonic > SYNC_INTERVAL_SECONDS:
+            self.sync()
+
+    def sync(self):
+        """Apply profiles changed (by any worker) since the last sync."""
+        started_at = timezone.now()
+        # Small overlap so saves racing with the previous sync are not missed
+        since = self.synced_at - timedelta(seconds=1)
+        fields = tuple(INDEXED_FIELDS) + ('is_activated', 'is_deleted')
+        for pid, *values in Profile.objects.filter(updated_at__gte=since).values_list('id', *fields):
+            self.update(pid, dict(zip(fields, values)))
+        self.synced_at = started_at
+        self._synced_monotonic = time.monotonic()
+
+    def update(self, profile_id, attributes):
+        """Move a profile to the posting lists matching its current attributes."""
+        for field, normalize in INDEXED_FIELDS.items():
+            value = attributes.get(field)
+            new_key = normalize(value) if value is not None else None
+            keys = self.postings[field]
+            for key in list(keys):
+                if key != new_key:
+                    keys[key] = _remove(keys[key], profile_id)
+            if new_key is not None:
+                keys[new_key] = _insert(keys.get(new_key, EMPTY), profile_id)
+                if field in self.spellings:
+                    self.spellings[field].setdefault(new_key, set()).add(value)
+
+        if attributes.get('is_deleted'):
+            self.live = _remove(self.live, profile_id)
+        else:
+            self.live = _insert(self.live, profile_id)
+        if attributes.get('is_activated'):
+            self.activated = _insert(self.activated, profile_id)
+        else:
+            self.activated = _remove(self.activated, profile_id)
+
+    def remove(self, profile_id):
+        for keys in self.postings.values():
+            for key in list(keys):
+                keys[key] = _remove(keys[key], profile_id)
+        self.live = _remove(self.live, profile_id)
+        self.activated = _remove(self.activated, profile_id)
+
+    # --- Queries ------------------------------------------------------------
+
+    def ids_for(self, field, values):
+        """Sorted IDs whose `field` equals any of `values` (normalized like the index)."""
+        normalize = INDEXED_FIELDS[field]
+        keys = self.postings[field]
+        return union([keys.get(normalize(v), EMPTY) for v in values if v is not None])
+
+    def _postings_of(self, field, values):
+        normalize = INDEXED_FIELDS[field]
+        keys = self.postings[field]
+        return [keys[key] for key in {normalize(v) for v in values if v is not None} if key in keys]
+
+    def _restrict(self, result, field, values):
+        """
+        IDs of `result` whose `field` equals any of `values`. A profile has one
+        value per field, so the per-value intersections are disjoint and only
+        as large as `result` (no union of whole posting lists).
+        """
+        parts = [intersect(result, posting) for posting in self._postings_of(field, values)]
+        parts = [part for part in parts if len(part)]
+        if len(parts) <= 1:
+            return parts[0] if parts else EMPTY
+        return np.sort(np.concatenate(parts))
+
+    def iexact_q(self, field, value):
+        """
+        Q equivalent to `{field}__iexact=value` for a case-insensitive field: an
+        exact (index-friendly) IN over the stored spellings, e.g. 'female' ->
+        ['Female', 'female'], or the iexact lookup itself for a value the index
+        has never seen.
+        """
+        spellings = self.spellings[field].get(value.lower())
+        if not spellings:
+            return Q(**{f'{field}__iexact': value})
+        return Q(**{f'{field}__in': sorted(spellings)})
+
+    def select(self, gender=None, religion=None, countries=None, exclude_countries=None,
+               marital_statuses=None, activated_only=False, exclude_ids=(), within=None):
+        """
+        Candidate IDs (sorted) of live profiles passing the given hard filters.
+        `None` means "no filter" for every argument; `within` restricts the
+        result to a given set of IDs.
+        """
+        result = self.activated if activated_only else self.live
+        if within is not None:
+            # First, so every later intersection probes the (small) subset
+            result = intersect(_sorted_unique(within), result)
+        if activated_only:
+            result = intersect(result, self.live)
+        if gender:
+            result = self._restrict(result, 'gender', [gender])
+        if religion:
+            result = self._restrict(result, 'religion', [religion])
+        if countries is not None:
+            result = self._restrict(result, 'current_country', countries)
+        if exclude_countries:
+            for posting in self._postings_of('current_country', exclude_countries):
+                result = difference(result, posting)
+        if marital_statuses is not None:
+            result = self._restrict(result, 'marital_status', marital_statuses)
+        if len(exclude_ids):
+            result = difference(result, np.unique(np.asarray(exclude_ids, dtype=np.int64)))
+        return result
+
+    def select_levels(self, level_filters):
+        """
+        Candidates passing the loosest of a list of progressively relaxed
+        filter sets (strictest first), with the index of the strictest set each
+        one passes. Returns (sorted ids, levels), computed from the index alone.
+        """
+        ids = self.select(**level_filters[-1])
+        levels = np.full(len(ids), len(level_filters) - 1, dtype=np.int8)
+        for level in range(len(level_filters) - 2, -1, -1):
+            passing = self.select(within=ids, **level_filters[level])
+            levels[np.isin(ids, passing)] = level
+        return ids, levels
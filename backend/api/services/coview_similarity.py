@@ -0,0 +1,122 @@
+"""
+Item-to-item "viewers also viewed" similarity from ProfileView co-occurrence
+(`manage.py build_profile_similarity`).
+
+The recent views form a sparse binary viewer x profile matrix V. For a block
+of profiles, V[:, block].T @ V counts the viewers each of them shares with
+every other profile; dividing by sqrt(views_i * views_j) gives the cosine
+similarity. Only the top-K neighbours of each profile are kept, in a
+ProfileSimilarity row that is read back with one primary-key lookup.
+"""
+import numpy as np
+from scipy import sparse
+
+from ..models import Profile, ProfileView, ProfileSimilarity
+
+
+# Profiles whose co-view rows are multiplied out at a time
+SIMILARITY_BLOCK_SIZE = 2000
+
+
+class CoViewSimilarityService:
+
+    @staticmethod
+    def view_matrix(since):
+        """
+        (V, profile_ids): the binary viewer x profile CSC matrix of views since
+        `since` (repeat views count once) and the profile ID of each column.
+        """
+        pairs = np.array(
+            list(ProfileView.objects.filter(viewed_at__gte=since)
+                 .values_list('viewer_id', 'viewed_profile_id').iterator(chunk_size=20000)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        viewer_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        profile_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+
+        matrix = sparse.csc_matrix(
+            (np.ones(len(pairs), dtype=np.float32), (rows, cols)),
+            shape=(len(viewer_ids), len(profile_ids)),
+        )
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix, profile_ids
+
+    @staticmethod
+    def top_similar(matrix, profile_ids, top_k, min_coviews=2, block_size=SIMILARITY_BLOCK_SIZE):
+        """
+        Yield (profile_id, neighbour_ids, scores, coviews) per profile with at
+        least one neighbour sharing `min_coviews` viewers, best first.
+        """
+        views = np.asarray(matrix.sum(axis=0)).ravel()
+        transposed = matrix.T.tocsr()
+
+        for start in range(0, len(profile_ids), block_size):
+            # 1. Shared viewers of this block's profiles with every profile
+            counts = (transposed[start:start + block_size] @ matrix).tocsr()
+
+            for offset in range(counts.shape[0]):
+                i = start + offset
+                lo, hi = counts.indptr[offset], counts.indptr[offset + 1]
+                cols, shared = counts.indices[lo:hi], counts.data[lo:hi]
+
+                # 2. Drop the profile itself and pairs with too few shared viewers
+                keep = (cols != i) & (shared >= min_coviews)
+                cols, shared = cols[keep], shared[keep]
+                if not len(cols):
+                    continue
+
+                # 3. Cosine similarity; keep the top K (ties by profile ID)
+                scores = shared.astype(np.float64) / np.sqrt(views[i] * views[cols].astype(np.float64))
+                order = np.lexsort((profile_ids[cols], -scores))[:top_k]
+                yield (
+                    int(profile_ids[i]),
+                    profile_ids[cols[order]].tolist(),
+                    np.round(scores[order], 4).tolist(),
+                    shared[order].astype(np.int64).tolist(),
+                )
+
+    @staticmethod
+    def store(rows, run_id, computed_at):
+        """Upsert (profile_id, neighbour_ids, scores, coviews) rows as ProfileSimilarity."""
+        objects = [
+            ProfileSimilarity(
+                profile_id=profile_id, similar_ids=neighbour_ids, scores=scores,
+                coviews=coviews, run_id=run_id, computed_at=computed_at,
+            )
+            for profile_id, neighbour_ids, scores, coviews in rows
+        ]
+        ProfileSimilarity.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['profile'],
+            update_fields=['similar_ids', 'scores', 'coviews', 'run_id', 'computed_at'],
+        )
+        return len(objects)
+
+    @staticmethod
+    def neighbours(profile_ids):
+        """
+        {profile_id: [(neighbour_id, score), ...]} for several profiles in one
+        query, e.g. to blend the neighbours of recently viewed profiles into
+        recommendations.
+        """
+        rows = ProfileSimilarity.objects.filter(profile_id__in=profile_ids).values_list(
+            'profile_id', 'similar_ids', 'scores'
+        )
+        return {pid: list(zip(ids, scores)) for pid, ids, scores in rows}
+
+    @staticmethod
+    def similar_profiles(profile_id, limit=10, exclude_ids=()):
+        """
+        [(Profile, score)] of the activated, non-deleted neighbours of one
+        profile, most similar first.
+        """
+        neighbours = [
+            (pid, score) for pid, score in CoViewSimilarityService.neighbours([profile_id]).get(profile_id, [])
+            if pid not in exclude_ids
+        ]
+        profiles = Profile.objects.filter(is_activated=True, is_deleted=False).select_related('user').prefetch_related(
+            'work_experience', 'education', 'additional_images', 'preference'
+        ).in_bulk([pid for pid, _ in neighbours])
+        return [(profiles[pid], score) for pid, score in neighbours if pid in profiles][:limit]
@@ -0,0 +1,233 @@
+"""
+Per-worker content-based embedding index for "more like this profile".
+
+Every profile is embedded from its attributes: one-hot religion, marital
+status, lifestyle priority and family type, hashed one-hot country and
+multi-hot faith tags, plus age and height scaled to [0, 1]. Vectors are
+L2-normalized float32 rows of one NumPy matrix, so the cosine similarity of
+a profile against everyone is a single matrix-vector product; with well
+under a hundred dimensions a brute-force scan beats a tree index.
+
+Like CandidateIndex, the matrix is built on first use, kept fresh from
+Profile save/delete signals in this worker, delta-synced by updated_at for
+other workers' changes and fully rebuilt (compacted) periodically.
+"""
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from ..models import Profile, Religion
+
+
+SYNC_INTERVAL_SECONDS = 30
+REBUILD_INTERVAL_SECONDS = 15 * 60
+
+# Best-scoring rows checked against the caller's filters before widening
+NEAREST_MIN_WIDTH = 256
+
+# Fixed vocabularies become one-hot blocks; open ones are hashed into buckets
+ONE_HOT_FIELDS = {
+    'religion': [value for value, _ in Religion.choices],
+    'marital_status': [value for value, _ in Profile.MARITAL_STATUS_CHOICES],
+    'lifestyle_priority': [value for value, _ in Profile.LIFESTYLE_CHOICES],
+    'family_type': [value for value, _ in Profile.FAMILY_TYPE_CHOICES],
+}
+COUNTRY_BUCKETS = 32
+FAITH_TAG_BUCKETS = 64
+
+# Ranges scaled to [0, 1]
+AGE_RANGE = (18, 60)
+HEIGHT_RANGE = (54, 84)
+
+EMBEDDED_FIELDS = tuple(ONE_HOT_FIELDS) + ('current_country', 'faith_tags', 'birth_year', 'height_inches')
+
+_offsets = {}
+_dim = 0
+for _field, _values in ONE_HOT_FIELDS.items():
+    _offsets[_field] = _dim
+    _dim += len(_values)
+_offsets['current_country'] = _dim
+_dim += COUNTRY_BUCKETS
+_offsets['faith_tags'] = _dim
+_dim += FAITH_TAG_BUCKETS
+_offsets['age'] = _dim
+_offsets['height'] = _dim + 1
+EMBEDDING_DIM = _dim + 2
+
+
+def _bucket(value, buckets):
+    """Stable (process-independent) hash bucket of a string."""
+    return zlib.crc32(str(value).strip().lower().encode()) % buckets
+
+
+def _scaled(value, bounds):
+    low, high = bounds
+    return min(max((value - low) / (high - low), 0.0), 1.0)
+
+
+def embed(attributes, today=None):
+    """L2-normalized float32 embedding of a dict of EMBEDDED_FIELDS values (all zeros if nothing is known)."""
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for field, values in ONE_HOT_FIELDS.items():
+        value = attributes.get(field)
+        if value:
+            value = value.lower()
+            if value in values:
+                vector[_offsets[field] + values.index(value)] = 1.0
+
+    country = attributes.get('current_country')
+    if country:
+        vector[_offsets['current_country'] + _bucket(country, COUNTRY_BUCKETS)] = 1.0
+
+    tags = [tag for tag in (attributes.get('faith_tags') or []) if isinstance(tag, str) and tag.strip()]
+    if tags:
+        buckets = {_bucket(tag, FAITH_TAG_BUCKETS) for tag in tags}
+        for bucket in buckets:
+            vector[_offsets['faith_tags'] + bucket] = 1.0 / np.sqrt(len(buckets))
+
+    birth_year = attributes.get('birth_year')
+    if birth_year:
+        vector[_offsets['age']] = _scaled((today or date.today()).year - birth_year, AGE_RANGE)
+    height = attributes.get('height_inches')
+    if height:
+        vector[_offsets['height']] = _scaled(height, HEIGHT_RANGE)
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class EmbeddingIndex:
+    """Matrix of profile embeddings with a row per profile."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.vectors = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.ids = np.zeros(0, dtype=np.int64)    # profile ID of each row (-1 = removed)
+        self.size = 0                              # rows in use; the arrays grow by doubling
+        self.rows = {}                             # profile ID -> row
+        self.synced_at = None
+        self._synced_monotonic = 0.0
+        self._built_monotonic = 0.0
+
+    # --- Access -------------------------------------------------------------
+
+    @classmethod
+    def get(cls, fresh=False):
+        """This worker's index, built on first use and synced when stale."""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.rebuild()
+            elif fresh:
+                cls._instance.sync()
+            else:
+                cls._instance._sync_if_stale()
+            return cls._instance
+
+    @classmethod
+    def notify_saved(cls, profile):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.update(profile.pk, {field: getattr(profile, field) for field in EMBEDDED_FIELDS})
+
+    @classmethod
+    def notify_deleted(cls, profile_id):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.remove(profile_id)
+
+    # --- Maintenance --------------------------------------------------------
+
+    def rebuild(self):
+        """Embed every profile from one query."""
+        started_at = timezone.now()
+        records = list(Profile.objects.order_by('id').values_list('id', *EMBEDDED_FIELDS))
+        today = date.today()
+        self.ids = np.array([record[0] for record in records], dtype=np.int64)
+        self.vectors = np.zeros((len(records), EMBEDDING_DIM), dtype=np.float32)
+        for row, (_, *values) in enumerate(records):
+            self.vectors[row] = embed(dict(zip(EMBEDDED_FIELDS, values)), today)
+        self.size = len(records)
+        self.rows = {int(pid): row for row, pid in enumerate(self.ids)}
+        self.synced_at = started_at
+        self._synced_monotonic = self._built_monotonic = time.monotonic()
+
+    def _sync_if_stale(self):
+        now = time.monotonic()
+        if now - self._built_monotonic > REBUILD_INTERVAL_SECONDS:
+            self.rebuild()
+        elif now - self._synced_monotonic > SYNC_INTERVAL_SECONDS:
+            self.sync()
+
+    def sync(self):
+        """Re-embed profiles changed (by any worker) since the last sync."""
+        started_at = timezone.now()
+        since = self.synced_at - timedelta(seconds=1)
+        for pid, *values in Profile.objects.filter(updated_at__gte=since).values_list('id', *EMBEDDED_FIELDS):
+            self.update(pid, dict(zip(EMBEDDED_FIELDS, values)))
+        self.synced_at = started_at
+        self._synced_monotonic = time.monotonic()
+
+    def update(self, profile_id, attributes):
+        """Overwrite the profile's row, appending one for a new profile."""
+        row = self.rows.get(profile_id)
+        if row is None:
+            if self.size == len(self.ids):
+                capacity = max(2 * len(self.ids), 16)
+                self.vectors = np.resize(self.vectors, (capacity, EMBEDDING_DIM))
+                self.ids = np.concatenate([self.ids, np.full(capacity - len(self.ids), -1, dtype=np.int64)])
+            row = self.size
+            self.size += 1
+            self.rows[profile_id] = row
+            self.ids[row] = profile_id
+        self.vectors[row] = embed(attributes)
+
+    def remove(self, profile_id):
+        row = self.rows.pop(profile_id, None)
+        if row is not None:
+            self.vectors[row] = 0
+            self.ids[row] = -1
+
+    # --- Queries ------------------------------------------------------------
+
+    def vector(self, profile_id):
+        row = self.rows.get(profile_id)
+        return None if row is None else self.vectors[row]
+
+    def nearest(self, vector, k, allowed=None):
+        """
+        (ids, similarities) of the `k` profiles most cosine-similar to
+        `vector`, best first; ties go to the lower ID. `allowed` filters a
+        sorted ID array down to the acceptable profiles (e.g. hard filters);
+        it is applied to the best-scoring rows first, widening only while
+        fewer than `k` of them pass.
+        """
+        similarities = self.vectors[:self.size] @ vector
+        width = max(8 * k, NEAREST_MIN_WIDTH)
+        while True:
+            if width < self.size:
+                # Rows tied with the cut-off are kept so ties break by ID
+                cutoff = np.partition(similarities, self.size - width)[self.size - width]
+                rows = np.flatnonzero(similarities >= cutoff)
+            else:
+                rows = np.arange(self.size)
+
+            ids = self.ids[rows]
+            order = np.argsort(ids)
+            ids, rows = ids[order], rows[order]
+            removed = np.searchsorted(ids, 0)  # removed rows have ID -1
+            ids, rows = ids[removed:], rows[removed:]
+            if allowed is not None:
+                passing = np.isin(ids, allowed(ids), assume_unique=True)
+                ids, rows = ids[passing], rows[passing]
+
+            if len(ids) >= k or width >= self.size:
+                best = np.lexsort((ids, -similarities[rows]))[:k]
+                return ids[best], similarities[rows[best]]
+            width *= 8
@@ -0,0 +1,86 @@
+"""
+Faith/lifestyle tag vocabulary.
+
+Profile.faith_tags is free-form text; on save every tag is normalized and
+mapped to a FaithTag ID (creating vocabulary rows for new tags), and the IDs
+are stored in the GIN-indexed Profile.faith_tag_ids and in MatchFeatures.
+Tag filters then test integer containment instead of scanning JSON text,
+and similarity is the Jaccard index of tag bitsets (see scoring_engine).
+"""
+import numpy as np
+from django.db.models import Q
+
+from ..models import FaithTag
+from .scoring_engine import tag_bitsets, tag_similarity_points
+
+
+def normalize_faith_tag(tag):
+    """Canonical vocabulary form of a tag: lowercased, single-spaced."""
+    return ' '.join(tag.lower().split())[:60]
+
+
+def _names(tags):
+    """Distinct normalized names of a tag list (non-strings and blanks dropped), in order."""
+    if not isinstance(tags, list):
+        tags = [tags] if tags else []
+    names = (normalize_faith_tag(tag) for tag in tags if isinstance(tag, str))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+class FaithTagService:
+
+    @staticmethod
+    def canonical_ids(tags):
+        """
+        Sorted FaithTag IDs of a faith_tags value, creating vocabulary rows
+        for tags not seen before.
+        """
+        names = _names(tags)
+        if not names:
+            return []
+        known = dict(FaithTag.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = set(names) - set(known)
+        if missing:
+            FaithTag.objects.bulk_create([FaithTag(name=name) for name in missing], ignore_conflicts=True)
+            known.update(FaithTag.objects.filter(name__in=missing).values_list('name', 'id'))
+        return sorted(known[name] for name in names)
+
+    @staticmethod
+    def lookup(tags):
+        """(known IDs, all known): IDs of existing vocabulary tags, without creating any."""
+        names = _names(tags)
+        ids = sorted(FaithTag.objects.filter(name__in=names).values_list('id', flat=True))
+        return ids, len(ids) == len(names)
+
+    @staticmethod
+    def filter_profiles(queryset, tags, min_similarity=None):
+        """
+        Narrow a Profile queryset by tags. Without `min_similarity`, profiles
+        having every tag (one GIN containment test); otherwise profiles whose
+        tag set has a Jaccard similarity of at least `min_similarity` (0-1)
+        with the requested tags - those sharing any tag are fetched through
+        the index and their similarity computed with bitset popcounts.
+        """
+        tag_ids, all_known = FaithTagService.lookup(tags)
+        if min_similarity is None:
+            if not all_known or not tag_ids:
+                return queryset.none()
+            return queryset.filter(faith_tag_ids__contains=tag_ids)
+        if not tag_ids:
+            return queryset.none()
+        threshold = int(np.ceil(min(max(min_similarity, 0.0), 1.0) * 100))
+
+        any_tag = Q()
+        for tag_id in tag_ids:
+            any_tag |= Q(faith_tag_ids__contains=[tag_id])
+        ids, tag_lists = [], []
+        for pid, profile_tags in queryset.filter(any_tag).values_list('id', 'faith_tag_ids'):
+            ids.append(pid)
+            tag_lists.append(profile_tags or [])
+        if not ids:
+            return queryset.none()
+
+        bits, counts = tag_bitsets(tag_lists + [tag_ids])
+        points = tag_similarity_points(bits[-1], counts[-1], bits[:-1], counts[:-1])
+        passing = np.asarray(ids)[points >= threshold]
+        return queryset.filter(id__in=passing.tolist())
@@ -0,0 +1,184 @@
+"""
+Offline city gazetteer and spatial index.
+
+Cities come from the bundled api/data/cities.csv, loaded into the City table
+by `manage.py load_cities`; Profile.current_city is resolved to a City on
+save, so no geocoding service is ever called at request time. Each worker
+keeps the (small) table in memory: a name lookup for resolution, and a grid
+of GRID_DEGREES cells over the coordinates for radius queries, whose
+candidate cells are checked with a vectorized haversine distance.
+"""
+import csv
+import re
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from ..models import City
+from .scoring_engine import EARTH_RADIUS_KM, haversine_km
+
+
+GAZETTEER_FILE = Path(__file__).resolve().parent.parent / 'data' / 'cities.csv'
+
+# Seconds a worker keeps the gazetteer before re-reading the City table
+RELOAD_INTERVAL_SECONDS = 15 * 60
+
+# Side of a spatial grid cell, in degrees of latitude and longitude
+GRID_DEGREES = 1.0
+
+# Largest radius a "near me" query is answered for (about a country's span)
+MAX_RADIUS_KM = 2000.0
+
+_PUNCTUATION_RE = re.compile(r"[.'’]")
+
+
+def normalize_city(name):
+    """Lookup form of a city name: before any comma, without periods/apostrophes, lowercased, single-spaced."""
+    name = _PUNCTUATION_RE.sub('', name.split(',')[0])
+    return ' '.join(name.lower().split())
+
+
+def read_gazetteer(path=GAZETTEER_FILE):
+    """City field dicts of a gazetteer CSV (name, country, latitude, longitude, population, alternate_names)."""
+    with open(path, newline='', encoding='utf-8') as handle:
+        for record in csv.DictReader(handle):
+            yield {
+                'name': record['name'].strip(),
+                'country': record['country'].strip().upper(),
+                'latitude': float(record['latitude']),
+                'longitude': float(record['longitude']),
+                'population': int(record['population'] or 0),
+                'alternate_names': [n.strip() for n in (record['alternate_names'] or '').split('|') if n.strip()],
+            }
+
+
+class Gazetteer:
+    """In-memory City table: name resolution and a grid index over the coordinates."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, records):
+        # records: (id, name, country, latitude, longitude, population, alternate_names)
+        self.ids = np.array([r[0] for r in records], dtype=np.int64)
+        self.latitudes = np.array([r[3] for r in records], dtype=np.float64)
+        self.longitudes = np.array([r[4] for r in records], dtype=np.float64)
+        self.rows = {int(city_id): row for row, city_id in enumerate(self.ids)}
+        self.labels = {int(r[0]): (r[1], r[2]) for r in records}   # city -> (name, country)
+
+        # (country, name) -> city; name alone -> most populous city of that name
+        self.by_country = {}
+        self.by_name = {}
+        for city_id, name, country, _, _, population, alternate_names in sorted(records, key=lambda r: -r[5]):
+            for key in {normalize_city(n) for n in [name, *(alternate_names or [])]}:
+                self.by_country.setdefault((country, key), city_id)
+                self.by_name.setdefault(key, city_id)
+
+        # Grid: rows sorted by cell key, so a cell's cities are one contiguous range
+        self._columns = int(round(360 / GRID_DEGREES))
+        keys = self._cell_keys(self.latitudes, self.longitudes)
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+        self.loaded_monotonic = time.monotonic()
+
+    @classmethod
+    def get(cls):
+        """This worker's gazetteer, read on first use and refreshed every RELOAD_INTERVAL_SECONDS."""
+        with cls._lock:
+            instance = cls._instance
+            if instance is None or time.monotonic() - instance.loaded_monotonic > RELOAD_INTERVAL_SECONDS:
+                records = City.objects.values_list(
+                    'id', 'name', 'country', 'latitude', 'longitude', 'population', 'alternate_names'
+                )
+                instance = cls._instance = cls(list(records))
+            return instance
+
+    @classmethod
+    def reset(cls):
+        """Drop this worker's copy (e.g. after load_cities) so the next get() re-reads the table."""
+        with cls._lock:
+            cls._instance = None
+
+    @staticmethod
+    def load(cities):
+        """Upsert City field dicts (see read_gazetteer) by (country, name). Returns the number written."""
+        cities = list(cities)
+        City.objects.bulk_create(
+            [City(**fields) for fields in cities],
+            update_conflicts=True,
+            unique_fields=['country', 'name'],
+            update_fields=['latitude', 'longitude', 'population', 'alternate_names'],
+        )
+        Gazetteer.reset()
+        return len(cities)
+
+    # --- Resolution ---------------------------------------------------------
+
+    def resolve(self, city, country=None):
+        """
+        City ID of a free-text city name, or None. With a country the name
+        must be known in that country; without one the most populous city of
+        that name is used.
+        """
+        if not city or not isinstance(city, str):
+            return None
+        key = normalize_city(city)
+        country = (country or '').strip().upper()
+        if country:
+            return self.by_country.get((country, key))
+        return self.by_name.get(key)
+
+    def coordinates(self, city_id):
+        """(latitude, longitude) of a city, or None."""
+        row = self.rows.get(city_id)
+        return None if row is None else (float(self.latitudes[row]), float(self.longitudes[row]))
+
+    # --- Radius queries -----------------------------------------------------
+
+    def _cell_keys(self, latitudes, longitudes):
+        rows = np.clip(np.floor((latitudes + 90) / GRID_DEGREES), 0, 180 / GRID_DEGREES - 1).astype(np.int64)
+        columns = np.floor((longitudes + 180) / GRID_DEGREES).astype(np.int64) % self._columns
+        return rows * self._columns + columns
+
+    def _candidate_rows(self, latitude, longitude, radius_km):
+        """Rows of the cities in the grid cells overlapping the radius' bounding box."""
+        # Exact bounding box of a spherical cap; it spans every longitude if it contains a pole
+        angle = radius_km / EARTH_RADIUS_KM
+        span = np.degrees(angle)
+        low, high = latitude - span, latitude + span
+        cell_rows = np.arange(
+            int(np.floor((max(low, -90.0) + 90) / GRID_DEGREES)),
+            min(int(np.floor((min(high, 90.0) + 90) / GRID_DEGREES)), int(180 / GRID_DEGREES) - 1) + 1,
+        )
+        if low <= -90 or high >= 90 or np.sin(angle) >= np.cos(np.radians(latitude)):
+            columns = np.arange(self._columns)
+        else:
+            width = np.degrees(np.arcsin(np.sin(angle) / np.cos(np.radians(latitude))))
+            first = int(np.floor((longitude - width + 180) / GRID_DEGREES))
+            last = int(np.floor((longitude + width + 180) / GRID_DEGREES))
+            columns = np.unique(np.arange(first, last + 1) % self._columns)
+
+        keys = (cell_rows[:, None] * self._columns + columns[None, :]).ravel()
+        starts = np.searchsorted(self._keys, keys, side='left')
+        ends = np.searchsorted(self._keys, keys, side='right')
+        if not len(keys) or not (ends > starts).any():
+            return np.zeros(0, dtype=np.int64)
+        return self._order[np.concatenate([np.arange(s, e) for s, e in zip(starts, ends) if e > s])]
+
+    def within(self, latitude, longitude, radius_km):
+        """(city ids, distances in km) of the cities within `radius_km` of a point, nearest first."""
+        rows = self._candidate_rows(latitude, longitude, radius_km)
+        distances = haversine_km(latitude, longitude, self.latitudes[rows], self.longitudes[rows])
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        order = np.lexsort((self.ids[rows], distances))
+        return self.ids[rows[order]], distances[order]
+
+    def within_of_city(self, city_id, radius_km):
+        """within() around a gazetteer city (empty if unknown)."""
+        point = self.coordinates(city_id)
+        if point is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        return self.within(point[0], point[1], radius_km)
@@ -0,0 +1,192 @@
+"""
+Clustered member counts for the global map.
+
+Members who opted in (show_on_map, activated, not deleted) and whose city is
+in the gazetteer are aggregated into counts per city with one GROUP BY. The
+aggregation is the only thing read from the database: a map request names a
+Web Mercator tile (zoom z, column x, row y) and gets that tile's cities
+merged on a CLUSTER_GRID x CLUSTER_GRID grid - a count and count-weighted
+centre per non-empty cell - so a response never grows with the member count.
+
+The aggregation and every computed tile are cached under a map version
+stamp. A save that changes whether or where a member appears drops the
+aggregation and the tiles holding the old and new city at every zoom level;
+bulk changes bump the version instead (see invalidate_all).
+"""
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+
+from ..models import Profile
+from .geo_index import Gazetteer
+
+
+# Zoom levels served; beyond this, clusters are single cities anyway
+MAP_MAX_ZOOM = 12
+
+# Zoom levels up to which a request may ask for the whole world at once
+MAP_WORLD_MAX_ZOOM = 2
+
+# Cells per tile side; a tile holds at most CLUSTER_GRID ** 2 clusters
+CLUSTER_GRID = 8
+
+# Cached tiles and aggregation are recomputed at least this often
+MAP_CACHE_TIMEOUT = 60 * 60
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+
+def _grid_positions(latitudes, longitudes, zoom):
+    """Global cluster-grid (column, row) of coordinates at `zoom` (tile = position // CLUSTER_GRID)."""
+    size = (1 << zoom) * CLUSTER_GRID
+    latitudes = np.radians(np.clip(latitudes, -MAX_LATITUDE, MAX_LATITUDE))
+    columns = np.floor((np.asarray(longitudes) + 180.0) / 360.0 * size)
+    rows = np.floor((1.0 - np.arcsinh(np.tan(latitudes)) / np.pi) / 2.0 * size)
+    return np.clip(columns, 0, size - 1).astype(np.int64), np.clip(rows, 0, size - 1).astype(np.int64)
+
+
+class MapService:
+
+    # --- Cache keys ---------------------------------------------------------
+
+    @staticmethod
+    def version():
+        """The map version stamp (started from the clock when missing, like RecommendationCache)."""
+        version = cache.get('map:version')
+        if version is None:
+            cache.add('map:version', time.time_ns(), None)
+            version = cache.get('map:version')
+        return version
+
+    @staticmethod
+    def _tile_key(version, zoom, x, y):
+        return f'map:{version}:tile:{zoom}:{x}:{y}'
+
+    @staticmethod
+    def _counts_key(version):
+        return f'map:{version}:counts'
+
+    # --- Aggregation --------------------------------------------------------
+
+    @staticmethod
+    def visible_profiles():
+        return Profile.objects.filter(
+            show_on_map=True, is_activated=True, is_deleted=False, gazetteer_city__isnull=False
+        )
+
+    @staticmethod
+    def city_counts(version=None):
+        """(city ids, latitudes, longitudes, member counts) of every city with visible members."""
+        version = version or MapService.version()
+        key = MapService._counts_key(version)
+        counts = cache.get(key)
+        if counts is None:
+            grouped = dict(
+                MapService.visible_profiles().order_by().values('gazetteer_city').annotate(
+                    members=Count('id')
+                ).values_list('gazetteer_city', 'members')
+            )
+            gazetteer = Gazetteer.get()
+            ids = np.array(sorted(city for city in grouped if city in gazetteer.rows), dtype=np.int64)
+            rows = np.array([gazetteer.rows[int(city)] for city in ids], dtype=np.int64)
+            counts = (
+                ids,
+                gazetteer.latitudes[rows] if len(rows) else np.zeros(0),
+                gazetteer.longitudes[rows] if len(rows) else np.zeros(0),
+                np.array([grouped[int(city)] for city in ids], dtype=np.int64),
+            )
+            cache.set(key, counts, MAP_CACHE_TIMEOUT)
+        return counts
+
+    # --- Tiles --------------------------------------------------------------
+
+    @staticmethod
+    def tile(zoom, x, y, version=None):
+        """Clusters of tile (zoom, x, y): [{'lat', 'lon', 'count'[, 'city', 'country']}], largest first."""
+        version = version or MapService.version()
+        key = MapService._tile_key(version, zoom, x, y)
+        clusters = cache.get(key)
+        if clusters is None:
+            clusters = MapService._clusters(zoom, x, y, MapService.city_counts(version))
+            cache.set(key, clusters, MAP_CACHE_TIMEOUT)
+        return clusters
+
+    @staticmethod
+    def _clusters(zoom, x, y, counts):
+        ids, latitudes, longitudes, members = counts
+        columns, rows = _grid_positions(latitudes, longitudes, zoom)
+        inside = (columns // CLUSTER_GRID == x) & (rows // CLUSTER_GRID == y)
+        if not inside.any():
+            return []
+        ids, latitudes, longitudes, members = ids[inside], latitudes[inside], longitudes[inside], members[inside]
+
+        # 1. Merge the tile's cities per grid cell
+        cells = (rows[inside] % CLUSTER_GRID) * CLUSTER_GRID + columns[inside] % CLUSTER_GRID
+        cells, groups, sizes = np.unique(cells, return_inverse=True, return_counts=True)
+        totals = np.bincount(groups, weights=members)
+        centre_lat = np.bincount(groups, weights=members * latitudes) / totals
+        centre_lon = np.bincount(groups, weights=members * longitudes) / totals
+
+        # 2. A cell holding one city is labelled with it
+        labels = Gazetteer.get().labels
+        clusters = []
+        for group in np.argsort(-totals, kind='stable'):
+            cluster = {
+                'lat': round(float(centre_lat[group]), 4),
+                'lon': round(float(centre_lon[group]), 4),
+                'count': int(totals[group]),
+            }
+            if sizes[group] == 1:
+                city = int(ids[groups == group][0])
+                if city in labels:
+                    cluster['city'], cluster['country'] = labels[city]
+            clusters.append(cluster)
+        return clusters
+
+    @staticmethod
+    def tiles(zoom, x=None, y=None):
+        """
+        Response body for one tile, or (x and y omitted, zoom up to
+        MAP_WORLD_MAX_ZOOM) every non-empty tile of the world.
+        """
+        version = MapService.version()
+        if x is None or y is None:
+            coordinates = [(tx, ty) for ty in range(1 << zoom) for tx in range(1 << zoom)]
+        else:
+            coordinates = [(x, y)]
+        tiles = []
+        for tx, ty in coordinates:
+            clusters = MapService.tile(zoom, tx, ty, version)
+            if clusters or len(coordinates) == 1:
+                tiles.append({'x': tx, 'y': ty, 'clusters': clusters})
+        return {
+            'zoom': zoom,
+            'tiles': tiles,
+            'count': sum(cluster['count'] for tile in tiles for cluster in tile['clusters']),
+        }
+
+    # --- Invalidation -------------------------------------------------------
+
+    @staticmethod
+    def invalidate(city_ids):
+        """Drop the aggregation and, at every zoom level, the tiles holding these cities."""
+        gazetteer = Gazetteer.get()
+        version = MapService.version()
+        keys = [MapService._counts_key(version)]
+        for city in {city for city in city_ids if city in gazetteer.rows}:
+            row = gazetteer.rows[city]
+            for zoom in range(MAP_MAX_ZOOM + 1):
+                columns, rows = _grid_positions(gazetteer.latitudes[row:row + 1], gazetteer.longitudes[row:row + 1], zoom)
+                keys.append(MapService._tile_key(version, zoom, int(columns[0]) // CLUSTER_GRID, int(rows[0]) // CLUSTER_GRID))
+        cache.delete_many(keys)
+
+    @staticmethod
+    def invalidate_all():
+        """Bump the version stamp so no cached tile is read again (e.g. after bulk updates)."""
+        try:
+            cache.incr('map:version')
+        except ValueError:
+            cache.set('map:version', time.time_ns(), None)
@@ -0,0 +1,156 @@
+"""
+Maintenance and loading of the denormalized MatchFeatures table.
+
+Scoring paths read FeatureRows from here (one query, no Profile/Preference/
+WorkExperience instances); the source tables are only touched when a row is
+refreshed from a signal or rebuilt in bulk.
+"""
+from django.utils import timezone
+
+from ..models import Profile, WorkExperience, MatchFeatures
+from .profession_index import ProfessionIndex
+from .scoring_engine import FEATURE_FIELDS, PREFERENCE_FIELDS, FeatureRow
+
+
+PROFILE_FIELDS = (
+    'id', 'gender', 'date_of_birth', 'height_inches', 'religion',
+    'current_country', 'marital_status', 'faith_tag_ids',
+    'gazetteer_city__latitude', 'gazetteer_city__longitude',
+)
+
+
+class MatchFeatureService:
+
+    @staticmethod
+    def build_rows(queryset):
+        """
+        Compute FeatureRows from the source tables for every profile in a
+        queryset, with two queries: profile + preference columns, then work titles
+        (which are mapped to Profession vocabulary IDs here, at write time).
+        """
+        pref_lookups = ['preference__id'] + [f'preference__{f}' for f in PREFERENCE_FIELDS]
+        values = queryset.values_list(*PROFILE_FIELDS, *pref_lookups)
+
+        titles = {}
+        work_qs = WorkExperience.objects.filter(
+            profile__in=queryset.values('id')
+        ).order_by('profile_id', 'id').values_list('profile_id', 'title')
+        for profile_id, title in work_qs:
+            titles.setdefault(profile_id, []).append(title)
+        all_titles = [title for profile_titles in titles.values() for title in profile_titles]
+        title_ids = dict(zip(all_titles, ProfessionIndex.canonical_ids(all_titles)))
+
+        n_profile = len(PROFILE_FIELDS)
+        rows = []
+        for record in values:
+            pid, gender, dob, height, religion, country, marital, faith_tag_ids, latitude, longitude = record[:n_profile]
+            preference = None
+            if record[n_profile] is not None:
+                preference = dict(zip(PREFERENCE_FIELDS, record[n_profile + 1:]))
+            rows.append(FeatureRow(
+                pid, gender=gender, date_of_birth=dob, height_inches=height,
+                religion=religion, country=country, marital_status=marital,
+                titles=titles.get(pid, ()),
+                profession_ids=[title_ids[title] for title in titles.get(pid, ())],
+                faith_tag_ids=faith_tag_ids or (),
+                coordinates=(latitude, longitude) if latitude is not None else None,
+                preference=preference,
+            ))
+        return rows
+
+    @staticmethod
+    def store_rows(rows):
+        """Upsert FeatureRows into MatchFeatures in one statement."""
+        if not rows:
+            return
+        MatchFeatures.objects.bulk_create(
+            [MatchFeatures(profile_id=row.profile_id, **row.as_features()) for row in rows],
+            update_conflicts=True,
+            unique_fields=['profile'],
+            update_fields=list(FEATURE_FIELDS[1:]) + ['updated_at'],
+        )
+
+    @staticmethod
+    def refresh(profile_id, create=True):
+        """
+        Recompute one profile's row. With create=False an existing row is
+        updated but a missing one is not recreated.
+        """
+        rows = MatchFeatureService.build_rows(Profile.objects.filter(pk=profile_id))
+        if not rows:
+            return None  # Profile no longer exists
+
+        row = rows[0]
+        updated = MatchFeatures.objects.filter(profile_id=profile_id).update(
+            updated_at=timezone.now(), **row.as_features()
+        )
+        if not updated and create:
+            MatchFeatureService.store_rows(rows)
+        ProfessionIndex.notify_saved(profile_id, row.profession_ids)
+        return row
+
+    @staticmethod
+    def rebuild(queryset=None, batch_size=1000):
+        """
+        Recompute rows for all (or the given) profiles in id-ordered batches.
+        Yields the number of rows written per batch.
+        """
+        queryset = queryset if queryset is not None else Profile.objects.all()
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            rows = MatchFeatureService.build_rows(Profile.objects.filter(id__in=batch_ids))
+            MatchFeatureService.store_rows(rows)
+            yield len(rows)
+
+    @staticmethod
+    def load_rows(queryset):
+        """
+        FeatureRows for every profile in a Profile queryset, read from
+        MatchFeatures in a single joined query. Profiles without a row yet
+        are computed from the source tables and stored.
+        """
+        lookups = ['id', 'match_features__profile'] + [f'match_features__{f}' for f in FEATURE_FIELDS[1:]]
+
+        rows = []
+        missing = []
+        for record in queryset.values_list(*lookups):
+            if record[1] is None:
+                missing.append(record[0])
+            else:
+                rows.append(FeatureRow.from_features(record[:1] + record[2:]))
+
+        if missing:
+            built = MatchFeatureService.build_rows(Profile.objects.filter(id__in=missing))
+            MatchFeatureService.store_rows(built)
+            rows.extend(built)
+        return rows
+
+    @staticmethod
+    def load_rows_by_ids(profile_ids, chunk_size=5000):
+        """
+        FeatureRows for a collection of profile IDs (e.g. from the candidate
+        index), reading MatchFeatures directly in chunked IN queries.
+        """
+        profile_ids = [int(pid) for pid in profile_ids]
+        rows = []
+        for start in range(0, len(profile_ids), chunk_size):
+            chunk = profile_ids[start:start + chunk_size]
+            records = MatchFeatures.objects.filter(profile_id__in=chunk).values_list(*FEATURE_FIELDS)
+            rows.extend(FeatureRow.from_features(record) for record in records)
+
+        if len(rows) < len(profile_ids):
+            found = {row.profile_id for row in rows}
+            missing = [pid for pid in profile_ids if pid not in found]
+            built = MatchFeatureService.build_rows(Profile.objects.filter(id__in=missing))
+            MatchFeatureService.store_rows(built)
+            rows.extend(built)
+        return rows
+
+    @staticmethod
+    def get_row(profile):
+        """FeatureRow for a single profile (built and stored if missing)."""
+        record = MatchFeatures.objects.filter(profile_id=profile.pk).values_list(*FEATURE_FIELDS).first()
+        if record is not None:
+            return FeatureRow.from_features(record)
+        return MatchFeatureService.refresh(profile.pk)
@@ -0,0 +1,129 @@
+"""
+Planning and storage for the nightly all-pairs precompute
+(`manage.py precompute_matches`).
+
+Viewers are grouped into blocks that share the same hard filters, so each
+block's candidate set is selected from the CandidateIndex once; the scoring
+itself runs in worker processes (see shared_pool.rank_block).
+"""
+import numpy as np
+
+from ..models import Profile, PrecomputedMatch
+from .matching_service import MatchingService
+
+
+# Viewer / preference columns that decide a viewer's hard filters
+VIEWER_FIELDS = (
+    'id', 'gender', 'current_country', 'preference__id',
+    'preference__looking_for_gender', 'preference__religion',
+    'preference__location_preference', 'preference__country',
+    'preference__marital_statuses',
+)
+
+NO_PREFERENCES = {
+    'gender_input': 'any',
+    'religion_pref': None,
+    'location_pref': 'any',
+    'target_country': None,
+    'marital_status_pref': [],
+}
+
+
+def _freeze(filters):
+    """Hashable form of a CandidateIndex.select() filter dict."""
+    return tuple(sorted(
+        (key, tuple(value) if isinstance(value, list) else value)
+        for key, value in filters.items()
+    ))
+
+
+class MatchPrecomputeService:
+
+    @staticmethod
+    def viewer_queryset(run_id=None):
+        """Activated, non-deleted profiles; with run_id, only those that run has not written yet."""
+        queryset = Profile.objects.filter(is_activated=True, is_deleted=False)
+        if run_id:
+            queryset = queryset.exclude(precomputed_matches__run_id=run_id)
+        return queryset.order_by('id')
+
+    @staticmethod
+    def viewer_filters(viewer_ids):
+        """
+        {viewer_id: (profile, prefs, level_filters)} for a chunk of viewers, from
+        one query. `profile` is an unsaved stub carrying just the fields the hard
+        filters read; level_filters are the filters at every relaxation level.
+        """
+        result = {}
+        records = Profile.objects.filter(id__in=viewer_ids).values_list(*VIEWER_FIELDS)
+        for pid, gender, country, pref_id, *pref_values in records:
+            profile = Profile(id=pid, gender=gender, current_country=country)
+            prefs = NO_PREFERENCES if pref_id is None else dict(zip(NO_PREFERENCES, pref_values))
+
+            level_filters = MatchingService._relaxed_filters(profile, prefs)
+            for filters in level_filters:
+                filters.pop('exclude_ids')  # scoring already skips the viewer itself
+            result[pid] = (profile, prefs, level_filters)
+        return result
+
+    @staticmethod
+    def plan_blocks(viewer_filters, index, pool_ids):
+        """
+        Group viewers by their (relaxed) hard filters. Returns a list of
+        (positions, levels, viewer_ids): positions into the pool whose sorted ID
+        array is `pool_ids` of the block's candidates under the loosest filters,
+        and the strictest relaxation level each candidate passes.
+        """
+        def candidates(level_filters):
+            ids, levels = index.select_levels(level_filters)
+            if not len(pool_ids):
+                return np.zeros(0, dtype=np.int32), levels[:0]
+            pos = np.minimum(np.searchsorted(pool_ids, ids), len(pool_ids) - 1)
+            found = pool_ids[pos] == ids
+            return pos[found].astype(np.int32), levels[found]
+
+        blocks = {}
+        for pid, (_, _, level_filters) in viewer_filters.items():
+            key = tuple(_freeze(filters) for filters in level_filters)
+            blocks.setdefault(key, (level_filters, []))[1].append(pid)
+
+        return [
+            (*candidates(level_filters), viewer_ids)
+            for level_filters, viewer_ids in blocks.values()
+        ]
+
+    @staticmethod
+    def store(results, viewer_filters, run_id, computed_at):
+        """Upsert ranked entries from shared_pool.rank_block() as PrecomputedMatch rows."""
+        rows = []
+        for viewer_id, entry in results:
+            profile, prefs = viewer_filters[viewer_id][:2]
+            rows.append(PrecomputedMatch(
+                profile_id=viewer_id,
+                candidate_ids=entry['ids'].tolist(),
+                scores=entry['scores'].tolist(),
+                reasons=entry['reasons'].tolist(),
+                complete=entry['complete'],
+                relaxation=entry['relaxation'],
+                level_counts=entry['level_counts'],
+                mutual=entry['mutual'],
+                faith_tag_weight=entry['faith_tag_weight'],
+                proximity_weight=entry['proximity_weight'],
+                is_fallback=entry['relaxation'] > 0,
+                fallback_message=(
+                    MatchingService._fallback_message(entry['relaxation'], profile, prefs)
+                    if entry['relaxation'] else None
+                ),
+                run_id=run_id,
+                computed_at=computed_at,
+            ))
+        PrecomputedMatch.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['profile'],
+            update_fields=[
+                'candidate_ids', 'scores', 'reasons', 'complete', 'relaxation',
+                'level_counts', 'mutual', 'faith_tag_weight', 'proximity_weight', 'is_fallback', 'fallback_message', 'run_id', 'computed_at',
+            ],
+        )
+        return len(rows)
@@ -1,7 +1,114 @@
-from ..models import Profile, Interest
+import numpy as np
+from django.core import signing
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from ..models import Profile, Interest, AppConfig
 from ..utils.country_utils import get_country_name
+from .candidate_index import CandidateIndex
+from .embedding_index import EmbeddingIndex
+from .match_features import MatchFeatureService
+from .pipeline_metrics import PipelineMetrics
+from .profession_index import ProfessionIndex
+from .recommendation_cache import RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_MAX_MERGE, RecommendationCache
+from .reranker import PROFILE_FEATURE_FIELDS, RerankerService
+from .seen_filter import SeenFilterService
+from . import sql_scoring
+from .scoring_engine import CandidatePool, RelaxedTopK, profession_matches, rank_keys, reason_labels, score_pool
+
+
+# Progressive relaxation of the recommendation hard filters, strictest first:
+# each level also drops the listed CandidateIndex.select() filters. Candidates
+# are fetched and scored once under the loosest level; new levels (e.g.
+# religion-only) are added here without another query.
+RELAXATION_LEVELS = (
+    ('strict', ()),
+    ('location', ('countries', 'exclude_countries')),
+)
+
+# Fewer strict matches than this and the next relaxation level is tried
+MIN_MATCHES = 3
+
+# Candidates whose features are loaded and scored at a time by build_ranking
+SCORE_CHUNK_SIZE = 5000
+
+# Salt of the signed recommendation page cursors
+CURSOR_SALT = 'recommendations.cursor'
+
+# Ranking backends: 'python' scores feature rows with NumPy, 'sql' pushes
+# scoring, ordering and the limit into the database (see sql_scoring).
+# The default comes from the `recommendation_scoring_backend` AppConfig key.
+SCORING_BACKENDS = ('python', 'sql')
+DEFAULT_SCORING_BACKEND = 'python'
+
+# Share (0-100) of the mutual score given to faith-tag similarity for pairs
+# where both profiles have tags (`faith_tag_weight` AppConfig key; 0 = off)
+DEFAULT_FAITH_TAG_WEIGHT = 0
+
+# Share (0-100) of the mutual score given to proximity (gazetteer distance)
+# for located pairs where either profile prefers someone near them
+# (`proximity_weight` AppConfig key; 0 = off, so scores match the legacy
+# weights and the SQL backend stays available until it is switched on)
+DEFAULT_PROXIMITY_WEIGHT = 0
 
 class MatchingService:
+    @staticmethod
+    def score_many(user_profile, candidates, viewer_row=None, mutual=False, faith_weight=None, proximity_weight=None):
+        """
+        Mutual compatibility of user_profile against a whole candidate pool.
+        `candidates` is a Profile queryset, or an iterable of Profile instances
+        or profile IDs; either way only the MatchFeatures table is read.
+        Returns a BatchScores with the same scores/reasons as
+        calculate_compatibility_score for every candidate (with mutual=True,
+        candidates whose preferences reject user_profile are left unscored),
+        plus faith-tag similarity at `faith_weight` (default: faith_tag_weight)
+        and proximity at `proximity_weight` (default: proximity_weight).
+        """
+        if isinstance(candidates, QuerySet):
+            rows = MatchFeatureService.load_rows(candidates)
+        else:
+            rows = MatchFeatureService.load_rows_by_ids(
+                p.pk if isinstance(p, Profile) else p for p in candidates
+            )
+        viewer_row = viewer_row or MatchFeatureService.get_row(user_profile)
+        profession_ids = {pid for row in rows for pid in row.profession_ids}
+        profession_ids.update(viewer_row.profession_ids)
+        pool = CandidatePool(rows, ProfessionIndex.matcher_for(profession_ids))
+        if faith_weight is None:
+            faith_weight = MatchingService.faith_tag_weight()
+        if proximity_weight is None:
+            proximity_weight = MatchingService.proximity_weight()
+        return score_pool(
+            viewer_row, pool, mutual=mutual, faith_weight=faith_weight, proximity_weight=proximity_weight
+        )
+
+    @staticmethod
+    def iter_scores(user_profile, candidate_ids, chunk_size=SCORE_CHUNK_SIZE, mutual=False,
+                    faith_weight=None, proximity_weight=None):
+        """
+        Stream BatchScores for a sequence of candidate IDs, one chunk at a time,
+        so only a chunk of FeatureRows is held in memory.
+        """
+        viewer_row = MatchFeatureService.get_row(user_profile)
+        for start in range(0, len(candidate_ids), chunk_size):
+            yield MatchingService.score_many(
+                user_profile, candidate_ids[start:start + chunk_size], viewer_row=viewer_row,
+                mutual=mutual, faith_weight=faith_weight, proximity_weight=proximity_weight,
+            )
+
+    @staticmethod
+    def score_pair(user_profile, other_profile, viewer_row=None):
+        """
+        Feature-table equivalent of calculate_compatibility_score for one pair.
+        Pass viewer_row (MatchFeatureService.get_row) to reuse it across calls.
+        """
+        if not user_profile or not other_profile:
+            return None
+        batch = MatchingService.score_many(
+            user_profile, Profile.objects.filter(pk=other_profile.pk), viewer_row=viewer_row
+        )
+        return batch.get(other_profile.pk)
+
     @staticmethod
     def calculate_compatibility_score(user_profile, other_profile):
         """
@@ -57,6 +164,12 @@ class MatchingService:
         """
         Calculate how well viewed_profile matches viewer_profile's preferences.
         Returns dict with 'score' (0-100) and 'reasons' (list), or None if no preferences set.
+
+        A preferred profession matches when each of its words starts a word of
+        one job title (profession_matches, as the vectorized engine and the
+        profession index). It used to be a substring of all titles joined, so
+        'neer' matched 'Engineer' and 'doctor teacher' matched the titles
+        'Doctor' and 'Teacher'; neither does now.
         """
         # Safely check for preference object
         try:
@@ -112,12 +225,12 @@ class MatchingService:
                 score += 15
                 reasons.append('Marital Status')
         
-        # 5. PROFESSION (Weight: 10)
+        # 5. PROFESSION (Weight: 10) - word-prefix match against any job title
         if prefs.profession and viewed_profile.work_experience.exists():
             max_score += 10
-            viewed_professions = [work.title.lower() for work in viewed_profile.work_experience.all()]
+            viewed_professions = [work.title for work in viewed_profile.work_experience.all()]
             pref_profs = prefs.profession if isinstance(prefs.profession, list) else [prefs.profession]
-            if any(pref_prof.lower() in ' '.join(viewed_professions) for pref_prof in pref_profs):
+            if any(profession_matches(pref_prof, title) for pref_prof in pref_profs for title in viewed_professions):
                 score += 10
                 reasons.append('Profession')
         
@@ -141,140 +254,464 @@ class MatchingService:
         }
 
     @staticmethod
-    def get_ranked_recommendations(user_profile, limit=5):
-        """
-        Fetches and ranks potential matches based on compatibility.
-        Returns dict with 'matches' (list of scored profiles), 'is_fallback' (bool), 
-        and 'fallback_message' (str or None).
-        """
-        # Get user preferences
+    def _recommendation_preferences(user_profile):
+        """The viewer's preference inputs to the recommendation hard filters."""
         try:
             prefs = user_profile.preference
-            gender_input = getattr(prefs, 'looking_for_gender', 'any')
-            religion_pref = getattr(prefs, 'religion', None)
-            location_pref = getattr(prefs, 'location_preference', 'any')
-            target_country = getattr(prefs, 'country', None)
-            marital_status_pref = getattr(prefs, 'marital_statuses', [])
+            return {
+                'gender_input': getattr(prefs, 'looking_for_gender', 'any'),
+                'religion_pref': getattr(prefs, 'religion', None),
+                'location_pref': getattr(prefs, 'location_preference', 'any'),
+                'target_country': getattr(prefs, 'country', None),
+                'marital_status_pref': getattr(prefs, 'marital_statuses', []),
+            }
         except (AttributeError, Profile.preference.RelatedObjectDoesNotExist):
-            prefs = None
-            gender_input = 'any'
-            religion_pref = None
-            location_pref = 'any'
-            target_country = None
-            marital_status_pref = []
-
-        def apply_hard_filters(queryset, include_country=True):
-            """Apply hard filters (gender, religion, optionally country)"""
-            # --- GENDER FILTER (HARD) ---
-            if gender_input == 'bride':
-                queryset = queryset.filter(gender__iexact='female')
-            elif gender_input == 'groom':
-                queryset = queryset.filter(gender__iexact='male')
-            elif gender_input == 'any':
-                pass  # No gender filter
-            else:
-                # Fallback (legacy logic): Match opposite gender
-                u_gender = (user_profile.gender or '').lower()
-                if u_gender == 'male':
-                    queryset = queryset.filter(gender__iexact='female')
-                elif u_gender == 'female':
-                    queryset = queryset.filter(gender__iexact='male')
-            
-            # --- RELIGION FILTER (HARD) ---
-            if religion_pref:
-                queryset = queryset.filter(religion__iexact=religion_pref)
-            
-            # --- LOCATION FILTER (CONDITIONAL) ---
-            if include_country and location_pref != 'any':
-                if location_pref == 'near_me':
-                    # Strictly local
-                    if user_profile.current_country:
-                        queryset = queryset.filter(current_country=user_profile.current_country)
-                
-                elif location_pref == 'abroad':
-                    # Strictly abroad
-                    if target_country:
-                        if isinstance(target_country, list):
-                             queryset = queryset.filter(current_country__in=target_country)
-                        else:
-                             queryset = queryset.filter(current_country=target_country)
-                    else:
-                        # Generic "abroad" means NOT my country
-                        if user_profile.current_country:
-                            queryset = queryset.exclude(current_country=user_profile.current_country)
-
-            # --- MARITAL STATUS FILTER (HARD) ---
-            if marital_status_pref:
-                if isinstance(marital_status_pref, list) and len(marital_status_pref) > 0:
-                    queryset = queryset.filter(marital_status__in=marital_status_pref)
-                elif isinstance(marital_status_pref, str):
-                    queryset = queryset.filter(marital_status=marital_status_pref)
-            
-            return queryset
+            return {
+                'gender_input': 'any',
+                'religion_pref': None,
+                'location_pref': 'any',
+                'target_country': None,
+                'marital_status_pref': [],
+            }
 
-        # 1. Start with base queryset
-        base_queryset = Profile.objects.exclude(user=user_profile.user).filter(is_deleted=False)
-        
-        # 2. First attempt: Apply ALL hard filters (including country)
-        queryset = apply_hard_filters(base_queryset.all(), include_country=True)
-        queryset = queryset.prefetch_related('work_experience', 'preference')
-        
-        # 3. Calculate scores and rank
-        scored_profiles = []
-        for profile in queryset[:100]:  # Limit pool size for performance
-            result = MatchingService.calculate_compatibility_score(user_profile, profile)
-            if result is not None:
-                scored_profiles.append({
-                    'profile': profile,
-                    'score': result['score'],
-                    'reasons': result['reasons']
-                })
+    @staticmethod
+    def _hard_filters(user_profile, prefs):
+        """Hard filters (gender, religion, country, marital status) as CandidateIndex.select() arguments"""
+        gender_input = prefs['gender_input']
+        location_pref = prefs['location_pref']
+        target_country = prefs['target_country']
+        marital_status_pref = prefs['marital_status_pref']
+        filters = {'exclude_ids': [user_profile.pk]}
         
-        # 4. Sort by score descending
-        scored_profiles.sort(key=lambda x: x['score'], reverse=True)
+        # --- GENDER FILTER (HARD) ---
+        if gender_input == 'bride':
+            filters['gender'] = 'female'
+        elif gender_input == 'groom':
+            filters['gender'] = 'male'
+        elif gender_input == 'any':
+            pass  # No gender filter
+        else:
+            # Fallback (legacy logic): Match opposite gender
+            u_gender = (user_profile.gender or '').lower()
+            if u_gender == 'male':
+                filters['gender'] = 'female'
+            elif u_gender == 'female':
+                filters['gender'] = 'male'
         
-        # 5. Check if we have enough matches
-        is_fallback = False
-        fallback_message = None
+        # --- RELIGION FILTER (HARD) ---
+        if prefs['religion_pref']:
+            filters['religion'] = prefs['religion_pref']
         
-        if len(scored_profiles) < 3 and location_pref != 'any':
-            # Not enough matches with country filter - retry without it
-            queryset_fallback = apply_hard_filters(base_queryset.all(), include_country=False)
-            queryset_fallback = queryset_fallback.prefetch_related('work_experience', 'preference')
+        # --- LOCATION FILTER (CONDITIONAL) ---
+        if location_pref != 'any':
+            if location_pref == 'near_me':
+                # Strictly local
+                if user_profile.current_country:
+                    filters['countries'] = [user_profile.current_country]
             
-            scored_profiles_fallback = []
-            for profile in queryset_fallback[:100]:
-                result = MatchingService.calculate_compatibility_score(user_profile, profile)
-                if result is not None:
-                    scored_profiles_fallback.append({
-                        'profile': profile,
-                        'score': result['score'],
-                        'reasons': result['reasons']
-                    })
+            elif location_pref == 'abroad':
+                # Strictly abroad
+                if target_country:
+                    if isinstance(target_country, list):
+                        filters['countries'] = target_country
+                    else:
+                        filters['countries'] = [target_country]
+                else:
+                    # Generic "abroad" means NOT my country
+                    if user_profile.current_country:
+                        filters['exclude_countries'] = [user_profile.current_country]
+
+        # --- MARITAL STATUS FILTER (HARD) ---
+        if marital_status_pref:
+            if isinstance(marital_status_pref, list) and len(marital_status_pref) > 0:
+                filters['marital_statuses'] = marital_status_pref
+            elif isinstance(marital_status_pref, str):
+                filters['marital_statuses'] = [marital_status_pref]
+        
+        return filters
+
+    @staticmethod
+    def _relaxed_filters(user_profile, prefs):
+        """The hard filters at every RELAXATION_LEVELS step, strictest first."""
+        filters = MatchingService._hard_filters(user_profile, prefs)
+        dropped = set()
+        level_filters = []
+        for _, keys in RELAXATION_LEVELS:
+            dropped.update(keys)
+            level_filters.append({key: value for key, value in filters.items() if key not in dropped})
+        return level_filters
+
+    @staticmethod
+    def _fallback_message(level, user_profile, prefs):
+        """Message shown when recommendations come from relaxation level `level` (> 0)."""
+        if RELAXATION_LEVELS[level][0] != 'location':
+            return "We didn't find enough matches with all your preferences, but here are other highly compatible profiles you might like."
+        location_pref = prefs['location_pref']
+        target_country = prefs['target_country']
+        if location_pref == 'near_me':
+            code = user_profile.current_country
+            country_name = get_country_name(code) if code else 'your country'
+            return f"We didn't find enough matches in {country_name}, but here are other highly compatible profiles you might like."
+        elif location_pref == 'abroad' and target_country:
+            country_name = get_country_name(target_country)
+            return f"We didn't find enough matches in {country_name}, but here are other highly compatible profiles you might like."
+        return "We didn't find enough matches with your location preference, but here are other highly compatible profiles you might like."
+
+    @staticmethod
+    def scoring_backend(requested=None):
+        """The ranking backend to use: `requested` if valid, else the AppConfig setting."""
+        if requested in SCORING_BACKENDS:
+            return requested
+        configured = AppConfig.get_value('recommendation_scoring_backend', DEFAULT_SCORING_BACKEND)
+        return configured if configured in SCORING_BACKENDS else DEFAULT_SCORING_BACKEND
+
+    @staticmethod
+    def mutual_filter():
+        """
+        Whether recommendations only include candidates whose own preferences
+        accept the viewer (`recommendation_mutual_filter` AppConfig key).
+        """
+        return bool(AppConfig.get_value('recommendation_mutual_filter', False))
+
+    @staticmethod
+    def faith_tag_weight():
+        """
+        Share (0-100) of the mutual score given to faith-tag similarity
+        (`faith_tag_weight` AppConfig key); 0 leaves scores unchanged.
+        """
+        try:
+            weight = int(AppConfig.get_value('faith_tag_weight', DEFAULT_FAITH_TAG_WEIGHT))
+        except (TypeError, ValueError):
+            return DEFAULT_FAITH_TAG_WEIGHT
+        return min(max(weight, 0), 100)
+
+    @staticmethod
+    def proximity_weight():
+        """
+        Share (0-100) of the mutual score given to proximity for pairs where
+        either side prefers someone near them (`proximity_weight` AppConfig key).
+        """
+        try:
+            weight = int(AppConfig.get_value('proximity_weight', DEFAULT_PROXIMITY_WEIGHT))
+        except (TypeError, ValueError):
+            return DEFAULT_PROXIMITY_WEIGHT
+        return min(max(weight, 0), 100)
+
+    @staticmethod
+    def build_ranking(user_profile, size=RECOMMENDATION_CACHE_SIZE, backend=None, seen=None):
+        """
+        Full filter-score-rank pass for one viewer. Returns a cacheable entry:
+        the top `size` ranked `ids`/`scores`/`reasons` (bitmask) arrays, plus
+        the relaxation level used. Candidates in the `seen` BloomFilter are
+        skipped before the relaxation level is chosen.
+        """
+        started_at = timezone.now()
+        prefs = MatchingService._recommendation_preferences(user_profile)
+        level_filters = MatchingService._relaxed_filters(user_profile, prefs)
+        mutual = MatchingService.mutual_filter()
+        faith_weight = MatchingService.faith_tag_weight()
+        proximity_weight = MatchingService.proximity_weight()
+
+        # Faith-tag similarity and proximity are only computed by the NumPy engine
+        if MatchingService.scoring_backend(backend) == 'sql' and not faith_weight and not proximity_weight:
+            # Filter, score, order and limit in one database pass
+            with PipelineMetrics.stage('sql_rank'):
+                viewer_row = MatchFeatureService.get_row(user_profile)
+                ids, scores, reasons, level, level_counts, complete = sql_scoring.rank(
+                    viewer_row, level_filters, size, MIN_MATCHES, mutual=mutual,
+                    unseen=None if seen is None else lambda ids: SeenFilterService.unseen(seen, ids),
+                )
+            PipelineMetrics.count(scored=level_counts[-1] if level_counts else 0)
+        else:
+            # 1. One candidate set under the loosest filters, each candidate tagged
+            # with the strictest relaxation level it satisfies
+            with PipelineMetrics.stage('filter'):
+                candidate_ids, candidate_levels = CandidateIndex.get().select_levels(level_filters)
+                if seen is not None:
+                    unseen = SeenFilterService.unseen(seen, candidate_ids)
+                    candidate_ids, candidate_levels = candidate_ids[unseen], candidate_levels[unseen]
             
-            scored_profiles_fallback.sort(key=lambda x: x['score'], reverse=True)
+            # 2. Stream the candidates through the scorer in chunks, keeping only
+            # the best `size` of every relaxation level
+            scored = 0
+            top = RelaxedTopK(len(level_filters), size)
+            with PipelineMetrics.stage('score'):
+                for batch in MatchingService.iter_scores(
+                    user_profile, candidate_ids, mutual=mutual,
+                    faith_weight=faith_weight, proximity_weight=proximity_weight,
+                ):
+                    top.push(batch, candidate_levels[np.searchsorted(candidate_ids, batch.ids)])
+                    scored += int(batch.valid.sum())
+            PipelineMetrics.count(pool_size=len(candidate_ids), scored=scored)
             
-            if len(scored_profiles_fallback) > len(scored_profiles):
-                # Use fallback results
-                scored_profiles = scored_profiles_fallback
-                is_fallback = True
-                
-                # Generate appropriate message
-                if location_pref == 'near_me':
-                    code = user_profile.current_country
-                    country_name = get_country_name(code) if code else 'your country'
-                    fallback_message = f"We didn't find enough matches in {country_name}, but here are other highly compatible profiles you might like."
-                elif location_pref == 'abroad' and target_country:
-                    country_name = get_country_name(target_country)
-                    fallback_message = f"We didn't find enough matches in {country_name}, but here are other highly compatible profiles you might like."
+            # 3. Strict ranking, relaxed only while there are fewer than MIN_MATCHES
+            with PipelineMetrics.stage('rank'):
+                ids, scores, reasons, level, level_counts, complete = top.result(MIN_MATCHES)
+
+        fallback_message = MatchingService._fallback_message(level, user_profile, prefs) if level else None
+
+        # 4. `floor` is the last kept (score, id) of a truncated ranking
+        return {
+            'ids': ids,
+            'scores': scores,
+            'reasons': reasons,
+            'complete': complete,
+            'floor': None if complete else (int(scores[-1]), int(ids[-1])),
+            'relaxation': level,
+            'level_counts': level_counts,
+            'mutual': mutual,
+            'faith_tag_weight': faith_weight,
+            'proximity_weight': proximity_weight,
+            'is_fallback': level > 0,
+            'fallback_message': fallback_message,
+            'built_at': started_at,
+            'refreshed_at': started_at,
+        }
+
+    @staticmethod
+    def refresh_ranking(user_profile, entry, changed_ids):
+        """
+        Merge changed candidates into a cached ranking: drop their old
+        positions, re-filter and re-score just them, and re-sort.
+        Returns None when the entry cannot be patched and needs a full rebuild
+        (the viewer changed, or the relaxation level may change).
+        """
+        if user_profile.pk in changed_ids:
+            return None
+
+        prefs = MatchingService._recommendation_preferences(user_profile)
+        changed = np.fromiter(changed_ids, dtype=np.int64, count=len(changed_ids))
+        # Other workers' changes must be visible to the hard filters
+        index = CandidateIndex.get(fresh=True)
+
+        level = entry['relaxation']
+        level_filters = MatchingService._relaxed_filters(user_profile, prefs)
+        if level and len(index.select(within=changed, **level_filters[level - 1])):
+            return None  # May now have enough matches at a stricter level
+
+        passing = index.select(within=changed, **level_filters[level])
+        new_ids, new_scores, new_reasons = MatchingService.score_many(
+            user_profile, passing, mutual=entry.get('mutual', False),
+            faith_weight=entry.get('faith_tag_weight', 0),
+            proximity_weight=entry.get('proximity_weight', 0),
+        ).ranked_arrays()
+
+        keep = ~np.isin(entry['ids'], changed)
+        ids = np.concatenate([entry['ids'][keep], new_ids])
+        scores = np.concatenate([entry['scores'][keep], new_scores])
+        reasons = np.concatenate([entry['reasons'][keep], new_reasons])
+        order = np.lexsort((ids, -scores))
+        ids, scores, reasons = ids[order], scores[order], reasons[order]
+
+        if entry['floor'] is not None:
+            # Beyond the floor the cached head no longer knows the full order
+            floor_score, floor_id = entry['floor']
+            inside = (scores > floor_score) | ((scores == floor_score) & (ids <= floor_id))
+            ids, scores, reasons = ids[inside], scores[inside], reasons[inside]
+
+        if level and len(ids) <= entry['level_counts'][level - 1]:
+            return None  # The stricter level would now be chosen
+        if len(ids) < MIN_MATCHES and level_filters[-1] != level_filters[level]:
+            return None  # A looser level may now be needed
+
+        return dict(entry, ids=ids, scores=scores, reasons=reasons)
+
+    @staticmethod
+    def _load_page(page_ids, only=None):
+        """{id: Profile} of a page; with `only`, just those columns (plus the reranker's)."""
+        if only is None:
+            return Profile.objects.select_related('user').prefetch_related(
+                'work_experience', 'education', 'additional_images', 'preference'
+            ).in_bulk(page_ids)
+        return Profile.objects.only(*only, *PROFILE_FEATURE_FIELDS).in_bulk(page_ids)
+
+    @staticmethod
+    def encode_cursor(score, profile_id):
+        """Opaque, signed page cursor for the ranking position (score, profile_id)."""
+        return signing.dumps([int(score), int(profile_id)], salt=CURSOR_SALT, compress=True)
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """(score, profile_id) of a page cursor; raises signing.BadSignature if tampered with."""
+        score, profile_id = signing.loads(cursor, salt=CURSOR_SALT)
+        return int(score), int(profile_id)
+
+    @staticmethod
+    def _page_start(entry, after):
+        """Position in a ranked entry of the first candidate ranked after `after` (score, id)."""
+        if after is None:
+            return 0
+        score, profile_id = after
+        keys = rank_keys(entry['ids'], entry['scores'])
+        return int(np.searchsorted(keys, rank_keys(profile_id, score), side='right'))
+
+    @staticmethod
+    def _unseen(entry, seen):
+        """The entry without candidates in the `seen` BloomFilter (the same entry if None)."""
+        if seen is None:
+            return entry
+        unseen = SeenFilterService.unseen(seen, entry['ids'])
+        if unseen.all():
+            return entry
+        return dict(entry, ids=entry['ids'][unseen], scores=entry['scores'][unseen], reasons=entry['reasons'][unseen])
+
+    @staticmethod
+    def _build_page_ranking(user_profile, after, limit, backend=None, seen=None):
+        """
+        build_ranking deep enough to hold the page after `after`; the kept
+        head is doubled until it does, so deep pages are cached afterwards.
+        Returns (entry to cache, entry without seen candidates, page start).
+        """
+        size = RECOMMENDATION_CACHE_SIZE
+        while True:
+            entry = MatchingService.build_ranking(user_profile, size=size, backend=backend, seen=seen)
+            visible = MatchingService._unseen(entry, seen)
+            start = MatchingService._page_start(visible, after)
+            if start + limit <= len(visible['ids']) or entry['complete']:
+                return entry, visible, start
+            size = 2 * max(size, start + limit)
+
+    @staticmethod
+    def more_like_this(user_profile, profile_id, k=10):
+        """
+        (ids, similarities) of the `k` profiles whose attributes are most like
+        profile `profile_id` (EmbeddingIndex cosine similarity), among the
+        activated profiles passing user_profile's hard filters; best first.
+        """
+        index = EmbeddingIndex.get()
+        vector = index.vector(profile_id)
+        if vector is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        filters = {'exclude_ids': []}
+        if user_profile is not None:
+            filters = MatchingService._hard_filters(
+                user_profile, MatchingService._recommendation_preferences(user_profile)
+            )
+        filters['exclude_ids'] = list(filters['exclude_ids']) + [profile_id]
+        filters['activated_only'] = True
+        candidates = CandidateIndex.get()
+        return index.nearest(vector, k, allowed=lambda ids: candidates.select(within=ids, **filters))
+
+    @staticmethod
+    def get_ranked_recommendations(user_profile, limit=5, use_cache=True, after=None, backend=None, seen=None, only=None):
+        """
+        Fetches and ranks potential matches based on compatibility.
+        `after` is the (score, profile_id) of the previous page's last match
+        (see decode_cursor); the page continues right after it. `backend`
+        picks the ranking backend for a rebuild (see scoring_backend).
+        Candidates in the `seen` filter (SeenFilterService.get) are skipped;
+        if that leaves no first page, every candidate was seen before and the
+        ranking is rebuilt with the filter renewed from the viewer's
+        interactions only, returned as 'seen' (to be saved by the caller).
+        Each page is reordered by the active learned reranker, if any.
+        `only` restricts the Profile columns loaded for the page (default: all,
+        with the rows ProfileSerializer nests prefetched).
+        Returns dict with 'matches' (list of scored profiles), 'is_fallback' (bool), 
+        'fallback_message' (str or None), 'next_cursor' (str or None),
+        'seen' and 'cache' (hit/precomputed/miss and age of the ranking the
+        lookup found, number of candidates merged into it).
+        """
+        cache_status = 'miss'
+        refreshed = 0
+        entry = None
+        if use_cache:
+            with PipelineMetrics.stage('cache'):
+                entry = RecommendationCache.get(user_profile.pk)
+                found_status = 'hit'
+                if entry is None:
+                    # No cached ranking yet: start from the nightly precomputed one
+                    entry = RecommendationCache.precomputed(user_profile.pk)
+                    found_status = 'precomputed'
+
+        # 1. Stored ranking: merge candidates that changed since it was last checked
+        if entry is not None and (
+            entry.get('mutual', False) != MatchingService.mutual_filter()
+            or entry.get('faith_tag_weight', 0) != MatchingService.faith_tag_weight()
+            or entry.get('proximity_weight', 0) != MatchingService.proximity_weight()
+        ):
+            entry = None  # Built under other mutual-filter or blending settings
+        if entry is not None:
+            checked_at = timezone.now()
+            with PipelineMetrics.stage('refresh'):
+                changed_ids = RecommendationCache.changed_since(entry['refreshed_at'])
+                if len(changed_ids) > RECOMMENDATION_MAX_MERGE:
+                    entry = None
+                elif changed_ids:
+                    entry = MatchingService.refresh_ranking(user_profile, entry, changed_ids)
+                    refreshed = len(changed_ids)
+            if entry is not None:
+                entry['refreshed_at'] = checked_at
+                if changed_ids or found_status == 'precomputed':
+                    RecommendationCache.set(user_profile.pk, entry)
+                # Candidates seen since the entry was built are dropped from the page
+                entry = MatchingService._unseen(entry, seen)
+                # A truncated head may be too short for this page
+                start = MatchingService._page_start(entry, after)
+                if start + limit <= len(entry['ids']) or entry['complete']:
+                    cache_status = found_status
                 else:
-                    fallback_message = "We didn't find enough matches with your location preference, but here are other highly compatible profiles you might like."
-        
-        # 6. Take top N
-        top_matches = scored_profiles[:limit]
+                    entry = None
+
+        # 2. Miss: full filter-score-rank pass
+        if entry is None:
+            built, entry, start = MatchingService._build_page_ranking(user_profile, after, limit, backend, seen)
+            if use_cache:
+                RecommendationCache.set(user_profile.pk, built)
+        built_at = entry['built_at']
+
+        # 3. Every candidate was shown before: start over, still skipping interactions
+        if after is None and seen is not None and not len(entry['ids']):
+            with PipelineMetrics.stage('seen'):
+                seen = SeenFilterService.renew(user_profile.pk, stored_at=seen.stored_at)
+            built, entry, start = MatchingService._build_page_ranking(user_profile, after, limit, backend, seen)
+            if use_cache:
+                RecommendationCache.set(user_profile.pk, built)
+
+        # 4. Take the page - only these are loaded as model instances
+        page_ids = [int(pid) for pid in entry['ids'][start:start + limit]]
+        with PipelineMetrics.stage('prefetch'):
+            profiles = MatchingService._load_page(page_ids, only)
+        if len(profiles) < len(page_ids) and cache_status != 'miss':
+            # Hard-deleted candidates never show up as changed: drop them and refill
+            built, entry, start = MatchingService._build_page_ranking(user_profile, after, limit, backend, seen)
+            RecommendationCache.set(user_profile.pk, built)
+            cache_status = 'miss'
+            built_at = entry['built_at']
+            page_ids = [int(pid) for pid in entry['ids'][start:start + limit]]
+            with PipelineMetrics.stage('prefetch'):
+                profiles = MatchingService._load_page(page_ids, only)
+        page = slice(start, start + limit)
+        ranked = [
+            (profile_id, int(score), int(bits))
+            for profile_id, score, bits in zip(page_ids, entry['scores'][page], entry['reasons'][page])
+            if profile_id in profiles
+        ]
+        # The learned reranker only reorders within the page, so cursors are unaffected
+        with PipelineMetrics.stage('rerank'):
+            ranked = RerankerService.rerank(ranked, profiles)
+        top_matches = [
+            {'profile': profiles[profile_id], 'score': score, 'reasons': reason_labels(bits)}
+            for profile_id, score, bits in ranked
+        ]
+
+        # 5. Cursor at the page's last (score, id), if anything is ranked after it
+        next_cursor = None
+        end = min(start + limit, len(entry['ids']))
+        if end > start and (end < len(entry['ids']) or not entry['complete']):
+            next_cursor = MatchingService.encode_cursor(entry['scores'][end - 1], entry['ids'][end - 1])
+
+        PipelineMetrics.count(fallback=entry['is_fallback'], **{f'cache_{cache_status}': True})
         
         return {
             'matches': top_matches,
-            'is_fallback': is_fallback,
-            'fallback_message': fallback_message
+            'is_fallback': entry['is_fallback'],
+            'fallback_message': entry['fallback_message'],
+            'next_cursor': next_cursor,
+            'seen': seen,
+            'cache': {
+                'status': cache_status,
+                'age_seconds': round((timezone.now() - built_at).total_seconds(), 1),
+                'refreshed_candidates': refreshed,
+            },
         }
@@ -0,0 +1,157 @@
+"""
+Cache of mutual compatibility scores per profile pair.
+
+The mutual score is symmetric, so a pair is stored once under
+(min_id, max_id). A score is a function of the two profiles' MatchFeatures
+rows, the date (ages - and so age scores - move with it) and the faith-tag
+and proximity weights, so all of them are part of the key. The rows'
+updated_at stamps are read from the database on every lookup: a refreshed
+row changes the key on every worker at once, and stale entries are never
+read again and simply expire. Profiles without a row yet are scored but
+not cached.
+
+Two tiers: a per-worker LRU in front of Django's cache. get_many scores
+every pair missing from both in one score_many batch.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+from django.core.cache import cache
+
+from ..models import MatchFeatures, Profile
+from .scoring_engine import reason_labels
+
+
+# Pairs kept in each worker's in-process tier
+PAIR_SCORE_LOCAL_SIZE = 20000
+
+# Shared-tier entries are dated, so a day is the longest they can be used
+PAIR_SCORE_TIMEOUT = 24 * 60 * 60
+
+# Stored for pairs calculate_compatibility_score does not score (e.g. same gender)
+NOT_SCOREABLE = False
+
+
+class PairScoreCache:
+
+    _local = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _pair_key(a, b, versions, today, faith_weight, proximity_weight):
+        low, high = (a, b) if a < b else (b, a)
+        return (
+            f'pair:{low}:{high}:{versions[low]}:{versions[high]}:{today.toordinal()}'
+            f':{faith_weight}:{proximity_weight}'
+        )
+
+    @staticmethod
+    def versions(profile_ids):
+        """
+        {profile_id: version} of the profiles' MatchFeatures rows (updated_at
+        in microseconds), in one query. Profiles without a row are left out.
+        """
+        rows = MatchFeatures.objects.filter(profile_id__in=list(profile_ids)).values_list('profile_id', 'updated_at')
+        return {pid: round(updated_at.timestamp() * 1_000_000) for pid, updated_at in rows}
+
+    # --- In-process tier ----------------------------------------------------
+
+    @classmethod
+    def _local_get(cls, keys):
+        found = {}
+        with cls._lock:
+            for key in keys:
+                if key in cls._local:
+                    cls._local.move_to_end(key)
+                    found[key] = cls._local[key]
+        return found
+
+    @classmethod
+    def _local_set(cls, values):
+        with cls._lock:
+            cls._local.update(values)
+            for key in values:
+                cls._local.move_to_end(key)
+            while len(cls._local) > PAIR_SCORE_LOCAL_SIZE:
+                cls._local.popitem(last=False)
+
+    @classmethod
+    def clear_local(cls):
+        with cls._lock:
+            cls._local.clear()
+
+    # --- Lookups ------------------------------------------------------------
+
+    @staticmethod
+    def get_many(user_profile, candidates, viewer_row=None):
+        """
+        {candidate_id: {'score', 'reasons'} or None} for Profile instances or
+        IDs, in calculate_compatibility_score format. Pairs found in neither
+        tier are scored together in a single MatchingService.score_many call.
+        """
+        from .matching_service import MatchingService
+
+        candidate_ids = {p.pk if isinstance(p, Profile) else int(p) for p in candidates}
+        candidate_ids.discard(user_profile.pk)
+        if not candidate_ids:
+            return {}
+
+        # 1. Keys from the current MatchFeatures versions of everyone involved
+        today = date.today()
+        faith_weight = MatchingService.faith_tag_weight()
+        proximity_weight = MatchingService.proximity_weight()
+        versions = PairScoreCache.versions(candidate_ids | {user_profile.pk})
+        keys = {
+            pid: PairScoreCache._pair_key(user_profile.pk, pid, versions, today, faith_weight, proximity_weight)
+            if pid in versions and user_profile.pk in versions else None
+            for pid in candidate_ids
+        }
+
+        # 2. In-process tier, then the shared tier for the rest
+        cacheable = [key for key in keys.values() if key is not None]
+        stored = PairScoreCache._local_get(cacheable)
+        remaining = [key for key in cacheable if key not in stored]
+        if remaining:
+            shared = cache.get_many(remaining)
+            PairScoreCache._local_set(shared)
+            stored.update(shared)
+
+        # 3. Score every miss in one batch and write both tiers
+        misses = [pid for pid, key in keys.items() if key not in stored]
+        uncached = {}
+        if misses:
+            batch = MatchingService.score_many(
+                user_profile, misses, viewer_row=viewer_row,
+                faith_weight=faith_weight, proximity_weight=proximity_weight,
+            )
+            scored = dict(zip(batch.ids.tolist(), zip(
+                batch.scores.tolist(), batch.reasons.tolist(), batch.valid.tolist()
+            )))
+            new = {}
+            for pid in misses:
+                score, bits, valid = scored.get(pid, (0, 0, False))
+                value = (score, bits) if valid else NOT_SCOREABLE
+                if keys[pid] is None:
+                    uncached[pid] = value
+                else:
+                    new[keys[pid]] = value
+            if new:
+                cache.set_many(new, PAIR_SCORE_TIMEOUT)
+                PairScoreCache._local_set(new)
+            stored.update(new)
+
+        results = {}
+        for pid, key in keys.items():
+            value = stored[key] if key is not None else uncached[pid]
+            results[pid] = None if value is NOT_SCOREABLE else {
+                'score': value[0], 'reasons': reason_labels(value[1])
+            }
+        return results
+
+    @staticmethod
+    def get(user_profile, other_profile, viewer_row=None):
+        """Cached calculate_compatibility_score for one pair."""
+        if not user_profile or not other_profile:
+            return None
+        return PairScoreCache.get_many(user_profile, [other_profile], viewer_row=viewer_row).get(other_profile.pk)
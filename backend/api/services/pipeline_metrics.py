@@ -0,0 +1,235 @@
+"""
+Per-stage timing of the recommendation pipeline.
+
+A request opens a PipelineTrace (PipelineMetrics.start); code anywhere
+below it wraps its work in PipelineMetrics.stage(name), which records the
+wall time and number of database queries of that stage, and reports sizes
+with PipelineMetrics.count(). Outside a trace both are no-ops, so batch jobs
+calling the same code pay nothing.
+
+Finished traces become a Server-Timing header for the response and are
+added to this worker's histograms. Each worker writes its histograms to
+Django's cache every METRICS_FLUSH_INTERVAL seconds; snapshot() merges all
+workers for the admin metrics endpoint.
+"""
+import contextvars
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection
+
+
+# Upper bounds of the stage duration histogram buckets (the last bucket is open)
+DURATION_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Upper bounds of the pool size / scored count histogram buckets
+COUNT_BUCKETS = (0, 10, 100, 1000, 10000, 100000, 1000000)
+
+# Counters kept as histograms; any other counter is summed
+HISTOGRAM_COUNTERS = ('pool_size', 'scored')
+
+# Seconds between writes of a worker's histograms to the shared cache
+METRICS_FLUSH_INTERVAL = 30
+
+# Workers that stop writing drop out of the merged histograms after this
+METRICS_TIMEOUT = 24 * 60 * 60
+
+METRICS_WORKERS_KEY = 'metrics:recommendations:workers'
+
+_current_trace = contextvars.ContextVar('recommendation_trace', default=None)
+
+
+def _bucket(value, bounds):
+    """Index of the histogram bucket holding `value`."""
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            return i
+    return len(bounds)
+
+
+class PipelineTrace:
+    """Stages and counters of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total_ms = None
+        self.stages = {}  # name -> [duration_ms, queries]; repeated stages add up
+        self.counters = {}
+
+    def add_stage(self, name, duration_ms, queries):
+        stage = self.stages.setdefault(name, [0.0, 0])
+        stage[0] += duration_ms
+        stage[1] += queries
+
+    def server_timing(self):
+        """Server-Timing header value: every stage, then the counters."""
+        metrics = [
+            f'{name};dur={duration:.1f};desc="{queries} queries"'
+            for name, (duration, queries) in self.stages.items()
+        ]
+        if self.total_ms is not None:
+            metrics.append(f'total;dur={self.total_ms:.1f}')
+        metrics += [f'{name};desc="{value}"' for name, value in self.counters.items()]
+        return ', '.join(metrics)
+
+
+class PipelineMetrics:
+
+    _lock = threading.Lock()
+    _histograms = None
+    _last_flush = 0.0
+    _worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    # --- Tracing ------------------------------------------------------------
+
+    @staticmethod
+    def start():
+        """Open a trace for the current request (close it with finish())."""
+        trace = PipelineTrace()
+        trace.token = _current_trace.set(trace)
+        return trace
+
+    @staticmethod
+    def finish(trace):
+        """Close the trace and add it to this worker's histograms."""
+        trace.total_ms = (time.perf_counter() - trace.started) * 1000
+        _current_trace.reset(trace.token)
+        PipelineMetrics._record(trace)
+        return trace
+
+    @staticmethod
+    @contextmanager
+    def stage(name):
+        """Time a stage of the current trace, counting its database queries."""
+        trace = _current_trace.get()
+        if trace is None:
+            yield
+            return
+
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            trace.add_stage(name, (time.perf_counter() - started) * 1000, queries[0])
+
+    @staticmethod
+    def count(**values):
+        """Record counters (pool size, scored count, fallback, ...) on the current trace."""
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.counters.update(values)
+
+    # --- Histograms ---------------------------------------------------------
+
+    @staticmethod
+    def _empty():
+        return {'requests': 0, 'stages': {}, 'counters': {}}
+
+    @classmethod
+    def _record(cls, trace):
+        with cls._lock:
+            if cls._histograms is None:
+                cls._histograms = cls._empty()
+            histograms = cls._histograms
+            histograms['requests'] += 1
+
+            stages = dict(trace.stages, total=(trace.total_ms, 0))
+            for name, (duration, queries) in stages.items():
+                stage = histograms['stages'].setdefault(name, {
+                    'count': 0, 'sum_ms': 0.0, 'queries': 0,
+                    'buckets': [0] * (len(DURATION_BUCKETS_MS) + 1),
+                })
+                stage['count'] += 1
+                stage['sum_ms'] += duration
+                stage['queries'] += queries
+                stage['buckets'][_bucket(duration, DURATION_BUCKETS_MS)] += 1
+
+            for name, value in trace.counters.items():
+                if name in HISTOGRAM_COUNTERS:
+                    buckets = histograms['counters'].setdefault(name, [0] * (len(COUNT_BUCKETS) + 1))
+                    buckets[_bucket(value, COUNT_BUCKETS)] += 1
+                elif isinstance(value, (bool, int)):
+                    histograms['counters'][name] = histograms['counters'].get(name, 0) + int(value)
+
+            due = time.monotonic() - cls._last_flush >= METRICS_FLUSH_INTERVAL
+        if due:
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Write this worker's histograms to the shared cache."""
+        with cls._lock:
+            cls._last_flush = time.monotonic()
+            if cls._histograms is None:
+                return
+            snapshot = {
+                'requests': cls._histograms['requests'],
+                'stages': {name: dict(stage, buckets=list(stage['buckets']))
+                           for name, stage in cls._histograms['stages'].items()},
+                'counters': {name: list(value) if isinstance(value, list) else value
+                             for name, value in cls._histograms['counters'].items()},
+            }
+
+        cache.set(f'metrics:recommendations:{cls._worker_id}', snapshot, METRICS_TIMEOUT)
+        workers = cache.get(METRICS_WORKERS_KEY) or []
+        if cls._worker_id not in workers:
+            cache.set(METRICS_WORKERS_KEY, workers + [cls._worker_id], METRICS_TIMEOUT)
+
+    @staticmethod
+    def snapshot():
+        """Histograms of every worker that flushed within METRICS_TIMEOUT, merged."""
+        PipelineMetrics.flush()
+        workers = cache.get(METRICS_WORKERS_KEY) or []
+        found = cache.get_many([f'metrics:recommendations:{worker}' for worker in workers])
+
+        merged = PipelineMetrics._empty()
+        for histograms in found.values():
+            merged['requests'] += histograms['requests']
+            for name, stage in histograms['stages'].items():
+                total = merged['stages'].setdefault(name, {
+                    'count': 0, 'sum_ms': 0.0, 'queries': 0,
+                    'buckets': [0] * (len(DURATION_BUCKETS_MS) + 1),
+                })
+                total['count'] += stage['count']
+                total['sum_ms'] += stage['sum_ms']
+                total['queries'] += stage['queries']
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], stage['buckets'])]
+            for name, value in histograms['counters'].items():
+                if isinstance(value, list):
+                    current = merged['counters'].get(name, [0] * len(value))
+                    merged['counters'][name] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged['counters'][name] = merged['counters'].get(name, 0) + value
+
+        # Readable form: bucket upper bounds next to their counts
+        stages = {
+            name: {
+                'count': stage['count'],
+                'mean_ms': round(stage['sum_ms'] / stage['count'], 2) if stage['count'] else None,
+                'mean_queries': round(stage['queries'] / stage['count'], 2) if stage['count'] else None,
+                'histogram_ms': [
+                    {'le': bound, 'count': count}
+                    for bound, count in zip(DURATION_BUCKETS_MS + (None,), stage['buckets'])
+                ],
+            }
+            for name, stage in merged['stages'].items()
+        }
+        counters = {
+            name: (
+                [{'le': bound, 'count': count} for bound, count in zip(COUNT_BUCKETS + (None,), value)]
+                if isinstance(value, list) else value
+            )
+            for name, value in merged['counters'].items()
+        }
+        return {'workers': len(found), 'requests': merged['requests'], 'stages': stages, 'counters': counters}
@@ -0,0 +1,168 @@
+"""
+Profession vocabulary and per-worker profession index.
+
+Job titles are canonicalized into Profession rows when MatchFeatures are
+written (canonical_ids). Each worker keeps a ProfessionMatcher over the
+vocabulary (token/prefix lookups resolving a preferred profession to title
+IDs) and posting lists of profile IDs per profession, which answer "profiles
+with profession X" without scanning WorkExperience titles. Querysets are
+narrowed in the database instead (profile_filter): the term is resolved to
+profession IDs here and tested against the GIN-indexed
+MatchFeatures.profession_ids, so no profile ID list is sent with the query.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Profession, MatchFeatures
+from .candidate_index import EMPTY, REBUILD_INTERVAL_SECONDS, SYNC_INTERVAL_SECONDS, union, _insert, _remove
+from .scoring_engine import ProfessionMatcher, normalize_profession, profession_tokens
+
+
+class ProfessionIndex:
+    """Profession vocabulary matcher plus profile posting lists per profession ID."""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.matcher = ProfessionMatcher()
+        self.postings = {}      # profession id -> sorted profile ids
+        self.by_profile = {}    # profile id -> profession ids
+        self.synced_at = None
+        self._synced_monotonic = 0.0
+        self._built_monotonic = 0.0
+
+    # --- Access -------------------------------------------------------------
+
+    @classmethod
+    def get(cls):
+        """This worker's index, built on first use and synced when stale."""
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                cls._instance.rebuild()
+            else:
+                cls._instance._sync_if_stale()
+            return cls._instance
+
+    @classmethod
+    def matcher_for(cls, profession_ids=()):
+        """
+        The worker's matcher, made to know every ID in `profession_ids`
+        (vocabulary rows created since the last sync are read first).
+        """
+        index = cls.get()
+        if any(pid not in index.matcher.names for pid in profession_ids):
+            with cls._lock:
+                index._sync_vocabulary()
+        return index.matcher
+
+    @classmethod
+    def notify_saved(cls, profile_id, profession_ids):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.update(profile_id, profession_ids)
+
+    @classmethod
+    def notify_deleted(cls, profile_id):
+        with cls._lock:
+            if cls._instance is not None:
+                cls._instance.update(profile_id, ())
+
+    # --- Vocabulary ---------------------------------------------------------
+
+    @staticmethod
+    def canonical_ids(titles):
+        """
+        Profession IDs for a list of job titles (same order), creating
+        vocabulary rows for titles not seen before.
+        """
+        names = [normalize_profession(title)[:120] for title in titles]
+        if not names:
+            return []
+        known = dict(Profession.objects.filter(name__in=set(names)).values_list('name', 'id'))
+        missing = set(names) - set(known)
+        if missing:
+            Profession.objects.bulk_create(
+                [Profession(name=name) for name in missing], ignore_conflicts=True
+            )
+            known.update(Profession.objects.filter(name__in=missing).values_list('name', 'id'))
+        return [known[name] for name in names]
+
+    # --- Maintenance --------------------------------------------------------
+
+    def rebuild(self):
+        started_at = timezone.now()
+        self.matcher = ProfessionMatcher(dict(Profession.objects.values_list('id', 'name')))
+
+        grouped = {}
+        self.by_profile = {}
+        records = MatchFeatures.objects.exclude(profession_ids=[]).order_by('profile_id')
+        for profile_id, profession_ids in records.values_list('profile_id', 'profession_ids'):
+            self.by_profile[profile_id] = tuple(profession_ids)
+            for profession_id in set(profession_ids):
+                grouped.setdefault(profession_id, []).append(profile_id)
+
+        # Profile IDs arrive in ascending order, so posting lists are sorted
+        self.postings = {pid: np.array(ids, dtype=np.int64) for pid, ids in grouped.items()}
+        self.synced_at = started_at
+        self._synced_monotonic = self._built_monotonic = time.monotonic()
+
+    def _sync_if_stale(self):
+        now = time.monotonic()
+        if now - self._built_monotonic > REBUILD_INTERVAL_SECONDS:
+            self.rebuild()
+        elif now - self._synced_monotonic > SYNC_INTERVAL_SECONDS:
+            self.sync()
+
+    def _sync_vocabulary(self):
+        newest = max(self.matcher.names, default=0)
+        for profession_id, name in Profession.objects.filter(id__gt=newest).values_list('id', 'name'):
+            self.matcher.add(profession_id, name)
+
+    def sync(self):
+        """Apply vocabulary rows and MatchFeatures changed (by any worker) since the last sync."""
+        started_at = timezone.now()
+        self._sync_vocabulary()
+        since = self.synced_at - timedelta(seconds=1)
+        changed = MatchFeatures.objects.filter(updated_at__gte=since)
+        for profile_id, profession_ids in changed.values_list('profile_id', 'profession_ids'):
+            self.update(profile_id, profession_ids)
+        self.synced_at = started_at
+        self._synced_monotonic = time.monotonic()
+
+    def update(self, profile_id, profession_ids):
+        new = set(profession_ids)
+        old = set(self.by_profile.get(profile_id, ()))
+        for profession_id in old - new:
+            self.postings[profession_id] = _remove(self.postings.get(profession_id, EMPTY), profile_id)
+        for profession_id in new - old:
+            self.postings[profession_id] = _insert(self.postings.get(profession_id, EMPTY), profile_id)
+        if new:
+            self.by_profile[profile_id] = tuple(profession_ids)
+        else:
+            self.by_profile.pop(profile_id, None)
+
+    # --- Queries ------------------------------------------------------------
+
+    def profiles_with(self, term):
+        """Sorted IDs of profiles with a job title matching `term` (see profession_matches)."""
+        return union([self.postings.get(pid, EMPTY) for pid in self.matcher.resolve(term)])
+
+    def profile_filter(self, term):
+        """
+        Q on Profile for a job title matching `term`: a containment test per
+        resolved profession ID on MatchFeatures.profession_ids (or any title
+        at all, for a term without words).
+        """
+        if not profession_tokens(term):
+            return Q(match_features__isnull=False) & ~Q(match_features__profession_ids=[])
+        any_profession = Q(pk__in=[])
+        for profession_id in sorted(self.matcher.resolve(term)):
+            any_profession |= Q(match_features__profession_ids__contains=[profession_id])
+        return any_profession
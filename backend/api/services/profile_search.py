@@ -0,0 +1,134 @@
+"""
+Full-text search over profiles for discovery.
+
+Profile.search_document is a weighted tsvector of the searchable text -
+name (A), current and origin city (B), job titles and looking_for (C) and
+about (D) - kept up to date from the Profile/WorkExperience save signals
+and GIN-indexed, so a search is one index scan ranked by ts_rank instead of
+a six-way icontains over a work_experience join. Names and cities also have
+trigram GIN indexes, which match misspellings ("Rahmn", "Chittagon") that
+the lexemes miss.
+"""
+import re
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db.models import BooleanField, F, FloatField, Func, OuterRef, Q, Subquery
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from ..models import Profile, WorkExperience
+
+
+SEARCH_CONFIG = 'english'
+
+# At most this many words of a search term are used
+MAX_QUERY_WORDS = 8
+
+# Lexeme weights of the fields an ?interest= search looks at (titles, looking_for, about)
+INTEREST_WEIGHTS = '{c,d}'
+
+_WORD_RE = re.compile(r'\w+')
+
+
+class WeightedMatch(Func):
+    """`vector @@ query` over only the lexemes of the given weights (ts_filter)."""
+    output_field = BooleanField()
+
+    def __init__(self, vector, weights, query):
+        super().__init__(vector, query)
+        self.weights = weights
+
+    def as_sql(self, compiler, connection, **extra_context):
+        vector, vector_params = compiler.compile(self.source_expressions[0])
+        query, query_params = compiler.compile(self.source_expressions[1])
+        return f'ts_filter({vector}, %s::"char"[]) @@ {query}', (*vector_params, self.weights, *query_params)
+
+
+def search_document():
+    """Expression computing a profile's search_document in the database (for update())."""
+    titles = (
+        WorkExperience.objects.filter(profile=OuterRef('pk'))
+        .order_by().values('profile')
+        .annotate(titles=StringAgg('title', ' '))
+        .values('titles')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('current_city', 'origin_city', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(titles), 'looking_for', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('about', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def search_query(term):
+    """Prefix tsquery of every word of `term` ("soft eng" matches "software engineer"), or None."""
+    words = _WORD_RE.findall(term.lower())[:MAX_QUERY_WORDS]
+    if not words:
+        return None
+    # \w+ words carry no tsquery operators, so the raw form is safe
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+class ProfileSearchService:
+
+    @staticmethod
+    def refresh(profile_id):
+        """Recompute one profile's search document (one UPDATE)."""
+        Profile.objects.filter(pk=profile_id).update(search_document=search_document())
+
+    @staticmethod
+    def rebuild(queryset=None, batch_size=1000):
+        """
+        Recompute the documents of all (or the given) profiles in id-ordered
+        batches. Yields the number of rows written per batch.
+        """
+        queryset = queryset if queryset is not None else Profile.objects.all()
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), batch_size):
+            yield Profile.objects.filter(id__in=ids[start:start + batch_size]).update(
+                search_document=search_document()
+            )
+
+    @staticmethod
+    def search(queryset, term):
+        """
+        Profiles matching every word of `term` (as a word prefix in any
+        searchable field) or with a name or current city similar to it,
+        best matches first.
+        """
+        term = term.strip()
+        query = search_query(term)
+        if query is None:
+            return queryset.none()
+        return queryset.filter(
+            Q(search_document=query)
+            | Q(name__trigram_word_similar=term)
+            | Q(current_city__trigram_word_similar=term)
+        ).annotate(
+            # ts_rank and similarity are real (float4); cast so the rank read back
+            # into a keyset cursor compares equal to the column in SQL
+            search_rank=Cast(Coalesce(SearchRank(F('search_document'), query), 0.0) + Coalesce(Greatest(
+                TrigramWordSimilarity(term, 'name'), TrigramWordSimilarity(term, 'current_city')
+            ), 0.0), FloatField())
+        ).order_by('-search_rank', 'id')
+
+    @staticmethod
+    def search_interests(queryset, term):
+        """Profiles whose job titles, looking_for or about match every word of `term`, best first."""
+        query = search_query(term.strip())
+        if query is None:
+            return queryset.none()
+        # The plain @@ uses the GIN index; ts_filter then drops name/city-only matches
+        queryset = queryset.filter(
+            Q(search_document=query), WeightedMatch(F('search_document'), INTEREST_WEIGHTS, query)
+        )
+        if queryset.query.order_by:
+            return queryset   # already ranked by search()
+        # ts_rank weights are {D, C, B, A}
+        return queryset.annotate(
+            interest_rank=Cast(
+                SearchRank(F('search_document'), query, weights=[0.1, 0.4, 0.0, 0.0]), FloatField()
+            )
+        ).order_by('-interest_rank', 'id')
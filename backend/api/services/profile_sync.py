@@ -0,0 +1,93 @@
+"""
+Deferred, coalesced upkeep of everything derived from a profile.
+
+A profile save used to run every derived refresh from its own signal
+receiver, once per saved row: the MatchFeatures row, the search document,
+this worker's candidate/profession/embedding indexes, the map tiles and the
+recommendation cache stamp. Saving a profile with its preference and three
+job titles refreshed them five times, and inside the transaction that could
+still roll back.
+
+The receivers now only record what changed (schedule); the work runs once
+per profile when the transaction commits (transaction.on_commit), however
+many of its rows were written. Outside a transaction on_commit runs
+immediately, so behaviour without an atomic block is unchanged.
+"""
+import threading
+
+from django.db import transaction
+
+
+# What a flush can do for one profile
+FEATURES = 'features'   # MatchFeatures row (+ profession index) and recommendation cache stamp
+SEARCH = 'search'       # full-text search document
+
+
+class ProfileSyncService:
+
+    _pending = threading.local()
+
+    @classmethod
+    def _entries(cls):
+        entries = getattr(cls._pending, 'entries', None)
+        if entries is None:
+            entries = cls._pending.entries = {}
+        return entries
+
+    @classmethod
+    def schedule(cls, profile_id, refresh=(), instance=None, map_cities=(), map_all=False, deleted=False):
+        """
+        Record work for `profile_id` and run it when the current transaction
+        commits. Calls for the same profile before the commit are merged.
+        `instance` is the saved Profile (re-read by this worker's indexes).
+        """
+        if profile_id is None:
+            return
+        entry = cls._entries().setdefault(profile_id, {
+            'refresh': set(), 'instance': None, 'map_cities': set(), 'map_all': False, 'deleted': False,
+        })
+        entry['refresh'].update(refresh)
+        entry['map_cities'].update(map_cities)
+        entry['map_all'] = entry['map_all'] or map_all
+        entry['deleted'] = entry['deleted'] or deleted
+        if instance is not None:
+            entry['instance'] = instance
+        # Every call registers a flush; the first one to run takes the entry. A
+        # rolled-back transaction drops its callbacks but leaves the entry, which
+        # the next scheduled change for the profile then flushes along with it.
+        transaction.on_commit(lambda: cls.flush(profile_id), robust=True)
+
+    @classmethod
+    def flush(cls, profile_id):
+        """Run the pending work of one profile (no-op if already flushed)."""
+        entry = cls._entries().pop(profile_id, None)
+        if entry is None:
+            return
+        from .candidate_index import CandidateIndex
+        from .embedding_index import EmbeddingIndex
+        from .map_tiles import MapService
+        from .match_features import MatchFeatureService
+        from .profession_index import ProfessionIndex
+        from .profile_search import ProfileSearchService
+        from .recommendation_cache import RecommendationCache
+
+        if entry['deleted']:
+            CandidateIndex.notify_deleted(profile_id)
+            ProfessionIndex.notify_deleted(profile_id)
+            EmbeddingIndex.notify_deleted(profile_id)
+        else:
+            if FEATURES in entry['refresh']:
+                MatchFeatureService.refresh(profile_id)
+                # The profile's own cached recommendations depend on these inputs
+                # (cached pair scores are keyed by the row's updated_at instead)
+                RecommendationCache.invalidate(profile_id)
+            if SEARCH in entry['refresh']:
+                ProfileSearchService.refresh(profile_id)
+            if entry['instance'] is not None:
+                CandidateIndex.notify_saved(entry['instance'])
+                EmbeddingIndex.notify_saved(entry['instance'])
+
+        if entry['map_all']:
+            MapService.invalidate_all()
+        elif entry['map_cities']:
+            MapService.invalidate(list(entry['map_cities']))
@@ -0,0 +1,107 @@
+"""
+Per-viewer cache of ranked recommendation lists.
+
+Entries live in Django's cache under a key made of the viewer's profile ID
+and a version stamp. The stamp is bumped whenever the viewer's own profile,
+preference or work history changes, which makes the old entry unreachable.
+Candidate changes do not invalidate entries: they are merged into the cached
+ranking on the next read (see MatchingService.get_ranked_recommendations).
+"""
+import time
+
+import numpy as np
+from django.core.cache import cache
+
+from ..models import Profile, MatchFeatures, PrecomputedMatch
+
+
+# Ranked candidates kept per viewer; paging past them rebuilds a deeper ranking
+RECOMMENDATION_CACHE_SIZE = 200
+
+# Entries are dropped after a day even if nothing changed
+RECOMMENDATION_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Beyond this many changed candidates a full recompute is cheaper than a merge
+RECOMMENDATION_MAX_MERGE = 5000
+
+
+class RecommendationCache:
+
+    @staticmethod
+    def _version_key(profile_id):
+        return f'recs:version:{profile_id}'
+
+    @staticmethod
+    def _entry_key(profile_id, version):
+        return f'recs:{profile_id}:{version}'
+
+    @staticmethod
+    def version(profile_id):
+        """
+        The viewer's current version stamp. A missing (or evicted) stamp starts
+        from the clock, so it can never point back at an entry written earlier.
+        """
+        key = RecommendationCache._version_key(profile_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), None)
+            version = cache.get(key)
+        return version
+
+    @staticmethod
+    def invalidate(profile_id):
+        """Bump the viewer's version stamp so the current entry is never read again."""
+        key = RecommendationCache._version_key(profile_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+    @staticmethod
+    def get(profile_id):
+        version = RecommendationCache.version(profile_id)
+        return cache.get(RecommendationCache._entry_key(profile_id, version))
+
+    @staticmethod
+    def set(profile_id, entry):
+        version = RecommendationCache.version(profile_id)
+        cache.set(
+            RecommendationCache._entry_key(profile_id, version), entry, RECOMMENDATION_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def changed_since(timestamp):
+        """
+        IDs of profiles whose ranking inputs changed after `timestamp`: hard-filter
+        attributes and soft-delete live on Profile, scoring inputs on MatchFeatures.
+        """
+        changed = set(Profile.objects.filter(updated_at__gt=timestamp).values_list('id', flat=True))
+        changed.update(
+            MatchFeatures.objects.filter(updated_at__gt=timestamp).values_list('profile_id', flat=True)
+        )
+        return changed
+
+    @staticmethod
+    def precomputed(profile_id):
+        """The viewer's nightly PrecomputedMatch row as a cache entry, or None."""
+        row = PrecomputedMatch.objects.filter(profile_id=profile_id).first()
+        if row is None:
+            return None
+        ids = np.array(row.candidate_ids, dtype=np.int64)
+        scores = np.array(row.scores, dtype=np.int64)
+        return {
+            'ids': ids,
+            'scores': scores,
+            'reasons': np.array(row.reasons, dtype=np.int64),
+            'complete': row.complete,
+            'floor': None if row.complete or not len(ids) else (int(scores[-1]), int(ids[-1])),
+            'relaxation': row.relaxation,
+            'level_counts': row.level_counts,
+            'mutual': row.mutual,
+            'faith_tag_weight': row.faith_tag_weight,
+            'proximity_weight': row.proximity_weight,
+            'is_fallback': row.is_fallback,
+            'fallback_message': row.fallback_message,
+            'built_at': row.computed_at,
+            'refreshed_at': row.computed_at,
+        }
@@ -0,0 +1,247 @@
+"""
+Learned reranking of recommendation pages from past interest outcomes.
+
+`manage.py train_reranker` turns historical Interest pairs into a feature
+matrix - the pair's compatibility score and match reason bits plus a few
+attributes of the receiver - labelled by whether the receiver accepted, and
+fits a logistic model with vectorized Newton (IRLS) steps in NumPy. Every
+run is stored as a new RerankerModel version.
+
+At request time the active version reorders the page already cut from the
+compatibility ranking: one dot product per candidate, from the ranking's
+scores/reasons and the page's loaded Profile instances, so O(K) for a page
+of K. Which candidates are on a page, and the page cursors, stay defined by
+the compatibility ranking, so pagination is unaffected.
+"""
+import time
+
+import numpy as np
+from scipy.stats import rankdata
+
+from ..models import Interest, Profile, RerankerModel
+from .match_features import MatchFeatureService
+from .profession_index import ProfessionIndex
+from .scoring_engine import (
+    REASON_AGE, REASON_HEIGHT, REASON_LOCATION, REASON_MARITAL, REASON_PROFESSION,
+    CandidatePool, score_pairs,
+)
+
+
+FEATURE_NAMES = (
+    'bias', 'score', 'reason_age', 'reason_location', 'reason_marital', 'reason_profession',
+    'reason_height', 'has_photo', 'is_verified', 'is_premium',
+)
+REASON_BITS = (REASON_AGE, REASON_LOCATION, REASON_MARITAL, REASON_PROFESSION, REASON_HEIGHT)
+
+# Receiver attributes behind the last features, in FEATURE_NAMES order
+PROFILE_FEATURE_FIELDS = ('profile_image', 'is_verified', 'is_premium')
+
+# Interest pairs scored at a time while building training features
+PAIR_CHUNK_SIZE = 100000
+
+# Seconds a worker keeps the active model before checking for a new version
+ACTIVE_MODEL_TTL_SECONDS = 60
+
+_active = {'checked': None, 'version': None, 'weights': None}
+
+
+def feature_matrix(scores, reasons, attributes):
+    """
+    (n, len(FEATURE_NAMES)) float64 features of n pairs from their
+    compatibility scores, reason bitmasks and receiver attributes
+    ((n, 3) array of PROFILE_FEATURE_FIELDS truthiness).
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    reasons = np.asarray(reasons, dtype=np.int64)
+    features = np.empty((len(scores), len(FEATURE_NAMES)), dtype=np.float64)
+    features[:, 0] = 1.0
+    features[:, 1] = scores / 100.0
+    for column, bit in enumerate(REASON_BITS, start=2):
+        features[:, column] = (reasons & bit) != 0
+    features[:, 2 + len(REASON_BITS):] = np.asarray(attributes, dtype=bool).reshape(len(scores), -1)
+    return features
+
+
+def _sigmoid(z):
+    return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+
+class RerankerService:
+
+    # --- Training -----------------------------------------------------------
+
+    @staticmethod
+    def training_pairs(since, ignored_before):
+        """
+        (sender_ids, receiver_ids, labels) of the interests sent since `since`:
+        accepted = 1; rejected, or still unanswered when sent before
+        `ignored_before`, = 0. Cancelled and recent pending interests are
+        left out.
+        """
+        senders, receivers, labels = [], [], []
+        records = Interest.objects.filter(created_at__gte=since).exclude(status='cancelled').values_list(
+            'sender_id', 'receiver_id', 'status', 'created_at'
+        )
+        for sender_id, receiver_id, status, created_at in records.iterator(chunk_size=20000):
+            if status == 'sent' and created_at >= ignored_before:
+                continue
+            senders.append(sender_id)
+            receivers.append(receiver_id)
+            labels.append(status == 'accepted')
+        return (
+            np.array(senders, dtype=np.int64),
+            np.array(receivers, dtype=np.int64),
+            np.array(labels, dtype=np.float64),
+        )
+
+    @staticmethod
+    def pair_features(sender_ids, receiver_ids, faith_weight=0, proximity_weight=0):
+        """
+        (features, keep): the feature matrix of every pair whose profiles
+        still exist, and the mask of those pairs. Feature rows of all involved
+        profiles are read once into one CandidatePool and the pairs are
+        scored in vectorized chunks (score_pairs), with no per-sender work.
+        Pass the serving `faith_weight` and `proximity_weight` so scores
+        match the rankings'.
+        """
+        profile_ids = np.union1d(sender_ids, receiver_ids)
+        rows = MatchFeatureService.load_rows_by_ids(profile_ids.tolist())
+        profession_ids = {pid for row in rows for pid in row.profession_ids}
+        pool = CandidatePool(rows, ProfessionIndex.matcher_for(profession_ids))
+        by_id = np.argsort(pool.ids)
+        sorted_ids = pool.ids[by_id]
+
+        def positions(ids):
+            found = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            return by_id[found], sorted_ids[found] == ids
+
+        attributes = np.zeros((len(sorted_ids), len(PROFILE_FEATURE_FIELDS)), dtype=bool)
+        for start in range(0, len(sorted_ids), 5000):
+            chunk = sorted_ids[start:start + 5000].tolist()
+            for pid, *values in Profile.objects.filter(id__in=chunk).values_list('id', *PROFILE_FEATURE_FIELDS):
+                attributes[np.searchsorted(sorted_ids, pid)] = [bool(value) for value in values]
+
+        sender_pos, sender_found = positions(sender_ids)
+        receiver_pos, receiver_found = positions(receiver_ids)
+        keep = sender_found & receiver_found
+        sender_pos, receiver_pos = sender_pos[keep], receiver_pos[keep]
+
+        # 1. Score the pairs in vectorized chunks
+        scores = np.zeros(len(sender_pos), dtype=np.int64)
+        reasons = np.zeros(len(sender_pos), dtype=np.int64)
+        for start in range(0, len(sender_pos), PAIR_CHUNK_SIZE):
+            chunk = slice(start, start + PAIR_CHUNK_SIZE)
+            batch = score_pairs(
+                pool, sender_pos[chunk], receiver_pos[chunk],
+                faith_weight=faith_weight, proximity_weight=proximity_weight,
+            )
+            scores[chunk] = batch.scores
+            reasons[chunk] = batch.reasons
+
+        # 2. Receiver attributes by pool position
+        receiver_attributes = attributes[np.searchsorted(sorted_ids, receiver_ids[keep])]
+        return feature_matrix(scores, reasons, receiver_attributes), keep
+
+    @staticmethod
+    def fit(features, labels, l2=1.0, max_iterations=25, tolerance=1e-8):
+        """
+        L2-regularized logistic regression by Newton's method (IRLS). Every
+        iteration is two passes over the (n, d) matrix plus a d x d solve,
+        so millions of pairs fit in seconds. The bias is not regularized.
+        """
+        n, d = features.shape
+        penalty = np.full(d, float(l2))
+        penalty[0] = 0.0
+        weights = np.zeros(d)
+        for _ in range(max_iterations):
+            p = _sigmoid(features @ weights)
+            gradient = features.T @ (p - labels) + penalty * weights
+            hessian = (features * (p * (1 - p))[:, None]).T @ features + np.diag(penalty + 1e-9)
+            step = np.linalg.solve(hessian, gradient)
+            weights -= step
+            if np.abs(step).max() < tolerance:
+                break
+        return weights
+
+    @staticmethod
+    def evaluate(features, labels, weights):
+        """Log loss and ROC AUC of the model, and the AUC of the compatibility score alone."""
+        if not len(labels):
+            return {'pairs': 0}
+        p = np.clip(_sigmoid(features @ weights), 1e-12, 1 - 1e-12)
+        log_loss = -np.mean(labels * np.log(p) + (1 - labels) * np.log(1 - p))
+        return {
+            'pairs': int(len(labels)),
+            'positive_rate': round(float(labels.mean()), 4),
+            'log_loss': round(float(log_loss), 5),
+            'auc': RerankerService._auc(labels, p),
+            'baseline_auc': RerankerService._auc(labels, features[:, FEATURE_NAMES.index('score')]),
+        }
+
+    @staticmethod
+    def _auc(labels, predictions):
+        positives = labels.sum()
+        negatives = len(labels) - positives
+        if not positives or not negatives:
+            return None
+        ranks = rankdata(predictions)
+        return round(float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives)), 4)
+
+    @staticmethod
+    def save(weights, metrics, training_pairs, activate=False):
+        """Store the weights as the next RerankerModel version (optionally the active one)."""
+        latest = RerankerModel.objects.order_by('-version').values_list('version', flat=True).first() or 0
+        model = RerankerModel.objects.create(
+            version=latest + 1,
+            feature_names=list(FEATURE_NAMES),
+            weights=[round(float(w), 6) for w in weights],
+            metrics=metrics,
+            training_pairs=training_pairs,
+        )
+        if activate:
+            RerankerService.activate(model.version)
+        return model
+
+    @staticmethod
+    def activate(version):
+        """Make `version` the active model (None deactivates reranking)."""
+        RerankerModel.objects.exclude(version=version).filter(is_active=True).update(is_active=False)
+        if version is not None:
+            RerankerModel.objects.filter(version=version).update(is_active=True)
+        _active['checked'] = None
+
+    # --- Serving ------------------------------------------------------------
+
+    @staticmethod
+    def active_weights():
+        """Weights of the active model, re-read at most every ACTIVE_MODEL_TTL_SECONDS (None if none)."""
+        now = time.monotonic()
+        if _active['checked'] is None or now - _active['checked'] > ACTIVE_MODEL_TTL_SECONDS:
+            model = RerankerModel.objects.filter(is_active=True).values_list(
+                'version', 'feature_names', 'weights'
+            ).first()
+            if model is None or tuple(model[1]) != FEATURE_NAMES:
+                _active.update(version=None, weights=None)
+            else:
+                _active.update(version=model[0], weights=np.array(model[2], dtype=np.float64))
+            _active['checked'] = now
+        return _active['weights']
+
+    @staticmethod
+    def rerank(ranked, profiles):
+        """
+        Reorder a page of (profile_id, score, reason_bits) by the active
+        model's acceptance probability, best first (rank order breaks ties).
+        `profiles` maps the IDs to loaded Profile instances. Returned as is
+        without an active model.
+        """
+        weights = RerankerService.active_weights()
+        if weights is None or len(ranked) < 2:
+            return ranked
+        attributes = [
+            [bool(getattr(profiles[pid], field)) for field in PROFILE_FEATURE_FIELDS]
+            for pid, _, _ in ranked
+        ]
+        features = feature_matrix([score for _, score, _ in ranked], [bits for _, _, bits in ranked], attributes)
+        order = np.argsort(-(features @ weights), kind='stable')
+        return [ranked[i] for i in order]
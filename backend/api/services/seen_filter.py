@@ -0,0 +1,259 @@
+"""
+Per-member "already seen" suppression for recommendations.
+
+Each member has a Bloom filter (SeenFilter row) of the profiles they were
+shown as recommendations, opened (ProfileView) or exchanged interests with
+(Interest). Membership of a whole candidate array is tested at once with
+NumPy, so the ranker skips seen candidates in O(1) per candidate instead of
+an exclude(id__in=[...]) anti-join. A false positive only hides a profile
+that was never seen; nothing seen is ever shown again by mistake.
+
+Filters are sized from the `seen_filter_capacity` and `seen_filter_fp_rate`
+AppConfig keys. Bloom filters cannot forget, so a filter is rebuilt from
+ProfileView and Interest - dropping the recommendation impressions - when
+it outgrows its capacity, when the configuration changes, or when every
+candidate of a member has been seen.
+
+A recommendations request loads the member's filter once (get), adds its
+page in memory (remember) and writes it back with a single UPDATE (save)
+that only applies if nobody else wrote the row since it was loaded;
+otherwise the page is merged into the current row under a lock (add).
+"""
+import math
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from ..models import AppConfig, Interest, ProfileView, SeenFilter
+
+
+DEFAULT_SEEN_FILTER_CAPACITY = 2000
+DEFAULT_SEEN_FILTER_FP_RATE = 0.01
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(values):
+    """splitmix64 finalizer over a uint64 array (wrapping arithmetic)."""
+    z = values + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+class BloomFilter:
+    """
+    Bloom filter over profile IDs, stored as a packed uint8 bit array.
+    `capacity` and `fp_rate` are what it was sized for, `count` the number
+    of IDs added (an upper bound).
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, capacity=0, fp_rate=0.0, count=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = (
+            np.frombuffer(bytes(bits), dtype=np.uint8).copy() if bits is not None
+            else np.zeros((num_bits + 7) // 8, dtype=np.uint8)
+        )
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.count = count
+
+    @classmethod
+    def sized(cls, capacity, fp_rate):
+        """Optimal bit count and hash count for `capacity` items at `fp_rate`."""
+        capacity = max(capacity, 1)
+        num_bits = max(int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)), 8)
+        num_hashes = max(int(round(num_bits / capacity * math.log(2))), 1)
+        return cls(num_bits, num_hashes, capacity=capacity, fp_rate=fp_rate)
+
+    def _positions(self, ids):
+        """(len(ids), num_hashes) bit positions by double hashing."""
+        ids = np.asarray(ids, dtype=np.uint64)
+        h1 = _mix(ids)
+        h2 = _mix(ids ^ np.uint64(0x5851F42D4C957F2D)) | np.uint64(1)
+        steps = np.arange(self.num_hashes, dtype=np.uint64)
+        return ((h1[:, None] + steps[None, :] * h2[:, None]) % np.uint64(self.num_bits)).astype(np.int64)
+
+    def add(self, ids):
+        positions = self._positions(ids).ravel()
+        np.bitwise_or.at(self.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+
+    def contains(self, ids):
+        """Boolean mask: True where the ID is (probably) in the filter."""
+        if not len(ids):
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(ids)
+        return ((self.bits[positions >> 3] >> (positions & 7)) & 1).all(axis=1).astype(bool)
+
+    def to_bytes(self):
+        return self.bits.tobytes()
+
+
+class MemberSeenFilter(BloomFilter):
+    """
+    A member's filter as used by one request: `stored_at` is the SeenFilter
+    row's updated_at when it was loaded (None if there was no row), `dirty`
+    whether it differs from the row, and `added` the profiles remembered.
+    """
+
+    def __init__(self, *args, stored_at=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stored_at = stored_at
+        self.dirty = False
+        self.added = []
+
+
+class SeenFilterService:
+
+    @staticmethod
+    def config():
+        """(capacity, fp_rate) for new filters."""
+        capacity = int(AppConfig.get_value('seen_filter_capacity', DEFAULT_SEEN_FILTER_CAPACITY))
+        fp_rate = float(AppConfig.get_value('seen_filter_fp_rate', DEFAULT_SEEN_FILTER_FP_RATE))
+        return max(capacity, 1), min(max(fp_rate, 1e-6), 0.5)
+
+    @staticmethod
+    def interacted_ids(profile_id):
+        """Profiles the member opened or exchanged interests with."""
+        viewed = ProfileView.objects.filter(viewer_id=profile_id).values_list('viewed_profile_id', flat=True)
+        sent = Interest.objects.filter(sender_id=profile_id).values_list('receiver_id', flat=True)
+        received = Interest.objects.filter(receiver_id=profile_id).values_list('sender_id', flat=True)
+        return set(viewed.distinct()) | set(sent) | set(received)
+
+    @staticmethod
+    def build(profile_id, extra_ids=(), config=None):
+        """
+        New filter (not saved), sized from the current configuration (or
+        `config`, as read by config()), holding the member's interactions
+        (plus `extra_ids`). Recommendation impressions are dropped.
+        """
+        capacity, fp_rate = config or SeenFilterService.config()
+        ids = SeenFilterService.interacted_ids(profile_id) | set(extra_ids)
+        # Never size below what is already known to be in it
+        bloom = MemberSeenFilter.sized(max(capacity, 2 * len(ids)), fp_rate)
+        if ids:
+            bloom.add(np.fromiter(ids, dtype=np.int64, count=len(ids)))
+        bloom.count = len(ids)
+        return bloom
+
+    @staticmethod
+    def rebuild(profile_id, extra_ids=()):
+        """build() and save the filter, replacing the member's current one."""
+        bloom = SeenFilterService.build(profile_id, extra_ids)
+        SeenFilter.objects.update_or_create(profile_id=profile_id, defaults=SeenFilterService._columns(bloom))
+        return bloom
+
+    @staticmethod
+    def _columns(bloom):
+        return {
+            'bits': bloom.to_bytes(), 'num_bits': bloom.num_bits, 'num_hashes': bloom.num_hashes,
+            'capacity': bloom.capacity, 'fp_rate': bloom.fp_rate, 'count': bloom.count,
+        }
+
+    @staticmethod
+    def get(profile_id):
+        """
+        The member's filter for one request, built in memory if missing or
+        sized for another configuration. Changes to it (remember, or a
+        renewal after every candidate was seen) are written by save().
+        """
+        row = SeenFilter.objects.filter(profile_id=profile_id).first()
+        capacity, fp_rate = config = SeenFilterService.config()
+        if row is None or row.fp_rate != fp_rate or row.capacity < capacity:
+            return SeenFilterService.renew(
+                profile_id, stored_at=row.updated_at if row is not None else None, config=config
+            )
+        return MemberSeenFilter(
+            row.num_bits, row.num_hashes, row.bits,
+            capacity=row.capacity, fp_rate=row.fp_rate, count=row.count, stored_at=row.updated_at,
+        )
+
+    @staticmethod
+    def renew(profile_id, stored_at=None, extra_ids=(), config=None):
+        """
+        A member filter built from interactions (plus `extra_ids`) only, for
+        save() to replace the row loaded at `stored_at` with.
+        """
+        bloom = SeenFilterService.build(profile_id, extra_ids, config=config)
+        bloom.stored_at = stored_at
+        bloom.dirty = True
+        return bloom
+
+    @staticmethod
+    def remember(profile_id, bloom, ids):
+        """
+        Add profiles to get()'s filter in memory, rebuilding it (in memory)
+        if it would exceed its capacity. Returns the filter to save().
+        """
+        new = np.array([int(pid) for pid in ids if pid is not None], dtype=np.int64)
+        new = new[~bloom.contains(new)]
+        if not len(new):
+            return bloom
+        added = bloom.added + new.tolist()
+        if bloom.count + len(new) > bloom.capacity:
+            bloom = SeenFilterService.renew(profile_id, stored_at=bloom.stored_at, extra_ids=new.tolist())
+        else:
+            bloom.add(new)
+            bloom.count += len(new)
+            bloom.dirty = True
+        bloom.added = added
+        return bloom
+
+    @staticmethod
+    def save(profile_id, bloom):
+        """
+        Write get()'s filter back in one query, unless the row changed since
+        it was loaded - then only the profiles remembered in this request are
+        merged into the current row (add).
+        """
+        if not bloom.dirty:
+            return
+        columns = SeenFilterService._columns(bloom)
+        if bloom.stored_at is None:
+            try:
+                with transaction.atomic():
+                    SeenFilter.objects.create(profile_id=profile_id, **columns)
+                return
+            except IntegrityError:
+                pass  # Created concurrently
+        elif SeenFilter.objects.filter(profile_id=profile_id, updated_at=bloom.stored_at).update(
+            updated_at=timezone.now(), **columns
+        ):
+            return
+        SeenFilterService.add(profile_id, bloom.added)
+
+    @staticmethod
+    def add(profile_id, ids):
+        """
+        Add profiles to an existing filter (members without one get it built
+        on their next recommendations request). Rebuilds when the filter
+        would exceed its capacity.
+        """
+        ids = [int(pid) for pid in ids if pid is not None]
+        if not ids:
+            return
+        with transaction.atomic():
+            row = SeenFilter.objects.select_for_update().filter(profile_id=profile_id).first()
+            if row is None:
+                return
+            bloom = BloomFilter(row.num_bits, row.num_hashes, row.bits)
+            new = np.array(ids, dtype=np.int64)
+            new = new[~bloom.contains(new)]
+            if not len(new):
+                return
+            if row.count + len(new) > row.capacity:
+                SeenFilterService.rebuild(profile_id, extra_ids=new.tolist())
+                return
+            bloom.add(new)
+            row.bits = bloom.to_bytes()
+            row.count += len(new)
+            row.save(update_fields=['bits', 'count', 'updated_at'])
+
+    @staticmethod
+    def unseen(bloom, ids):
+        """Boolean mask over `ids`: True for candidates not in the filter."""
+        if bloom is None:
+            return np.ones(len(ids), dtype=bool)
+        return ~bloom.contains(ids)
@@ -0,0 +1,104 @@
+"""
+CandidatePool arrays in shared memory, and the ranking work done by the
+worker processes of `manage.py precompute_matches`.
+
+The parent process builds one pool over every live profile and copies its
+column arrays into named shared-memory blocks once; workers attach to them
+instead of receiving a pickled copy per task. Nothing in this module touches
+the database, so it is safe to import in spawned worker processes.
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .scoring_engine import CandidatePool, RelaxedTopK, score_pool
+
+
+# Set in each worker process by init_worker()
+_pool = None
+_segments = []
+
+
+def share_pool(pool):
+    """
+    Copy a pool's arrays into shared memory. Returns (segments, spec): keep the
+    segments alive (and unlink them when done); pass the spec to workers.
+    """
+    segments = []
+    layout = {}
+    for name, values in pool.arrays().items():
+        values = np.ascontiguousarray(values)
+        segment = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=segment.buf)[...] = values
+        segments.append(segment)
+        layout[name] = (segment.name, values.shape, values.dtype.str)
+    return segments, {'layout': layout, 'vocabularies': pool.vocabularies()}
+
+
+def attach_pool(spec):
+    """Rebuild a pool over the shared arrays described by `spec`. Returns (pool, segments)."""
+    segments = []
+    arrays = {}
+    for name, (segment_name, shape, dtype) in spec['layout'].items():
+        segment = shared_memory.SharedMemory(name=segment_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+    return CandidatePool.from_arrays(arrays, spec['vocabularies']), segments
+
+
+def release(segments, unlink=False):
+    for segment in segments:
+        segment.close()
+        if unlink:
+            segment.unlink()
+
+
+def init_worker(spec):
+    global _pool, _segments
+    _pool, _segments = attach_pool(spec)
+
+
+def close_worker():
+    global _pool, _segments
+    _pool = None
+    release(_segments)
+    _segments = []
+
+
+def rank_block(task):
+    """
+    Rank every viewer of one hard-filter block against its candidates.
+
+    task: (positions, levels, viewers, n_levels, min_matches, top_n, today, mutual, faith_weight,
+    proximity_weight)
+    where positions index the shared pool (the block's candidates under its
+    loosest filters, in ID order), levels tag each with the strictest
+    relaxation level it passes, viewers is a list of FeatureRows and mutual
+    drops candidates whose preferences reject the viewer (faith_weight and
+    proximity_weight as for score_pool).
+    Returns [(viewer_id, entry)] with the fields of MatchingService.build_ranking.
+    """
+    positions, levels, viewers, n_levels, min_matches, top_n, today, mutual, faith_weight, proximity_weight = task
+    block = _pool.subset(positions)
+
+    results = []
+    for viewer in viewers:
+        top = RelaxedTopK(n_levels, top_n)
+        top.push(score_pool(
+            viewer, block, today=today, mutual=mutual,
+            faith_weight=faith_weight, proximity_weight=proximity_weight,
+        ), levels)
+        ids, scores, reasons, level, level_counts, complete = top.result(min_matches)
+        results.append((viewer.profile_id, {
+            'ids': ids,
+            'scores': scores,
+            'reasons': reasons,
+            'complete': complete,
+            'floor': None if complete else (int(scores[-1]), int(ids[-1])),
+            'relaxation': level,
+            'level_counts': level_counts,
+            'mutual': mutual,
+            'faith_tag_weight': faith_weight,
+            'proximity_weight': proximity_weight,
+        }))
+    return results
@@ -0,0 +1,334 @@
+"""
+SQL-pushdown scoring backend.
+
+Expresses the mutual compatibility score of scoring_engine as ORM annotations
+over the MatchFeatures table, so the database filters, scores, sorts and
+limits the candidates (ORDER BY score LIMIT N) and only the returned rows
+reach Python. The viewer's attributes and preferences become constants;
+ages are compared as birth-date ordinals whose bounds are computed once per
+ranking, so every criterion is a plain column comparison.
+
+Selected with the `recommendation_scoring_backend` AppConfig key or per
+request (see MatchingService.scoring_backend). SQLScoringParityTests
+(api/tests.py) compare it with the NumPy scorer.
+"""
+import calendar
+from datetime import date
+
+import numpy as np
+from django.db.models import BooleanField, Case, Count, FloatField, Func, IntegerField, Q, Value, When
+from django.db.models.functions import Cast, Floor
+from django.db.models.lookups import GreaterThan
+
+from ..models import MatchFeatures
+from .profession_index import ProfessionIndex
+from .scoring_engine import (
+    AGE_FAR_POINTS, AGE_NEAR_POINTS, AGE_WEIGHT, COUNTRY_WEIGHT, HEIGHT_NEAR_POINTS, HEIGHT_WEIGHT,
+    MARITAL_WEIGHT, NO_OVERLAP_SCORE, NO_PREFERENCES_SCORE, PROFESSION_WEIGHT, REASON_AGE,
+    REASON_HEIGHT, REASON_LOCATION, REASON_MARITAL, REASON_PROFESSION, RELIGION_WEIGHT,
+    _ages_from_ordinals, choose_relaxation,
+)
+
+
+class JSONArrayOverlap(Func):
+    """
+    True where a JSON array column shares an element with `values`.
+    PostgreSQL tests string arrays with the GIN-indexable `?|` operator;
+    other elements (and other databases) go through an EXISTS over the
+    array's elements.
+    """
+    output_field = BooleanField()
+
+    def __init__(self, expression, values):
+        super().__init__(expression)
+        self.values = list(values)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        placeholders = ', '.join(['%s'] * len(self.values))
+        sql = f'EXISTS (SELECT 1 FROM json_each({lhs}) WHERE json_each.value IN ({placeholders}))'
+        return sql, (*params, *self.values)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        lhs, params = compiler.compile(self.source_expressions[0])
+        texts = [str(value) for value in self.values]
+        if all(isinstance(value, str) for value in self.values):
+            return f'({lhs} ?| %s)', (*params, texts)
+        sql = f'EXISTS (SELECT 1 FROM jsonb_array_elements_text({lhs}) AS element(value) WHERE element.value = ANY(%s))'
+        return sql, (*params, texts)
+
+
+def _overlap(field, values):
+    values = sorted(set(values))
+    if not values:
+        return Q(pk__in=[])
+    return Q(JSONArrayOverlap(field, values))
+
+
+def _birth_ordinal_at_age(age, today):
+    """
+    Latest birth-date ordinal of someone at least `age` years old on `today`
+    (Profile.age semantics), so `age >= a` becomes `birth_ordinal <= bound`.
+    """
+    year = today.year - age
+    if year < date.min.year:
+        return 0
+    if year > date.max.year:
+        return date.max.toordinal()
+    day = min(today.day, calendar.monthrange(year, today.month)[1])
+    return date(year, today.month, day).toordinal()
+
+
+def _age_between(low, high, today):
+    """Candidates with a known birth date whose age is within [low, high]."""
+    return Q(
+        birth_ordinal__gt=max(_birth_ordinal_at_age(high + 1, today), 0),
+        birth_ordinal__lte=_birth_ordinal_at_age(low, today),
+    )
+
+
+def _tally(criteria):
+    """
+    (weight, active, points, matched, reason) criteria -> (score, reasons)
+    expressions, like scoring_engine._tally. `points` is a list of
+    (condition, points) pairs, the first matching one counting.
+    """
+    if not criteria:
+        return Value(NO_OVERLAP_SCORE), Value(0)
+
+    max_score = score = reasons = Value(0)
+    for weight, active, points, matched, reason in criteria:
+        max_score = max_score + Case(When(active, then=Value(weight)), default=Value(0))
+        score = score + Case(
+            *[When(active & condition, then=Value(value)) for condition, value in points],
+            default=Value(0),
+        )
+        if reason:
+            reasons = reasons + Case(When(active & matched, then=Value(reason)), default=Value(0))
+
+    # Same float arithmetic as the NumPy scorer, truncated to an integer
+    pct = Floor(Cast(score, FloatField()) / Cast(max_score, FloatField()) * 100)
+    score = Case(
+        When(GreaterThan(max_score, 0), then=Cast(pct, IntegerField())),
+        default=Value(NO_OVERLAP_SCORE),
+        output_field=IntegerField(),
+    )
+    return score, reasons
+
+
+def _forward_criteria(viewer, matcher, today):
+    """How well each candidate matches the viewer's preferences."""
+    criteria = []
+    age_set = Q(birth_ordinal__gt=0) & ~_age_between(0, 0, today)
+
+    # 1. AGE
+    low, high = viewer.pref_min_age, viewer.pref_max_age
+    if low and high:
+        exact, near, far = (_age_between(low - d, high + d, today) for d in (0, 2, 5))
+        points = [(exact, AGE_WEIGHT), (near, AGE_NEAR_POINTS), (far, AGE_FAR_POINTS)]
+        criteria.append((AGE_WEIGHT, age_set, points, near, REASON_AGE))
+
+    # 2. RELIGION
+    if viewer.pref_religion:
+        matched = Q(religion=viewer.pref_religion)
+        criteria.append((RELIGION_WEIGHT, ~Q(religion=''), [(matched, RELIGION_WEIGHT)], matched, 0))
+
+    # 3. COUNTRY
+    if viewer.pref_countries:
+        matched = Q(country__in=[c for c in viewer.pref_countries if c])
+        criteria.append((COUNTRY_WEIGHT, ~Q(country=''), [(matched, COUNTRY_WEIGHT)], matched, REASON_LOCATION))
+
+    # 4. MARITAL STATUS
+    if viewer.pref_marital_statuses:
+        matched = Q(marital_status__in=[s for s in viewer.pref_marital_statuses if s])
+        criteria.append((MARITAL_WEIGHT, ~Q(marital_status=''), [(matched, MARITAL_WEIGHT)], matched, REASON_MARITAL))
+
+    # 5. PROFESSION (the preferred professions resolve to a set of title IDs)
+    if viewer.pref_professions:
+        matched = _overlap('profession_ids', matcher.resolve_all(viewer.pref_professions))
+        criteria.append((PROFESSION_WEIGHT, ~Q(professions=[]), [(matched, PROFESSION_WEIGHT)], matched, REASON_PROFESSION))
+
+    # 6. HEIGHT
+    if viewer.pref_min_height:
+        full = Q(height_inches__gte=viewer.pref_min_height)
+        near = Q(height_inches__gte=viewer.pref_min_height - 2)
+        points = [(full, HEIGHT_WEIGHT), (near, HEIGHT_NEAR_POINTS)]
+        criteria.append((HEIGHT_WEIGHT, Q(height_inches__gt=0), points, full, REASON_HEIGHT))
+
+    return criteria
+
+
+def _reverse_criteria(viewer, matcher, accepting_terms, today):
+    """How well the viewer matches each candidate's preferences."""
+    criteria = []
+    has_pref = Q(has_preference=True)
+    ages, age_set = _ages_from_ordinals(np.array([viewer.birth_ordinal], dtype=np.int64), today)
+    age = int(ages[0])
+
+    # 1. AGE
+    if age_set[0]:
+        active = has_pref & Q(pref_min_age__gt=0, pref_max_age__gt=0)
+        exact, near, far = (Q(pref_min_age__lte=age + d, pref_max_age__gte=age - d) for d in (0, 2, 5))
+        points = [(exact, AGE_WEIGHT), (near, AGE_NEAR_POINTS), (far, AGE_FAR_POINTS)]
+        criteria.append((AGE_WEIGHT, active, points, near, REASON_AGE))
+
+    # 2. RELIGION
+    if viewer.religion:
+        matched = Q(pref_religion=viewer.religion)
+        criteria.append((RELIGION_WEIGHT, has_pref & ~Q(pref_religion=''), [(matched, RELIGION_WEIGHT)], matched, 0))
+
+    # 3. COUNTRY
+    if viewer.country:
+        matched = _overlap('pref_countries', [viewer.country])
+        criteria.append((COUNTRY_WEIGHT, has_pref & ~Q(pref_countries=[]), [(matched, COUNTRY_WEIGHT)], matched, REASON_LOCATION))
+
+    # 4. MARITAL STATUS
+    if viewer.marital_status:
+        matched = _overlap('pref_marital_statuses', [viewer.marital_status])
+        criteria.append((MARITAL_WEIGHT, has_pref & ~Q(pref_marital_statuses=[]), [(matched, MARITAL_WEIGHT)], matched, REASON_MARITAL))
+
+    # 5. PROFESSION - the preferred professions matching the viewer's titles
+    if viewer.has_work:
+        matched = _overlap('pref_professions', accepting_terms)
+        criteria.append((PROFESSION_WEIGHT, has_pref & ~Q(pref_professions=[]), [(matched, PROFESSION_WEIGHT)], matched, REASON_PROFESSION))
+
+    # 6. HEIGHT
+    if viewer.height_inches:
+        full = Q(pref_min_height__lte=viewer.height_inches)
+        near = Q(pref_min_height__lte=viewer.height_inches + 2)
+        points = [(full, HEIGHT_WEIGHT), (near, HEIGHT_NEAR_POINTS)]
+        criteria.append((HEIGHT_WEIGHT, has_pref & Q(pref_min_height__gt=0), points, full, REASON_HEIGHT))
+
+    return criteria
+
+
+def _accepting_terms(viewer, matcher, candidates):
+    """Preferred-profession terms used by `candidates` that match one of the viewer's titles."""
+    if not viewer.has_work:
+        return set()
+    viewer_ids = set(viewer.profession_ids)
+    lists = candidates.exclude(pref_professions=[]).order_by().values_list('pref_professions', flat=True).distinct()
+    terms = {term for terms in lists for term in terms}
+    return {term for term in terms if not viewer_ids.isdisjoint(matcher.resolve(term))}
+
+
+def accepts_viewer_q(viewer, accepting_terms, today):
+    """
+    Reverse-preference filter: candidates whose preferences accept the viewer,
+    as scoring_engine.accepted_by. Each clause can use the MatchFeatures
+    reverse-preference indexes (GIN on the preference arrays, B-tree on the
+    age range and minimum height).
+    """
+    q = Q()
+    ages, age_set = _ages_from_ordinals(np.array([viewer.birth_ordinal], dtype=np.int64), today)
+    if age_set[0]:
+        age = int(ages[0])
+        q &= Q(pref_min_age=0) | Q(pref_max_age=0) | Q(pref_min_age__lte=age, pref_max_age__gte=age)
+    if viewer.religion:
+        q &= Q(pref_religion='') | Q(pref_religion=viewer.religion)
+    if viewer.country:
+        q &= Q(pref_countries=[]) | _overlap('pref_countries', [viewer.country])
+    if viewer.marital_status:
+        q &= Q(pref_marital_statuses=[]) | _overlap('pref_marital_statuses', [viewer.marital_status])
+    if viewer.has_work:
+        q &= Q(pref_professions=[]) | _overlap('pref_professions', accepting_terms)
+    if viewer.height_inches:
+        q &= Q(pref_min_height__lte=viewer.height_inches)
+    if not q:
+        return Q()  # Nothing known about the viewer can be rejected
+    return Q(has_preference=False) | q
+
+
+def annotate_scores(candidates, viewer, today=None, mutual=False):
+    """
+    `candidates` (a MatchFeatures queryset) annotated with the mutual `score`
+    and `reason_bits` of `viewer` (FeatureRow), as score_pool computes them.
+    Candidates calculate_compatibility_score would not score are excluded,
+    and with mutual=True so are those whose preferences reject the viewer.
+    """
+    today = today or date.today()
+    candidates = candidates.exclude(profile_id=viewer.profile_id)
+    if viewer.gender:
+        candidates = candidates.exclude(gender=viewer.gender)
+
+    matcher = ProfessionIndex.matcher_for(viewer.profession_ids)
+    terms = _accepting_terms(viewer, matcher, candidates)
+    if mutual:
+        candidates = candidates.filter(accepts_viewer_q(viewer, terms, today))
+    rev_score, rev_reasons = _tally(_reverse_criteria(viewer, matcher, terms, today))
+    no_pref = Q(has_preference=False)
+
+    if viewer.has_preference:
+        fwd_score, fwd_reasons = _tally(_forward_criteria(viewer, matcher, today))
+        score = Case(When(no_pref, then=fwd_score), default=(fwd_score + rev_score) / 2, output_field=IntegerField())
+        reasons = Case(When(no_pref, then=fwd_reasons), default=fwd_reasons.bitor(rev_reasons), output_field=IntegerField())
+    else:
+        score = Case(When(no_pref, then=Value(NO_PREFERENCES_SCORE)), default=rev_score, output_field=IntegerField())
+        reasons = Case(When(no_pref, then=Value(0)), default=rev_reasons, output_field=IntegerField())
+    return candidates.annotate(score=score, reason_bits=reasons)
+
+
+def hard_filter_q(filters):
+    """CandidateIndex.select() filter arguments as a Q over MatchFeatures (live profiles only)."""
+    q = Q(profile__is_deleted=False)
+    if filters.get('gender'):
+        q &= Q(gender=filters['gender'].lower())
+    if filters.get('religion'):
+        q &= Q(religion=filters['religion'].lower())
+    if filters.get('countries') is not None:
+        q &= Q(profile__current_country__in=filters['countries'])
+    if filters.get('exclude_countries'):
+        q &= ~Q(profile__current_country__in=filters['exclude_countries'])
+    if filters.get('marital_statuses') is not None:
+        q &= Q(profile__marital_status__in=filters['marital_statuses'])
+    if filters.get('exclude_ids'):
+        q &= ~Q(profile_id__in=filters['exclude_ids'])
+    return q
+
+
+def rank(viewer, level_filters, size, min_matches, today=None, mutual=False, unseen=None):
+    """
+    Database equivalent of score_pool + RelaxedTopK for one viewer (FeatureRow)
+    over progressively relaxed hard filters (CandidateIndex.select() arguments,
+    strictest first). Two queries: the candidate count of every level, then
+    the scored, ordered and limited candidates of the chosen level.
+    `unseen` maps an array of candidate IDs to a mask of those that may be
+    ranked (SeenFilterService.unseen); the others are dropped before the
+    level is chosen, so the first query reads every candidate's ID and
+    strictest level instead of the counts.
+    Returns (ids, scores, reasons, level, level_counts, complete).
+    """
+    levels = [hard_filter_q(filters) for filters in level_filters]
+    candidates = annotate_scores(MatchFeatures.objects.filter(levels[-1]), viewer, today=today, mutual=mutual)
+
+    # 1. Candidates per relaxation level, in one query
+    if unseen is None:
+        counts = candidates.aggregate(**{
+            f'level_{i}': Count('pk', filter=level) for i, level in enumerate(levels)
+        })
+        level_counts = [counts[f'level_{i}'] for i in range(len(levels))]
+        hidden = np.zeros((0, 2), dtype=np.int64)
+    else:
+        strictest = Case(
+            *[When(level, then=Value(i)) for i, level in enumerate(levels)], output_field=IntegerField()
+        )
+        tagged = np.array(
+            list(candidates.annotate(level=strictest).values_list('profile_id', 'level')), dtype=np.int64
+        ).reshape(-1, 2)
+        visible = unseen(tagged[:, 0])
+        level_counts = [int((visible & (tagged[:, 1] <= i)).sum()) for i in range(len(levels))]
+        hidden = tagged[~visible]
+    level = choose_relaxation(level_counts, min_matches)
+
+    # 2. ORDER BY score LIMIT size in the database, over-fetching by the
+    # chosen level's seen candidates, which are dropped here
+    rows = candidates.filter(levels[level]).order_by('-score', 'profile_id').values_list(
+        'profile_id', 'score', 'reason_bits'
+    )
+    if size is not None:
+        rows = rows[:size + int((hidden[:, 1] <= level).sum())]
+    ranked = np.array(list(rows), dtype=np.int64).reshape(-1, 3)
+    if len(hidden):
+        ranked = ranked[~np.isin(ranked[:, 0], hidden[:, 0])][:size]
+    complete = size is None or level_counts[level] <= size
+    return ranked[:, 0], ranked[:, 1], ranked[:, 2], level, level_counts, complete
@@ -0,0 +1,186 @@
+"""
+Seeded synthetic member population for benchmarks and parity checks.
+
+Generates users with Profile, Preference, WorkExperience, Education,
+Interest and ProfileView rows in bulk (bulk_create, no per-row signals),
+then fills their MatchFeatures rows in one rebuild. The same seed always
+produces the same population. Generated users are recognizable by their
+username prefix, so a population can be removed again with delete().
+"""
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from ..models import Profile, Preference, WorkExperience, Education, Interest, ProfileView, Religion
+from .faith_tags import FaithTagService
+from .geo_index import Gazetteer
+from .map_tiles import MapService
+from .match_features import MatchFeatureService
+from .profile_search import ProfileSearchService
+
+
+USERNAME_PREFIX = 'synthetic'
+
+# (value, weight) distributions, roughly shaped like the live member base
+COUNTRIES = (('BD', 50), ('US', 12), ('GB', 10), ('CA', 8), ('AE', 6), ('AU', 5), ('MY', 4), ('SA', 3), (None, 2))
+CITIES = {
+    'BD': ('Dhaka', 'Chittagong', 'Sylhet', 'Khulna'), 'US': ('New York', 'Houston', 'Chicago'),
+    'GB': ('London', 'Manchester', 'Birmingham'), 'CA': ('Toronto', 'Montreal'), 'AE': ('Dubai', 'Abu Dhabi'),
+    'AU': ('Sydney', 'Melbourne'), 'MY': ('Kuala Lumpur',), 'SA': ('Riyadh', 'Jeddah'),
+}
+RELIGIONS = ((Religion.MUSLIM, 80), (Religion.HINDU, 10), (Religion.CHRISTIAN, 5), (None, 5))
+MARITAL_STATUSES = (('never_married', 80), ('divorced', 12), ('widowed', 3), (None, 5))
+TITLES = (
+    'Software Engineer', 'Civil Engineer', 'Doctor', 'Teacher', 'Banker', 'Nurse', 'Accountant',
+    'Lawyer', 'Pharmacist', 'Architect', 'Business Owner', 'Data Analyst', 'Lecturer', 'Student',
+)
+DEGREES = ('BSc', 'BA', 'BBA', 'MBBS', 'MSc', 'MBA', 'PhD', 'HSC')
+FAITH_TAGS = (
+    'Practicing Muslim', 'Spiritual', 'Open-Minded', 'Family-Oriented', 'Non-Smoker', 'Non-Drinker',
+    'Halal Diet', 'Loves to Travel', 'Career-Focused', 'Ambitious', 'Ready for Marriage',
+    'Open to Joint Family', 'Prefers Independence', 'Must Speak Bengali', 'Must Speak English',
+)
+LIFESTYLES = (('moderate', 45), ('conservative', 25), ('liberal', 15), ('strictly_religious', 10), (None, 5))
+FAMILY_TYPES = (('nuclear', 55), ('joint', 35), (None, 10))
+PREFERRED_PROFESSIONS = ((), ('engineer',), ('doctor', 'pharmacist'), ('teacher', 'lecturer'), ('banker', 'accountant'))
+
+
+def _pick(rnd, weighted):
+    values, weights = zip(*weighted)
+    return rnd.choices(values, weights)[0]
+
+
+class SyntheticPopulation:
+    """One seeded population; generate() may be called repeatedly to grow it."""
+
+    def __init__(self, seed=1):
+        self.seed = seed
+        self.rnd = random.Random(seed)
+        self.prefix = f'{USERNAME_PREFIX}-{seed}-'
+
+    def profiles(self):
+        return Profile.objects.filter(user__username__startswith=self.prefix)
+
+    def delete(self):
+        """Remove every user (and, by cascade, profile) of this population."""
+        return User.objects.filter(username__startswith=self.prefix).delete()
+
+    def generate(self, count, batch_size=5000, interests_per_profile=2, views_per_profile=3):
+        """
+        Add `count` members in batches of `batch_size`; each sends about
+        `interests_per_profile` interests and makes `views_per_profile`
+        profile views to other members of the population. Returns the new
+        profile IDs.
+        """
+        start = User.objects.filter(username__startswith=self.prefix).count()
+        profile_ids = []
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                profile_ids.extend(self._create_batch(start + offset, min(batch_size, count - offset)))
+
+        # Activity between members
+        pool = list(self.profiles().values_list('id', flat=True))
+        for offset in range(0, len(profile_ids), batch_size):
+            senders = profile_ids[offset:offset + batch_size]
+            with transaction.atomic():
+                self._create_activity(senders, pool, interests_per_profile, views_per_profile)
+
+        # bulk_create skips the save signals that keep MatchFeatures in sync
+        for _ in MatchFeatureService.rebuild(Profile.objects.filter(id__in=profile_ids), batch_size=batch_size):
+            pass
+        for _ in ProfileSearchService.rebuild(Profile.objects.filter(id__in=profile_ids), batch_size=batch_size):
+            pass
+        MapService.invalidate_all()
+        return profile_ids
+
+    def _create_batch(self, first, size):
+        rnd = self.rnd
+        users = User.objects.bulk_create([
+            User(username=f'{self.prefix}{first + i}', password='!') for i in range(size)
+        ])
+
+        today = date.today()
+        # bulk_create skips Profile.save, which maps the tags to vocabulary IDs
+        # and resolves the city against the gazetteer (it projects the privacy
+        # fields itself, see ProfileQuerySet)
+        tag_ids = dict(zip(FAITH_TAGS, (FaithTagService.canonical_ids([tag])[0] for tag in FAITH_TAGS)))
+        gazetteer = Gazetteer.get()
+        profiles = []
+        for user in users:
+            gender = rnd.choice(('male', 'female'))
+            birth_date = today - timedelta(days=rnd.randint(20 * 365, 45 * 365)) if rnd.random() > 0.03 else None
+            country = _pick(rnd, COUNTRIES)
+            profile = Profile(
+                user=user,
+                name=f'Member {user.username[len(self.prefix):]}',
+                email=f'{user.username}@example.com',
+                gender=gender,
+                date_of_birth=birth_date,
+                birth_year=birth_date.year if birth_date else None,
+                height_inches=rnd.randint(58, 70) if gender == 'female' else rnd.randint(62, 76),
+                religion=_pick(rnd, RELIGIONS),
+                current_country=country,
+                current_city=rnd.choice(CITIES[country]) if country else None,
+                marital_status=_pick(rnd, MARITAL_STATUSES),
+                lifestyle_priority=_pick(rnd, LIFESTYLES),
+                family_type=_pick(rnd, FAMILY_TYPES),
+                faith_tags=rnd.sample(FAITH_TAGS, rnd.randint(0, 5)),
+                is_activated=rnd.random() < 0.85,
+                onboarding_completed=True,
+            )
+            profile.faith_tag_ids = sorted(tag_ids[tag] for tag in profile.faith_tags)
+            profile.gazetteer_city_id = gazetteer.resolve(profile.current_city, country)
+            profiles.append(profile)
+        profiles = Profile.objects.bulk_create(profiles)
+
+        preferences, work, education = [], [], []
+        for profile in profiles:
+            for _ in range(rnd.choice((0, 1, 1, 1, 2))):
+                work.append(WorkExperience(profile=profile, title=rnd.choice(TITLES), company='Synthetic Ltd'))
+            for _ in range(rnd.choice((0, 1, 1, 2))):
+                education.append(Education(profile=profile, degree=rnd.choice(DEGREES), school='Synthetic University'))
+            if rnd.random() < 0.8:
+                preferences.append(self._preference(profile))
+        Preference.objects.bulk_create(preferences)
+        WorkExperience.objects.bulk_create(work)
+        Education.objects.bulk_create(education)
+        return [profile.id for profile in profiles]
+
+    def _preference(self, profile):
+        rnd = self.rnd
+        age = profile.age or 30
+        location = rnd.choice(('any', 'any', 'near_me', 'abroad'))
+        countries = [profile.current_country] if profile.current_country and rnd.random() < 0.3 else []
+        if rnd.random() < 0.05:
+            # Nobody lives there, so these members only get relaxed (fallback) matches
+            countries = ['NZ']
+        return Preference(
+            profile=profile,
+            min_age=max(18, age - rnd.randint(0, 6)) if rnd.random() < 0.9 else None,
+            max_age=age + rnd.randint(1, 8) if rnd.random() < 0.9 else None,
+            min_height_inches=rnd.choice((None, None, 60, 64, 68)),
+            religion=profile.religion if rnd.random() < 0.6 else None,
+            marital_statuses=rnd.choice(([], [], ['never_married'], ['never_married', 'divorced'])),
+            country=countries,
+            profession=list(rnd.choice(PREFERRED_PROFESSIONS)),
+            looking_for_gender='bride' if profile.gender == 'male' else 'groom',
+            location_preference=location,
+        )
+
+    def _create_activity(self, senders, pool, interests_per_profile, views_per_profile):
+        rnd = self.rnd
+        interests, views = [], []
+        for sender in senders:
+            for receiver in rnd.sample(pool, min(len(pool), interests_per_profile)):
+                if receiver != sender:
+                    interests.append(Interest(
+                        sender_id=sender, receiver_id=receiver,
+                        status=rnd.choice(('sent', 'sent', 'accepted', 'rejected')),
+                    ))
+            for viewed in rnd.sample(pool, min(len(pool), views_per_profile)):
+                if viewed != sender:
+                    views.append(ProfileView(viewer_id=sender, viewed_profile_id=viewed, source='recommendation'))
+        Interest.objects.bulk_create(interests, ignore_conflicts=True)
+        ProfileView.objects.bulk_create(views)
@@ -0,0 +1,103 @@
+"""
+Request-scoped state of the viewer for profile serializers.
+
+Serializers used to look up the viewer's profile, wallet and their
+interests with each serialized profile row by row. ViewerContext.of(request)
+is built once per request and shared by every serializer of that request:
+the profile, preference and wallet are read once, and list serializers load
+the Interest rows between the viewer and a whole page with one query
+(load_interests) before the rows are serialized.
+"""
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from ..models import Interest, Preference, Profile
+
+
+# Columns of the interest's profiles read by NestedProfileSerializer
+NESTED_PROFILE_FIELDS = ('id', 'name', 'profile_image', 'profile_image_privacy', 'image_visibility')
+
+
+class ViewerContext:
+
+    def __init__(self, user):
+        self.user = user if user is not None and user.is_authenticated else None
+        self._interests = {}   # profile ID -> Interests with the viewer, in primary key order
+
+    @classmethod
+    def of(cls, request):
+        """The context of `request` (created on first use); an anonymous one without a request."""
+        if request is None:
+            return cls(None)
+        context = getattr(request, '_viewer_context', None)
+        if context is None:
+            context = request._viewer_context = cls(getattr(request, 'user', None))
+        return context
+
+    # --- Viewer -------------------------------------------------------------
+
+    @cached_property
+    def profile(self):
+        if self.user is None:
+            return None
+        try:
+            return self.user.profile
+        except (AttributeError, Profile.DoesNotExist):
+            return None
+
+    @cached_property
+    def preference(self):
+        if self.profile is None:
+            return None
+        try:
+            return self.profile.preference
+        except Preference.DoesNotExist:
+            return None
+
+    @cached_property
+    def wallet_balance(self):
+        from subscription.models import CreditWallet
+        if self.user is None:
+            return 0
+        return CreditWallet.objects.filter(user=self.user).values_list('balance', flat=True).first() or 0
+
+    def is_viewer(self, profile):
+        return self.profile is not None and profile is not None and self.profile.pk == profile.pk
+
+    # --- Interests ----------------------------------------------------------
+
+    def load_interests(self, profile_ids):
+        """Fetch the interests between the viewer and every not yet loaded profile in one query."""
+        if self.profile is None:
+            return
+        ids = {int(pid) for pid in profile_ids} - set(self._interests) - {self.profile.pk}
+        if not ids:
+            return
+        for pid in ids:
+            self._interests[pid] = []
+        related = [f'{side}__{field}' for side in ('sender', 'receiver') for field in NESTED_PROFILE_FIELDS]
+        rows = Interest.objects.filter(
+            Q(sender=self.profile, receiver__in=ids) | Q(sender__in=ids, receiver=self.profile)
+        ).select_related('sender', 'receiver').only(
+            'id', 'sender', 'receiver', 'status', 'share_type', 'created_at', 'updated_at', *related
+        ).order_by('pk')
+        for interest in rows:
+            other = interest.receiver_id if interest.sender_id == self.profile.pk else interest.sender_id
+            self._interests[other].append(interest)
+
+    def interests_with(self, profile_id):
+        """Interests between the viewer and a profile in primary key order (loaded on demand)."""
+        if self.profile is None or profile_id == self.profile.pk:
+            return []
+        if profile_id not in self._interests:
+            self.load_interests([profile_id])
+        return self._interests.get(profile_id, [])
+
+    def first_interest(self, profile_id):
+        """The interest `.first()` would return: the oldest by primary key, in either direction."""
+        interests = self.interests_with(profile_id)
+        return interests[0] if interests else None
+
+    def accepted_interest(self, profile_id):
+        """The accepted interest with the lowest primary key, as `.filter(status='accepted').first()`."""
+        return next((i for i in self.interests_with(profile_id) if i.status == 'accepted'), None)
@@ -1,3 +1,1565 @@
-from django.test import TestCase
-
-# Create your tests here.
+"""
+Behaviour tests of matching, discovery and privacy.
+
+Run with `python manage.py test api`. Tests needing PostgreSQL features
+(JSONB containment, full-text search) are skipped on other databases.
+"""
+import io
+import itertools
+import random
+from contextlib import contextmanager, nullcontext
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import (
+    AppConfig, City, Interest, PrecomputedMatch, Profile, ProfileSimilarity, ProfileView, Preference, Religion, RerankerModel,
+    SeenFilter, WorkExperience,
+)
+from .pagination import DiscoveryPagination
+from .services import map_tiles, reranker
+from .services.candidate_index import CandidateIndex
+from .services.embedding_index import EMBEDDED_FIELDS, EmbeddingIndex, embed
+from .services.faith_tags import FaithTagService
+from .services.geo_index import Gazetteer
+from .services.match_features import MatchFeatureService
+from .services.matching_service import MIN_MATCHES, MatchingService
+from .services.pair_score_cache import PairScoreCache
+from .services.pipeline_metrics import PipelineMetrics
+from .services.profession_index import ProfessionIndex
+from .services.profile_search import ProfileSearchService
+from .services.profile_sync import ProfileSyncService
+from .services.recommendation_cache import RecommendationCache
+from .services.reranker import FEATURE_NAMES, RerankerService
+from .services.scoring_engine import tag_bitsets, tag_similarity_points
+from .services.seen_filter import BloomFilter
+from .utils.country_utils import get_country_name
+from .utils.privacy import CONTACT_FIELDS, LOCKED, PROJECTION_FIELDS, PROJECTION_SOURCES, mask_name
+
+
+requires_postgres = skipUnless(connection.vendor == 'postgresql', 'needs PostgreSQL')
+
+COUNTRIES = ['BD', 'US', 'us', 'GB', 'CA', '', None]
+RELIGIONS = [value for value, _ in Religion.choices] + ['Muslim', '', None]
+MARITAL_STATUSES = [value for value, _ in Profile.MARITAL_STATUS_CHOICES] + [None]
+TITLES = ['Engineer', 'Software Engineer', 'Doctor', 'teacher', 'Banker', 'Nurse', 'Senior  Software-Engineer']
+PREFERRED_PROFESSIONS = [[], ['engineer'], ['Doctor', 'nurse'], 'Teacher', None, [''], ['eng'], ['software eng']]
+
+# (name, country, latitude, longitude) of the gazetteer used by make_cities
+CITIES = [
+    ('Dhaka', 'BD', 23.8103, 90.4125),
+    ('Narayanganj', 'BD', 23.6238, 90.5000),   # ~22 km from Dhaka
+    ('Chittagong', 'BD', 22.3569, 91.7832),    # ~215 km from Dhaka
+    ('London', 'GB', 51.5074, -0.1278),
+]
+
+_usernames = itertools.count(1)
+
+
+def make_profile(**fields):
+    """An activated profile with its own user; `fields` override the defaults."""
+    username = f'member-{next(_usernames)}'
+    user = User.objects.create(username=username)
+    defaults = {'name': 'Member', 'email': f'{username}@example.com', 'gender': 'female', 'is_activated': True}
+    return Profile.objects.create(user=user, **{**defaults, **fields})
+
+
+def make_cities():
+    """The CITIES gazetteer, read by the next Gazetteer.get()."""
+    City.objects.bulk_create([
+        City(name=name, country=country, latitude=latitude, longitude=longitude)
+        for name, country, latitude, longitude in CITIES
+    ])
+    Gazetteer._instance = None
+
+
+def make_random_profiles(count, seed):
+    """
+    `count` randomized profiles (most with preferences and job titles, some
+    with odd casing and missing values) and their MatchFeatures rows.
+    Cities resolve only if make_cities() was called first.
+    """
+    rnd = random.Random(seed)
+    for _ in range(count):
+        birth_date = date(1975, 1, 1) + timedelta(days=rnd.randint(0, 9000)) if rnd.random() > 0.1 else None
+        profile = make_profile(
+            gender=rnd.choice(['male', 'female', 'Male', '']),
+            date_of_birth=birth_date,
+            height_inches=rnd.choice([None, 58, 61, 64, 67, 70, 73]),
+            religion=rnd.choice(RELIGIONS),
+            current_country=rnd.choice(COUNTRIES),
+            current_city=rnd.choice([name for name, *_ in CITIES] + [None]),
+            marital_status=rnd.choice(MARITAL_STATUSES),
+        )
+        for _ in range(rnd.choice([0, 1, 1, 2])):
+            WorkExperience.objects.create(profile=profile, title=rnd.choice(TITLES), company='Test')
+        if rnd.random() < 0.8:
+            Preference.objects.create(
+                profile=profile,
+                min_age=rnd.choice([None, 20, 25, 30]),
+                max_age=rnd.choice([None, 30, 35, 40, 50]),
+                min_height_inches=rnd.choice([None, 60, 64, 68]),
+                religion=rnd.choice(RELIGIONS),
+                marital_statuses=rnd.choice([[], ['never_married'], ['divorced', 'widowed'], 'divorced']),
+                country=rnd.choice([[], ['BD'], ['us', 'GB'], 'CA', ['']]),
+                profession=rnd.choice(PREFERRED_PROFESSIONS),
+                looking_for_gender=rnd.choice(['bride', 'groom', 'any', None]),
+                location_preference=rnd.choice(['near_me', 'abroad', 'any', None]),
+            )
+    # Save signals refresh MatchFeatures on commit, which a TestCase never reaches
+    for _ in MatchFeatureService.rebuild():
+        pass
+
+
+class WorkerStateTestCase(TestCase):
+    """Starts every test without this worker's in-memory indexes and cached results."""
+
+    def setUp(self):
+        cache.clear()
+        PairScoreCache._local.clear()
+        # Work scheduled by earlier tests' saves, whose commit never came
+        ProfileSyncService._pending.entries = {}
+        for index in (CandidateIndex, ProfessionIndex, EmbeddingIndex, Gazetteer):
+            index._instance = None
+
+    @contextmanager
+    def committed(self):
+        """Run the block in a transaction, then its on_commit work, like a request that commits."""
+        # The search document is PostgreSQL-only
+        search = nullcontext() if connection.vendor == 'postgresql' else mock.patch.object(ProfileSearchService, 'refresh')
+        with search, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                yield
+
+
+class SQLScoringParityTests(WorkerStateTestCase):
+    """The SQL-pushdown backend ranks recommendations exactly like the NumPy engine."""
+
+    def test_randomized_rankings_match(self):
+        # Blended scores are NumPy-only; both are off by default
+        self.assertEqual(MatchingService.faith_tag_weight(), 0)
+        self.assertEqual(MatchingService.proximity_weight(), 0)
+        for seed in (1, 2):
+            Profile.objects.all().delete()
+            self.setUp()
+            make_random_profiles(60, seed)
+            ranked = 0
+            for viewer in Profile.objects.select_related('preference').order_by('id')[:25]:
+                python = MatchingService.build_ranking(viewer, size=None, backend='python')
+                sql = MatchingService.build_ranking(viewer, size=None, backend='sql')
+                ranked += len(python['ids'])
+                with self.subTest(seed=seed, viewer=viewer.pk):
+                    for key in ('ids', 'scores', 'reasons'):
+                        self.assertEqual(python[key].tolist(), sql[key].tolist(), key)
+                    for key in ('relaxation', 'level_counts', 'complete'):
+                        self.assertEqual(python[key], sql[key], key)
+            self.assertGreater(ranked, 0)
+
+    def test_seen_candidates_are_skipped_before_relaxation(self):
+        make_random_profiles(60, 4)
+        rnd = random.Random(4)
+        ids = list(Profile.objects.values_list('id', flat=True))
+        relaxed = 0
+        for viewer in Profile.objects.select_related('preference').order_by('id')[:25]:
+            seen = BloomFilter.sized(100, 0.01)
+            seen.add(np.array(rnd.sample(ids, 40), dtype=np.int64))
+            python = MatchingService.build_ranking(viewer, size=None, backend='python', seen=seen)
+            sql = MatchingService.build_ranking(viewer, size=None, backend='sql', seen=seen)
+            with self.subTest(viewer=viewer.pk):
+                for key in ('ids', 'scores', 'reasons'):
+                    self.assertEqual(python[key].tolist(), sql[key].tolist(), key)
+                for key in ('relaxation', 'level_counts', 'complete'):
+                    self.assertEqual(python[key], sql[key], key)
+                self.assertFalse(seen.contains(sql['ids']).any())
+            unfiltered = MatchingService.build_ranking(viewer, size=None, backend='sql')
+            relaxed += sql['relaxation'] != unfiltered['relaxation']
+        # Hiding seen candidates must change the level chosen for someone
+        self.assertGreater(relaxed, 0)
+
+    def test_truncated_rankings_match(self):
+        make_random_profiles(60, 3)
+        for viewer in Profile.objects.select_related('preference').order_by('id')[:10]:
+            python = MatchingService.build_ranking(viewer, size=5, backend='python')
+            sql = MatchingService.build_ranking(viewer, size=5, backend='sql')
+            with self.subTest(viewer=viewer.pk):
+                self.assertEqual(python['ids'].tolist(), sql['ids'].tolist())
+                self.assertEqual(python['floor'], sql['floor'])
+
+
+class VectorizedScoringTests(WorkerStateTestCase):
+    """score_many reproduces the legacy pair-by-pair compatibility scores."""
+
+    @staticmethod
+    def _normalized(result):
+        return None if result is None else (result['score'], sorted(result['reasons']))
+
+    def test_matches_legacy_scores(self):
+        # Located profiles, so a non-zero default proximity weight would show
+        make_cities()
+        make_random_profiles(50, 11)
+        profiles = list(Profile.objects.select_related('preference').prefetch_related('work_experience'))
+        scored = 0
+        for viewer in profiles[:20]:
+            # Default blend weights: the legacy weights exactly
+            batch = MatchingService.score_many(viewer, Profile.objects.all())
+            for other in profiles:
+                expected = MatchingService.calculate_compatibility_score(viewer, other)
+                with self.subTest(viewer=viewer.pk, other=other.pk):
+                    self.assertEqual(self._normalized(batch.get(other.pk)), self._normalized(expected))
+                scored += expected is not None
+        self.assertGreater(scored, 0)
+
+    def test_instances_and_querysets_score_alike(self):
+        make_random_profiles(20, 12)
+        viewer = Profile.objects.order_by('id').first()
+        by_queryset = MatchingService.score_many(viewer, Profile.objects.all()).as_dict()
+        by_ids = MatchingService.score_many(viewer, list(Profile.objects.values_list('id', flat=True))).as_dict()
+        self.assertEqual(by_queryset, by_ids)
+
+    def test_score_pair_matches_legacy(self):
+        make_random_profiles(10, 13)
+        first, *others = Profile.objects.select_related('preference').order_by('id')
+        for other in others:
+            with self.subTest(other=other.pk):
+                self.assertEqual(
+                    self._normalized(MatchingService.score_pair(first, other)),
+                    self._normalized(MatchingService.calculate_compatibility_score(first, other)),
+                )
+
+    def test_profession_word_prefix_semantics(self):
+        # Each word of the preference must start a word of one title
+        viewer = make_profile(gender='male')
+        preference = Preference.objects.create(profile=viewer)
+        candidate = make_profile()
+        for title in ('Senior Software Engineer', 'Teacher'):
+            WorkExperience.objects.create(profile=candidate, title=title, company='Test')
+        cases = [
+            ('eng', True), ('software eng', True), ('TEACH', True), ('engineer senior', True),
+            ('neer', False), ('engineer teacher', False), ('doctor', False),
+        ]
+        for term, expected in cases:
+            preference.profession = [term]
+            preference.save()
+            for _ in MatchFeatureService.rebuild():
+                pass
+            viewer = Profile.objects.select_related('preference').get(pk=viewer.pk)
+            legacy = MatchingService.calculate_one_way_score(viewer, candidate)
+            batch = MatchingService.score_many(viewer, [candidate.pk])
+            with self.subTest(term=term):
+                self.assertEqual('Profession' in legacy['reasons'], expected)
+                self.assertEqual(legacy['score'], 100 if expected else 0)
+                self.assertEqual('Profession' in batch.get(candidate.pk)['reasons'], expected)
+
+
+class PairScoreCacheTests(WorkerStateTestCase):
+    """Cached pair scores follow the profiles' MatchFeatures rows on every worker."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(gender='male', date_of_birth=date(1990, 1, 1), religion='islam')
+        self.other = make_profile(gender='female', date_of_birth=date(1994, 1, 1), religion='islam')
+        self.preference = Preference.objects.create(profile=self.other, min_age=25, max_age=45, religion='islam')
+        for _ in MatchFeatureService.rebuild():
+            pass
+
+    def _expected(self):
+        viewer, other = Profile.objects.select_related('preference').filter(
+            pk__in=[self.viewer.pk, self.other.pk]).order_by('id')
+        return MatchingService.calculate_compatibility_score(viewer, other)
+
+    def test_cached_score_matches_legacy(self):
+        expected = self._expected()
+        self.assertEqual(PairScoreCache.get(self.viewer, self.other), expected)
+        # A hit reads the two weight settings and the rows' versions, and scores nothing
+        with self.assertNumQueries(3), mock.patch.object(MatchingService, 'score_many') as score_many:
+            self.assertEqual(PairScoreCache.get(self.other, self.viewer), expected)
+        score_many.assert_not_called()
+
+    def test_preference_save_changes_the_score(self):
+        before = PairScoreCache.get(self.viewer, self.other)
+        with self.committed():
+            self.preference.max_age = 30
+            self.preference.save()
+        after = PairScoreCache.get(self.viewer, self.other)
+        self.assertNotEqual(after, before)
+        self.assertEqual(after, self._expected())
+
+    def test_refresh_on_another_worker_is_seen(self):
+        before = PairScoreCache.get(self.viewer, self.other)
+        # Another worker saved the profile: this worker's tiers were never told
+        Profile.objects.filter(pk=self.viewer.pk).update(religion='hinduism')
+        MatchFeatureService.refresh(self.viewer.pk)
+        after = PairScoreCache.get(self.viewer, self.other)
+        self.assertNotEqual(after, before)
+        self.assertEqual(after, self._expected())
+
+    def test_profiles_without_features_are_scored_uncached(self):
+        newcomer = make_profile(gender='female', date_of_birth=date(1995, 1, 1))
+        Profile.objects.filter(pk=newcomer.pk).update(religion='islam')
+        scores = PairScoreCache.get_many(self.viewer, [newcomer.pk])
+        viewer = Profile.objects.get(pk=self.viewer.pk)
+        self.assertEqual(scores[newcomer.pk], MatchingService.calculate_compatibility_score(
+            viewer, Profile.objects.get(pk=newcomer.pk)))
+
+
+class SeenSuppressionTests(WorkerStateTestCase):
+    """Recommendations skip profiles already shown, opened or exchanged interests with."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer', gender='male')
+        self.others = [make_profile(gender='female') for _ in range(12)]
+        for _ in MatchFeatureService.rebuild():
+            pass
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer.user)
+
+    def _get(self, **params):
+        response = self.client.get('/api/profiles/recommendations/', {'limit': 5, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def _ids(self, **params):
+        return [match['id'] for match in self._get(**params).json()['matches']]
+
+    @staticmethod
+    def _timing(response):
+        """{metric: desc} of the Server-Timing header."""
+        timing = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, _, rest = metric.partition(';')
+            timing[name] = rest.rpartition('desc=')[2].strip('"')
+        return timing
+
+    def test_pages_are_not_recommended_again(self):
+        shown = [self._ids() for _ in range(3)]
+        self.assertEqual([len(page) for page in shown], [5, 5, 2])
+        self.assertCountEqual(sum(shown, []), [p.pk for p in self.others])
+
+    def test_interactions_are_skipped(self):
+        opened, liked = self.others[:2]
+        ProfileView.objects.create(viewer=self.viewer, viewed_profile=opened)
+        Interest.objects.create(sender=liked, receiver=self.viewer)
+        self.assertCountEqual(
+            self._ids(limit=20), [p.pk for p in self.others if p not in (opened, liked)])
+        # Signals add interactions to an existing filter
+        opened_later = self.others[2]
+        SeenFilter.objects.all().delete()
+        self._ids(limit=1)
+        ProfileView.objects.create(viewer=self.viewer, viewed_profile=opened_later)
+        self.assertNotIn(opened_later.pk, self._ids(limit=20))
+
+    def test_exhausted_filter_starts_over(self):
+        opened = self.others[0]
+        ProfileView.objects.create(viewer=self.viewer, viewed_profile=opened)
+        pages = [self._ids() for _ in range(3)]
+        self.assertEqual([len(page) for page in pages], [5, 5, 1])
+        response = self._get()
+        # Impressions are forgotten, interactions are not
+        self.assertEqual([match['id'] for match in response.json()['matches']], pages[0])
+        self.assertNotIn(opened.pk, pages[0])
+        # One cache lookup, reported once
+        self.assertEqual(response.json()['cache']['status'], 'hit')
+        timing = self._timing(response)
+        self.assertEqual([name for name in timing if name.startswith('cache_')], ['cache_hit'])
+
+    def test_filter_is_read_and_written_once(self):
+        self._ids()
+        response = self._get()
+        # The filter row, the two sizing settings and one UPDATE
+        self.assertEqual(self._timing(response)['seen'], '4 queries')
+        self.assertEqual(len(response.json()['matches']), 5)
+
+
+class RecommendationCacheTests(WorkerStateTestCase):
+    """Cached rankings follow changes of the viewer, the candidates and interests."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer', gender='male', religion='islam', date_of_birth=date(1990, 1, 1))
+        self.preference = Preference.objects.create(profile=self.viewer, looking_for_gender='bride')
+        self.muslims = [
+            make_profile(gender='female', religion='islam', date_of_birth=date(1990 + n, 1, 1)) for n in range(5)
+        ]
+        self.hindu = make_profile(gender='female', religion='hinduism', date_of_birth=date(1992, 1, 1))
+        for _ in MatchFeatureService.rebuild():
+            pass
+        self.client = APIClient()
+
+    def _get(self, limit=20):
+        # A fresh user per request, as in production (no profile or preference cached on it)
+        self.client.force_authenticate(User.objects.get(pk=self.viewer.user_id))
+        response = self.client.get('/api/profiles/recommendations/', {'limit': limit})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        return [match['id'] for match in data['matches']], data['cache']
+
+    def _forget_impressions(self):
+        # Every page is remembered as seen; these tests look at the ranking itself
+        SeenFilter.objects.all().delete()
+
+    def test_hit_after_miss(self):
+        ids, status = self._get()
+        self.assertEqual((status['status'], status['refreshed_candidates']), ('miss', 0))
+        self._forget_impressions()
+        cached_ids, status = self._get()
+        self.assertEqual(cached_ids, ids)
+        self.assertEqual((status['status'], status['refreshed_candidates']), ('hit', 0))
+
+    def test_preference_change_rebuilds(self):
+        ids, _ = self._get()
+        self.assertIn(self.hindu.pk, ids)
+        self._forget_impressions()
+        with self.committed():
+            self.preference.religion = 'islam'
+            self.preference.save()
+        ids, status = self._get()
+        self.assertEqual(status['status'], 'miss')
+        self.assertCountEqual(ids, [p.pk for p in self.muslims])
+
+    def test_preference_change_on_another_worker_rebuilds(self):
+        self._get()
+        self._forget_impressions()
+        # Saved elsewhere: this worker's version stamp was never bumped
+        Preference.objects.filter(pk=self.preference.pk).update(religion='islam')
+        MatchFeatureService.refresh(self.viewer.pk)
+        ids, status = self._get()
+        self.assertEqual(status['status'], 'miss')
+        self.assertNotIn(self.hindu.pk, ids)
+
+    def test_candidate_change_is_merged(self):
+        ids, _ = self._get()
+        self.assertIn(self.hindu.pk, ids)
+        self._forget_impressions()
+        with self.committed():
+            self.hindu.gender = 'male'
+            self.hindu.save()
+        ids, status = self._get()
+        self.assertEqual(status['status'], 'hit')
+        self.assertEqual(status['refreshed_candidates'], 1)
+        self.assertNotIn(self.hindu.pk, ids)
+        self.assertEqual(len(ids), len(self.muslims))
+
+    def test_interest_hides_candidate(self):
+        self._get(limit=2)
+        # Everything after the first page, in ranking order
+        expected, _ = self._get(limit=20)
+        self._forget_impressions()
+        self._get(limit=2)
+        liked = expected[0]
+        Interest.objects.create(sender=self.viewer, receiver_id=liked)
+        ids, status = self._get(limit=20)
+        self.assertEqual(status['status'], 'hit')
+        self.assertEqual(ids, [pid for pid in expected if pid != liked])
+
+
+class ViewerContextTests(WorkerStateTestCase):
+    """Card lists read the viewer's interests with a whole page in one query."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer')
+        self.client = APIClient()
+
+    def _cards(self):
+        self.client.force_authenticate(User.objects.get(pk=self.viewer.user.pk))
+        results = self.client.get('/api/profiles/', {'view': 'card', 'limit': 50}).json()['results']
+        return {item['id']: item for item in results}
+
+    def _count_queries(self):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            self._cards()
+        return len(queries)
+
+    def test_interest_queries_do_not_grow_with_the_page(self):
+        def add_profiles(count):
+            for _ in range(count):
+                other = make_profile()
+                Interest.objects.create(sender=self.viewer, receiver=other, status='accepted', share_type='full')
+        # Warm requests first: the first one builds the new profiles' match features
+        add_profiles(2)
+        self._cards()
+        small = self._count_queries()
+        add_profiles(6)
+        self._cards()
+        with self.assertNumQueries(small):
+            cards = self._cards()
+        self.assertEqual(sum(card['interest'] is not None for card in cards.values()), 8)
+
+    def test_first_interest_by_primary_key(self):
+        # Same choice as the serializers' former `.first()`: lowest primary key, not newest
+        other = make_profile(name='Other Person')
+        older = Interest.objects.create(sender=self.viewer, receiver=other, status='rejected')
+        Interest.objects.create(sender=other, receiver=self.viewer, status='accepted', share_type='full')
+        Interest.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=30))
+        card = self._cards()[other.pk]
+        self.assertEqual(card['interest']['id'], older.pk)
+        self.assertEqual(card['interest']['status'], 'rejected')
+        # ...while the accepted one still unlocks the card
+        self.assertTrue(card['is_unlocked'])
+        self.assertEqual(card['name'], 'Other Person')
+
+
+class CandidateIndexTests(WorkerStateTestCase):
+    """The candidate index follows bulk writes and falls back to iexact for unknown spellings."""
+
+    def setUp(self):
+        super().setUp()
+        self.profiles = [make_profile(gender=gender) for gender in ('female', 'Female', 'male')]
+        # Older than the delta sync's overlap, so only a new stamp makes a row sync
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE api_profile SET updated_at = %s', [timezone.now() - timedelta(days=1)])
+        self.index = CandidateIndex.get()
+
+    def _matching(self, value):
+        return set(Profile.objects.filter(self.index.iexact_q('gender', value)).values_list('pk', flat=True))
+
+    def test_iexact_q(self):
+        first, second, third = (p.pk for p in self.profiles)
+        self.assertEqual(self.index.iexact_q('gender', 'FEMALE'), Q(gender__in=['Female', 'female']))
+        self.assertEqual(self._matching('FEMALE'), {first, second})
+        # A spelling written behind the index's back is still found by iexact
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE api_profile SET gender = %s WHERE id = %s', ['Other', third])
+        self.assertEqual(self.index.iexact_q('gender', 'other'), Q(gender__iexact='other'))
+        self.assertEqual(self._matching('other'), {third})
+
+    def test_bulk_writes_reach_the_delta_sync(self):
+        first, second, third = self.profiles
+        Profile.objects.filter(pk=first.pk).update(gender='male')
+        second.is_deleted = True
+        Profile.objects.bulk_update([second], ['is_deleted'])
+        index = CandidateIndex.get(fresh=True)
+        self.assertEqual(list(index.select(gender='male')), [first.pk, third.pk])
+        self.assertEqual(list(index.select(gender='female')), [])
+
+
+class PrecomputeMatchesTests(WorkerStateTestCase):
+    """precompute_matches stores the rankings a live rebuild would produce."""
+
+    def _precompute(self, **options):
+        out = io.StringIO()
+        call_command('precompute_matches', top_n=10, workers=1, chunk_size=7, task_size=3, stdout=out, **options)
+        return out.getvalue()
+
+    def test_rows_match_live_rankings(self):
+        make_random_profiles(40, 21)
+        self._precompute(run_id='night-1')
+        viewers = Profile.objects.filter(is_activated=True, is_deleted=False).select_related('preference')
+        self.assertEqual(PrecomputedMatch.objects.filter(run_id='night-1').count(), viewers.count())
+        for viewer in viewers:
+            live = MatchingService.build_ranking(viewer, size=10)
+            stored = RecommendationCache.precomputed(viewer.pk)
+            with self.subTest(viewer=viewer.pk):
+                for key in ('ids', 'scores', 'reasons'):
+                    self.assertEqual(stored[key].tolist(), live[key].tolist(), key)
+                for key in ('relaxation', 'level_counts', 'complete', 'fallback_message'):
+                    self.assertEqual(stored[key], live[key], key)
+
+    def test_resume_skips_written_viewers(self):
+        make_random_profiles(12, 22)
+        self._precompute(run_id='night-1')
+        self.assertIn('Nothing to precompute', self._precompute(run_id='night-1', resume=True))
+        PrecomputedMatch.objects.filter(profile_id__in=Profile.objects.order_by('id').values('id')[:5]).delete()
+        self.assertIn('5/5 profiles written', self._precompute(run_id='night-1', resume=True))
+
+    def test_recommendations_start_from_precomputed_row(self):
+        make_random_profiles(30, 23)
+        self._precompute()
+        row = max(PrecomputedMatch.objects.all(), key=lambda row: len(row.candidate_ids))
+        self.assertGreater(len(row.candidate_ids), 5)
+        viewer = Profile.objects.select_related('preference').get(pk=row.profile_id)
+        with mock.patch.object(MatchingService, 'build_ranking', wraps=MatchingService.build_ranking) as build:
+            result = MatchingService.get_ranked_recommendations(viewer, limit=5)
+        build.assert_not_called()
+        self.assertEqual(result['cache']['status'], 'precomputed')
+        expected = MatchingService.build_ranking(viewer, size=5)['ids'].tolist()
+        self.assertEqual([match['profile'].pk for match in result['matches']], expected)
+
+
+class RelaxationTests(WorkerStateTestCase):
+    """One scored pool serves the strict ranking and the relaxed fallback."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(gender='male', current_country='BD', date_of_birth=date(1992, 1, 1))
+        Preference.objects.create(
+            profile=self.viewer, looking_for_gender='bride', location_preference='near_me', min_age=20, max_age=45,
+        )
+
+    def _candidates(self, country, count):
+        return [
+            make_profile(current_country=country, date_of_birth=date(1995, 1, 1) + timedelta(days=i))
+            for i in range(count)
+        ]
+
+    def _ranking(self, backend='python'):
+        for _ in MatchFeatureService.rebuild():
+            pass
+        viewer = Profile.objects.select_related('preference').get(pk=self.viewer.pk)
+        with mock.patch.object(MatchingService, 'iter_scores', wraps=MatchingService.iter_scores) as iter_scores:
+            entry = MatchingService.build_ranking(viewer, size=None, backend=backend)
+        return entry, iter_scores
+
+    def test_strict_level_with_enough_matches(self):
+        local = self._candidates('BD', MIN_MATCHES)
+        self._candidates('US', 2)
+        entry, iter_scores = self._ranking()
+        self.assertEqual(entry['relaxation'], 0)
+        self.assertEqual(entry['level_counts'], [MIN_MATCHES, MIN_MATCHES + 2])
+        self.assertEqual(set(entry['ids'].tolist()), {p.pk for p in local})
+        self.assertFalse(entry['is_fallback'])
+        self.assertIsNone(entry['fallback_message'])
+        iter_scores.assert_called_once()
+
+    def test_location_fallback_from_the_same_pool(self):
+        everyone = self._candidates('BD', MIN_MATCHES - 1) + self._candidates('US', 2)
+        entry, iter_scores = self._ranking()
+        self.assertEqual(entry['relaxation'], 1)
+        self.assertEqual(entry['level_counts'], [MIN_MATCHES - 1, MIN_MATCHES + 1])
+        self.assertEqual(set(entry['ids'].tolist()), {p.pk for p in everyone})
+        self.assertTrue(entry['is_fallback'])
+        self.assertIn(get_country_name('BD'), entry['fallback_message'])
+        # Scored once, under the loosest filters
+        iter_scores.assert_called_once()
+        self.assertEqual(sorted(iter_scores.call_args.args[1].tolist()), sorted(p.pk for p in everyone))
+        sql, _ = self._ranking(backend='sql')
+        self.assertEqual((sql['relaxation'], sql['ids'].tolist()), (1, entry['ids'].tolist()))
+
+    def test_any_location_never_falls_back(self):
+        Preference.objects.filter(profile=self.viewer).update(location_preference='any')
+        self._candidates('US', 1)
+        entry, _ = self._ranking()
+        self.assertEqual((entry['relaxation'], entry['is_fallback']), (0, False))
+        self.assertEqual(len(entry['ids']), 1)
+
+
+class CursorPagingTests(WorkerStateTestCase):
+    """Recommendation pages continue from an opaque cursor without repeats or gaps."""
+
+    def setUp(self):
+        super().setUp()
+        make_random_profiles(80, 31)
+        # The viewer with the longest full ranking
+        rankings = [
+            (MatchingService.build_ranking(viewer, size=None), viewer)
+            for viewer in Profile.objects.select_related('preference').order_by('id')[:20]
+        ]
+        self.full, self.viewer = max(rankings, key=lambda item: len(item[0]['ids']))
+        self.assertGreaterEqual(len(self.full['ids']), 20)
+
+    def _pages(self, limit):
+        pages, after = [], None
+        while True:
+            result = MatchingService.get_ranked_recommendations(self.viewer, limit=limit, after=after)
+            pages.append(result)
+            if result['next_cursor'] is None:
+                return pages
+            after = MatchingService.decode_cursor(result['next_cursor'])
+
+    def _ids(self, pages):
+        return [match['profile'].pk for page in pages for match in page['matches']]
+
+    def test_pages_cover_the_ranking_once(self):
+        pages = self._pages(limit=7)
+        self.assertEqual(self._ids(pages), self.full['ids'].tolist())
+        self.assertEqual(pages[0]['cache']['status'], 'miss')
+        self.assertEqual({page['cache']['status'] for page in pages[1:]}, {'hit'})
+
+    def test_deep_pages_past_a_truncated_head(self):
+        # A 10-deep cached head is extended (rebuilt deeper) when a page runs past it
+        with mock.patch('api.services.matching_service.RECOMMENDATION_CACHE_SIZE', 10):
+            pages = self._pages(limit=4)
+        self.assertEqual(self._ids(pages), self.full['ids'].tolist())
+        self.assertEqual(len(set(self._ids(pages))), len(self.full['ids']))
+
+    def test_tampered_cursor_is_rejected(self):
+        cursor = MatchingService.encode_cursor(80, self.full['ids'][0])
+        self.assertEqual(MatchingService.decode_cursor(cursor), (80, int(self.full['ids'][0])))
+        client = APIClient()
+        client.force_authenticate(self.viewer.user)
+        response = client.get('/api/profiles/recommendations/', {'cursor': cursor[:-2] + 'xx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MutualFilterTests(WorkerStateTestCase):
+    """With recommendation_mutual_filter on, candidates whose preferences reject the viewer are dropped."""
+
+    # Candidate preference -> whether it accepts the viewer below
+    CASES = {
+        'no preference': (None, True),
+        'accepts all': (dict(min_age=25, max_age=35, religion='Muslim', country=['bd'], marital_statuses=['never_married'],
+                             profession=['software eng'], min_height_inches=60), True),
+        'too young': (dict(min_age=20, max_age=25), False),
+        'other religion': (dict(religion='hindu'), False),
+        'other country': (dict(country=['US', 'GB']), False),
+        'divorced only': (dict(marital_statuses=['divorced']), False),
+        'doctors only': (dict(profession=['doctor']), False),
+        'too short': (dict(min_height_inches=66), False),
+    }
+
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        self.viewer = make_profile(
+            gender='female', date_of_birth=today.replace(year=today.year - 30), religion='muslim',
+            current_country='BD', marital_status='never_married', height_inches=62,
+        )
+        WorkExperience.objects.create(profile=self.viewer, title='Senior Software Engineer', company='Test')
+        Preference.objects.create(profile=self.viewer, looking_for_gender='groom')
+        self.expected = set()
+        self.candidates = {}
+        for name, (preference, accepts) in self.CASES.items():
+            candidate = make_profile(gender='male', name=name)
+            if preference is not None:
+                Preference.objects.create(profile=candidate, **preference)
+            self.candidates[candidate.pk] = name
+            if accepts:
+                self.expected.add(candidate.pk)
+        for _ in MatchFeatureService.rebuild():
+            pass
+        self.viewer = Profile.objects.select_related('preference').get(pk=self.viewer.pk)
+
+    def _names(self, ids):
+        return sorted(self.candidates[int(pid)] for pid in ids)
+
+    def test_scorers_drop_rejecting_candidates(self):
+        scored = MatchingService.score_many(self.viewer, list(self.candidates)).as_dict()
+        mutual = MatchingService.score_many(self.viewer, list(self.candidates), mutual=True).as_dict()
+        self.assertEqual(self._names(scored), sorted(self.CASES))
+        self.assertEqual(self._names(mutual), self._names(self.expected))
+        # Accepted candidates keep their averaged score
+        self.assertEqual(mutual, {pid: scored[pid] for pid in mutual})
+
+    def test_recommendations_follow_the_setting(self):
+        for backend in ('python', 'sql'):
+            AppConfig.objects.filter(key='recommendation_mutual_filter').delete()
+            cache.clear()
+            with self.subTest(backend=backend):
+                everyone = MatchingService.get_ranked_recommendations(self.viewer, limit=20, backend=backend)
+                self.assertEqual(len(everyone['matches']), len(self.CASES))
+                # The cached ranking was built without the filter, so it is rebuilt
+                AppConfig.objects.create(key='recommendation_mutual_filter', value=True)
+                mutual = MatchingService.get_ranked_recommendations(self.viewer, limit=20, backend=backend)
+                self.assertEqual(mutual['cache']['status'], 'miss')
+                self.assertEqual(self._names(m['profile'].pk for m in mutual['matches']), self._names(self.expected))
+
+
+class PipelineMetricsTests(WorkerStateTestCase):
+    """Recommendation requests report their stages as Server-Timing and in the admin histograms."""
+
+    def setUp(self):
+        super().setUp()
+        PipelineMetrics._histograms = None
+        make_random_profiles(60, 51)
+        # The viewer with the most matches, so later pages come from the cache
+        self.viewer = max(
+            Profile.objects.select_related('preference').order_by('id')[:20],
+            key=lambda viewer: len(MatchingService.build_ranking(viewer, size=None)['ids']),
+        )
+        self.client = APIClient()
+
+    def _recommend(self):
+        self.client.force_authenticate(User.objects.get(pk=self.viewer.user_id))
+        response = self.client.get('/api/profiles/recommendations/', {'limit': 5})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_server_timing_lists_stages_and_counters(self):
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self._recommend()
+        metrics = {}
+        for metric in response['Server-Timing'].split(', '):
+            name, *params = metric.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        for stage in ('cache', 'filter', 'score', 'rank', 'prefetch', 'rerank', 'serialize', 'seen'):
+            self.assertIn(stage, metrics)
+            self.assertGreaterEqual(float(metrics[stage]['dur']), 0)
+        self.assertIn('dur', metrics['total'])
+        self.assertEqual(metrics['fallback']['desc'], f'"{response.json()["is_fallback"]}"')
+        self.assertEqual(metrics['cache_miss']['desc'], '"True"')
+        self.assertGreater(int(metrics['pool_size']['desc'].strip('"')), 0)
+        # Stage query counts are the request's own queries
+        counted = sum(
+            int(params['desc'].strip('"').split()[0]) for params in metrics.values() if 'queries' in params.get('desc', '')
+        )
+        self.assertGreater(counted, 0)
+        self.assertLessEqual(counted, len(queries))
+
+    def test_stages_outside_a_request_are_not_recorded(self):
+        MatchingService.get_ranked_recommendations(self.viewer, limit=5)
+        self.assertIsNone(PipelineMetrics._histograms)
+
+    def test_admin_histograms_merge_workers(self):
+        self._recommend()
+        self._recommend()
+        PipelineMetrics.flush()
+        # A second worker's histograms, flushed to the shared cache
+        with mock.patch.object(PipelineMetrics, '_worker_id', 'other-host:1'), \
+                mock.patch.object(PipelineMetrics, '_histograms', None):
+            self._recommend()
+            PipelineMetrics.flush()
+
+        self.client.force_authenticate(self.viewer.user)
+        self.assertEqual(self.client.get('/api/analytics/admin/recommendations/').status_code, 403)
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        snapshot = self.client.get('/api/analytics/admin/recommendations/').json()
+        self.assertEqual((snapshot['workers'], snapshot['requests']), (2, 3))
+        self.assertEqual(snapshot['stages']['total']['count'], 3)
+        self.assertEqual(sum(bucket['count'] for bucket in snapshot['stages']['score']['histogram_ms']), 1)
+        self.assertEqual(snapshot['counters']['cache_miss'], 1)
+        self.assertEqual(snapshot['counters']['cache_hit'], 2)
+
+
+class CoViewSimilarityTests(WorkerStateTestCase):
+    """build_profile_similarity stores the top co-viewed profiles of each profile."""
+
+    def setUp(self):
+        super().setUp()
+        self.profiles = [make_profile() for _ in range(12)]
+        rnd = random.Random(61)
+        self.views = set()
+        for viewer in self.profiles:
+            for viewed in rnd.sample(self.profiles, 5):
+                if viewed != viewer:
+                    ProfileView.objects.create(viewer=viewer, viewed_profile=viewed, source='search')
+                    self.views.add((viewer.pk, viewed.pk))
+        # A repeat view counts once; a view older than --days not at all
+        ProfileView.objects.create(viewer=self.profiles[0], viewed_profile=self.profiles[1])
+        self.views.add((self.profiles[0].pk, self.profiles[1].pk))
+        old = ProfileView.objects.create(viewer=make_profile(), viewed_profile=self.profiles[3])
+        ProfileView.objects.filter(pk=old.pk).update(viewed_at=timezone.now() - timedelta(days=60))
+
+    def _build(self, **options):
+        call_command('build_profile_similarity', days=30, top_k=3, min_coviews=2, block_size=5, stdout=io.StringIO(), **options)
+
+    def _expected(self, top_k=3, min_coviews=2):
+        viewers = {}
+        for viewer, viewed in self.views:
+            viewers.setdefault(viewed, set()).add(viewer)
+        expected = {}
+        for pid, seen_by in viewers.items():
+            neighbours = []
+            for other, other_seen_by in viewers.items():
+                shared = len(seen_by & other_seen_by)
+                if other != pid and shared >= min_coviews:
+                    neighbours.append((-shared / (len(seen_by) * len(other_seen_by)) ** 0.5, other, shared))
+            if neighbours:
+                top = sorted(neighbours)[:top_k]
+                expected[pid] = ([o for _, o, _ in top], [round(-s, 4) for s, _, _ in top], [c for _, _, c in top])
+        return expected
+
+    def test_rows_match_brute_force(self):
+        self._build()
+        stored = {
+            pid: (ids, scores, coviews)
+            for pid, ids, scores, coviews in ProfileSimilarity.objects.values_list('profile_id', 'similar_ids', 'scores', 'coviews')
+        }
+        expected = self._expected()
+        self.assertTrue(expected)
+        self.assertEqual(stored.keys(), expected.keys())
+        for pid, (ids, scores, coviews) in expected.items():
+            with self.subTest(profile=pid):
+                self.assertEqual(stored[pid][0], ids)
+                self.assertEqual(stored[pid][2], coviews)
+                for got, want in zip(stored[pid][1], scores):
+                    self.assertAlmostEqual(got, want, places=3)
+
+    def test_rerun_drops_profiles_without_neighbours(self):
+        self._build(run_id='first')
+        ProfileView.objects.all().delete()
+        self._build(run_id='second')
+        self.assertFalse(ProfileSimilarity.objects.exists())
+
+    def test_similar_endpoint(self):
+        self._build()
+        pid, (ids, _, _) = next(iter(self._expected().items()))
+        viewer = make_profile()
+        Profile.objects.filter(pk=ids[0]).update(is_deleted=True)
+        client = APIClient()
+        client.force_authenticate(viewer.user)
+        response = client.get(f'/api/profiles/{pid}/similar/')
+        self.assertEqual(response.status_code, 200)
+        similar = response.json()['similar']
+        self.assertEqual([item['id'] for item in similar], ids[1:])
+        self.assertTrue(all(0 < item['similarity'] <= 1 for item in similar))
+
+
+class MoreLikeThisTests(WorkerStateTestCase):
+    """more_like_this returns the nearest attribute embeddings that pass the viewer's hard filters."""
+
+    def setUp(self):
+        super().setUp()
+        make_random_profiles(60, 71)
+        Profile.objects.filter(pk__in=Profile.objects.order_by('-id').values('id')[:5]).update(is_activated=False)
+
+    def _expected(self, viewer, target_id, k):
+        """Brute force: cosine over every embedded profile the hard filters allow."""
+        filters = MatchingService._hard_filters(viewer, MatchingService._recommendation_preferences(viewer))
+        filters['exclude_ids'] = [viewer.pk, target_id]
+        allowed = set(CandidateIndex.get().select(activated_only=True, **filters).tolist())
+        rows = Profile.objects.values_list('id', *EMBEDDED_FIELDS)
+        vectors = {pid: embed(dict(zip(EMBEDDED_FIELDS, values))) for pid, *values in rows}
+        ranked = sorted((-float(vectors[pid] @ vectors[target_id]), pid) for pid in allowed)[:k]
+        return [pid for _, pid in ranked], [-similarity for similarity, _ in ranked]
+
+    def test_matches_brute_force(self):
+        profiles = list(Profile.objects.select_related('preference').order_by('id'))
+        # A narrow first scan, so the filtered search has to widen
+        with mock.patch('api.services.embedding_index.NEAREST_MIN_WIDTH', 4):
+            for viewer, target in zip(profiles[:10], profiles[10:20]):
+                ids, similarities = MatchingService.more_like_this(viewer, target.pk, k=5)
+                expected_ids, expected_similarities = self._expected(viewer, target.pk, 5)
+                with self.subTest(viewer=viewer.pk, target=target.pk):
+                    self.assertEqual(ids.tolist(), expected_ids)
+                    np.testing.assert_allclose(similarities, expected_similarities, rtol=1e-5)
+
+    def test_saved_and_deleted_profiles_are_reembedded(self):
+        viewer, target, twin = make_profile(), make_profile(religion='hindu', current_country='GB'), make_profile()
+        MatchingService.more_like_this(viewer, target.pk)  # builds the index
+        with self.committed():
+            twin.religion, twin.current_country = 'hindu', 'GB'
+            twin.save()
+        ids, similarities = MatchingService.more_like_this(viewer, target.pk, k=1)
+        self.assertEqual((ids.tolist(), round(float(similarities[0]), 4)), ([twin.pk], 1.0))
+        with self.committed():
+            twin.delete()
+        self.assertNotIn(twin.pk, MatchingService.more_like_this(viewer, target.pk)[0].tolist())
+
+    def test_similar_endpoint_by_attributes(self):
+        viewer = Profile.objects.select_related('preference').order_by('id').first()
+        target = Profile.objects.order_by('id')[10]
+        client = APIClient()
+        client.force_authenticate(viewer.user)
+        response = client.get(f'/api/profiles/{target.pk}/similar/', {'by': 'attributes', 'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        expected_ids, _ = self._expected(viewer, target.pk, 5)
+        self.assertEqual([item['id'] for item in response.json()['similar']], expected_ids)
+
+
+class RerankerTests(WorkerStateTestCase):
+    """train_reranker needs enough labelled interests; rerank only reorders with an active model."""
+
+    def setUp(self):
+        super().setUp()
+        make_random_profiles(30, 17)
+        self.ids = list(Profile.objects.order_by('id').values_list('id', flat=True))
+        # Another test's model may still be cached as active
+        reranker._active['checked'] = None
+
+    def _interests(self, count, status=None, days_ago=60):
+        """`count` interests between distinct pairs (none sent by the first profile), sent `days_ago` days ago."""
+        rnd = random.Random(count)
+        pairs = rnd.sample([(s, r) for s in self.ids[1:] for r in self.ids if s != r], count)
+        statuses = [status] if status else ['accepted', 'rejected', 'sent']
+        created = Interest.objects.bulk_create([
+            Interest(sender_id=sender, receiver_id=receiver, status=rnd.choice(statuses))
+            for sender, receiver in pairs
+        ])
+        Interest.objects.filter(pk__in=[i.pk for i in created]).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def _train(self, **options):
+        call_command('train_reranker', stdout=io.StringIO(), **{'activate': True, 'min_pairs': 40, **options})
+
+    def test_refuses_too_few_labelled_pairs(self):
+        self._interests(30)
+        # Recent unanswered interests carry no label yet
+        Interest.objects.bulk_create([
+            Interest(sender_id=self.ids[0], receiver_id=receiver) for receiver in self.ids[1:]
+        ])
+        with self.assertRaisesMessage(CommandError, 'Only 30 labelled interests; at least 40 needed'):
+            self._train()
+        self.assertFalse(RerankerModel.objects.exists())
+        self.assertIsNone(RerankerService.active_weights())
+
+    def test_trains_and_activates_a_version(self):
+        self._interests(120)
+        self._train()
+        self._train(activate=False)
+        first, second = RerankerModel.objects.order_by('version')
+        self.assertEqual((first.version, first.is_active, first.training_pairs), (1, True, 120))
+        self.assertEqual((second.version, second.is_active), (2, False))
+        self.assertEqual(len(first.weights), len(FEATURE_NAMES))
+        np.testing.assert_allclose(RerankerService.active_weights(), first.weights)
+
+    def test_rerank_needs_an_active_model(self):
+        profiles = Profile.objects.in_bulk(self.ids[:4])
+        Profile.objects.filter(pk=self.ids[3]).update(is_verified=True)
+        profiles[self.ids[3]].is_verified = True
+        ranked = [(pid, 90 - n, 0) for n, pid in enumerate(self.ids[:4])]
+        self.assertEqual(RerankerService.rerank(ranked, profiles), ranked)
+
+        weights = np.zeros(len(FEATURE_NAMES))
+        weights[FEATURE_NAMES.index('is_verified')] = 1.0
+        model = RerankerService.save(weights, {}, 0, activate=True)
+        self.assertEqual(RerankerService.rerank(ranked, profiles), [ranked[3], *ranked[:3]])
+
+        with self.assertRaisesMessage(CommandError, 'Reranker version 9 does not exist'):
+            call_command('train_reranker', activate_version=9, stdout=io.StringIO())
+        call_command('train_reranker', activate_version=0, stdout=io.StringIO())
+        self.assertFalse(RerankerModel.objects.get(pk=model.pk).is_active)
+        self.assertEqual(RerankerService.rerank(ranked, profiles), ranked)
+
+
+class MapTilesTests(WorkerStateTestCase):
+    """The map serves cached clusters of opted-in members, dropped when one appears, leaves or moves."""
+
+    def setUp(self):
+        super().setUp()
+        make_cities()
+        # Committed, so later saves do not flush the creations' invalidations with theirs
+        with self.committed():
+            self.dhaka = [make_profile(current_city='Dhaka', current_country='BD') for _ in range(3)]
+            self.london = make_profile(current_city='London', current_country='GB')
+            make_profile(current_city='Narayanganj', current_country='BD')
+            make_profile(current_city='Dhaka', current_country='BD', show_on_map=False)
+            make_profile(current_city='Nowhere', current_country='BD')
+        self.client = APIClient()
+        self.client.force_authenticate(self.london.user)
+
+    def _clusters(self, zoom=9, city='Dhaka'):
+        """{label: count} of the tile holding `city` at `zoom` (unlabelled clusters under None)."""
+        name, country, latitude, longitude = next(c for c in CITIES if c[0] == city)
+        columns, rows = map_tiles._grid_positions(np.array([latitude]), np.array([longitude]), zoom)
+        response = self.client.get('/api/map/', {
+            'z': zoom, 'x': int(columns[0]) // map_tiles.CLUSTER_GRID, 'y': int(rows[0]) // map_tiles.CLUSTER_GRID,
+        })
+        self.assertEqual(response.status_code, 200)
+        return {cluster.get('city'): cluster['count'] for tile in response.json()['tiles'] for cluster in tile['clusters']}
+
+    def test_world_clusters(self):
+        response = self.client.get('/api/map/', {'z': 0})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['count'], 5)
+        # Dhaka and Narayanganj share a cell at zoom 0, and have cells of one tile at zoom 9
+        clusters = sorted((cluster['count'], cluster.get('city')) for cluster in body['tiles'][0]['clusters'])
+        self.assertEqual(clusters, [(1, 'London'), (4, None)])
+        self.assertEqual(self._clusters(), {'Dhaka': 3, 'Narayanganj': 1})
+
+        for params in ({'z': 13}, {'z': 3}, {'z': 1, 'x': 0}, {'z': 1, 'x': 2, 'y': 0}, {'z': 'a'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/map/', params).status_code, 400)
+
+    def test_saves_drop_the_affected_tiles(self):
+        self.assertEqual(self._clusters(), {'Dhaka': 3, 'Narayanganj': 1})
+        self.assertEqual(self._clusters(city='London'), {'London': 1})
+
+        moved, hidden = self.dhaka[:2]
+        with self.committed():
+            moved.current_city = 'Narayanganj'
+            moved.save()
+            hidden.show_on_map = False
+            hidden.save()
+        self.assertEqual(self._clusters(), {'Dhaka': 1, 'Narayanganj': 2})
+
+        # A save that leaves the member where they were keeps the cached tiles
+        version = map_tiles.MapService.version()
+        with mock.patch.object(map_tiles.MapService, '_clusters', wraps=map_tiles.MapService._clusters) as clusters:
+            with self.committed():
+                self.london.name = 'Renamed'
+                self.london.save()
+            self.assertEqual(self._clusters(city='London'), {'London': 1})
+            self.assertEqual(self._clusters(), {'Dhaka': 1, 'Narayanganj': 2})
+        clusters.assert_not_called()
+        self.assertEqual(map_tiles.MapService.version(), version)
+
+        with self.committed():
+            hidden.show_on_map = True
+            hidden.save()
+            self.london.delete()
+        self.assertEqual(self._clusters(), {'Dhaka': 2, 'Narayanganj': 2})
+        self.assertEqual(self._clusters(city='London'), {})
+
+    def test_save_of_a_partly_loaded_profile_bumps_the_version(self):
+        self.assertEqual(self._clusters(), {'Dhaka': 3, 'Narayanganj': 1})
+        version = map_tiles.MapService.version()
+        profile = Profile.objects.only('id', 'show_on_map').get(pk=self.dhaka[0].pk)
+        with self.committed():
+            profile.show_on_map = False
+            profile.save()
+        self.assertNotEqual(map_tiles.MapService.version(), version)
+        self.assertEqual(self._clusters(), {'Dhaka': 2, 'Narayanganj': 1})
+
+
+class ProfileSearchTests(WorkerStateTestCase):
+    """?search= ranks the weighted search document (plus name/city trigrams); ?interest= looks at titles and text only."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer')
+        with self.committed():
+            self.rahman = make_profile(name='Anika Rahman', current_city='Chittagong', about='Loves hiking')
+            self.engineer = make_profile(name='Nadia Islam', current_city='Dhaka', about='Family oriented')
+            self.title = WorkExperience.objects.create(profile=self.engineer, title='Software Engineer', company='Test')
+            self.student = make_profile(name='Sara Ahmed', current_city='London', about='Studying to be an engineer in Dhaka')
+            self.seeker = make_profile(name='Mim', looking_for='An engineer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer.user)
+
+    def _ids(self, **params):
+        response = self.client.get('/api/profiles/', {'limit': 50, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [item['id'] for item in response.json()['results']]
+
+    @requires_postgres
+    def test_ranked_by_field(self):
+        # Current city (B) outranks about (D)
+        self.assertEqual(self._ids(search='dhaka'), [self.engineer.pk, self.student.pk])
+        # Job title and looking_for (C) outrank about
+        ranked = self._ids(search='engineer')
+        self.assertEqual(set(ranked[:2]), {self.engineer.pk, self.seeker.pk})
+        self.assertEqual(ranked[2:], [self.student.pk])
+        # Every word, as a word prefix
+        self.assertEqual(self._ids(search='soft eng'), [self.engineer.pk])
+        self.assertEqual(self._ids(search='software doctor'), [])
+        self.assertEqual(self._ids(search='  !! '), [])
+
+    @requires_postgres
+    def test_misspelled_names_and_cities(self):
+        self.assertEqual(self._ids(search='Rahmn'), [self.rahman.pk])
+        self.assertEqual(self._ids(search='Chittagon'), [self.rahman.pk])
+        self.assertEqual(self._ids(search='Viewer'), [])
+
+    @requires_postgres
+    def test_interest_skips_names_and_cities(self):
+        self.assertEqual(self._ids(interest='dhaka'), [self.student.pk])
+        self.assertEqual(set(self._ids(interest='engineer')), {self.engineer.pk, self.student.pk, self.seeker.pk})
+        self.assertEqual(self._ids(interest='nadia'), [])
+        self.assertEqual(self._ids(search='dhaka', interest='engineer'), [self.engineer.pk, self.student.pk])
+
+    @requires_postgres
+    def test_document_follows_saves(self):
+        with self.committed():
+            self.title.delete()
+            self.rahman.about = 'Works as a software engineer'
+            self.rahman.save()
+        self.assertEqual(self._ids(search='soft eng'), [self.rahman.pk])
+        with self.committed():
+            WorkExperience.objects.create(profile=self.seeker, title='Teacher', company='Test')
+        self.assertEqual(self._ids(search='teach'), [self.seeker.pk])
+
+        # Bulk writes skip the signals; rebuild() recomputes the documents
+        Profile.objects.filter(pk=self.seeker.pk).update(search_document=None)
+        self.assertEqual(self._ids(search='teach'), [])
+        self.assertEqual(sum(ProfileSearchService.rebuild(batch_size=2)), Profile.objects.count())
+        self.assertEqual(self._ids(search='teach'), [self.seeker.pk])
+
+
+class ProfileCardTests(WorkerStateTestCase):
+    """?view=card serializes just the card, from just the card columns, however long the page."""
+
+    CARD_KEYS = {
+        'id', 'name', 'age', 'gender', 'profile_image', 'religion', 'marital_status', 'current_city', 'current_country',
+        'current_country_name', 'is_verified', 'created_at', 'updated_at', 'compatibility_score', 'interest',
+        'is_unlocked',
+    }
+    LONG_COLUMNS = (
+        'about', 'looking_for', 'siblings_details', 'paternal_family_details', 'maternal_family_details',
+        'search_document',
+    )
+    RELATED_TABLES = ('api_workexperience', 'api_education', 'api_additionalimage')
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer', gender='male')
+        self.matched = self._member('Farhana Begum')
+        self.locked = self._member('Nusrat Jahan')
+        Interest.objects.create(sender=self.viewer, receiver=self.matched, status='accepted', share_type='full')
+        for _ in MatchFeatureService.rebuild():
+            pass
+        self.client = APIClient()
+
+    @staticmethod
+    def _member(name):
+        profile = make_profile(
+            name=name, profile_image='profiles/member.jpg', profile_image_privacy='matches',
+            about='A long introduction', siblings_details='Two brothers', current_country='BD',
+        )
+        WorkExperience.objects.create(profile=profile, title='Doctor', company='Test')
+        return profile
+
+    def _get(self, path, **params):
+        self.client.force_authenticate(User.objects.get(pk=self.viewer.user.pk))
+        response = self.client.get(path, {'limit': 50, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _cards(self):
+        return {item['id']: item for item in self._get('/api/profiles/', view='card')['results']}
+
+    def test_card_fields_and_privacy(self):
+        cards = self._cards()
+        self.assertEqual(set(cards), {self.matched.pk, self.locked.pk})
+        for card in cards.values():
+            self.assertEqual(set(card), self.CARD_KEYS)
+        matched, locked = cards[self.matched.pk], cards[self.locked.pk]
+        self.assertEqual(
+            (matched['name'], matched['is_unlocked'], matched['interest']['status'], matched['current_country_name']),
+            ('Farhana Begum', True, 'accepted', 'Bangladesh'),
+        )
+        self.assertTrue(matched['profile_image'])
+        self.assertEqual(
+            (locked['name'], locked['is_unlocked'], locked['interest'], locked['profile_image']),
+            (mask_name('Nusrat Jahan'), False, None, None),
+        )
+        # The full serializer is still the default
+        full = self._get('/api/profiles/')['results'][0]
+        self.assertIn('about', full)
+        self.assertIn('work_experience', full)
+
+        # Members with an interest exchanged are not recommended
+        matches = self._get('/api/profiles/recommendations/', view='card')['matches']
+        self.assertEqual([match['id'] for match in matches], [self.locked.pk])
+        self.assertEqual(set(matches[0]), self.CARD_KEYS | {'match_reasons'})
+
+    def test_reads_only_card_columns(self):
+        from django.test.utils import CaptureQueriesContext
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.viewer.user.pk))
+
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get('/api/profiles/', {'view': 'card', 'limit': 50})
+            self.assertEqual(len(response.json()['results']), Profile.objects.count() - 1)
+            return [query['sql'] for query in captured.captured_queries]
+
+        # Warm requests first, so neither count includes scoring new members
+        queries()
+        small = queries()
+        for n in range(6):
+            self._member(f'Member {n}')
+        for _ in MatchFeatureService.rebuild():
+            pass
+        queries()
+        large = queries()
+        self.assertEqual(len(large), len(small))
+        for sql in large:
+            for table in self.RELATED_TABLES:
+                self.assertNotIn(f'"{table}"', sql)
+            for column in self.LONG_COLUMNS:
+                self.assertNotIn(f'"api_profile"."{column}"', sql)
+
+
+class KeysetPaginationTests(WorkerStateTestCase):
+    """?limit= / ?cursor= pages the discovery list by position."""
+
+    def setUp(self):
+        super().setUp()
+        self.viewer = make_profile(name='Viewer')
+        self.others = [make_profile(name=f'Member {n}') for n in range(10)]
+        # Ties on created_at must be broken by id, not skipped or repeated
+        tied = timezone.now() - timedelta(days=1)
+        Profile.objects.filter(pk__in=[p.pk for p in self.others[:6]]).update(created_at=tied)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer.user)
+
+    def _page(self, **params):
+        response = self.client.get('/api/profiles/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_cursor_round_trip(self):
+        moment = timezone.now()
+        cursor = DiscoveryPagination.encode_cursor(moment, 42)
+        self.assertEqual(DiscoveryPagination.decode_cursor(cursor), (moment.isoformat(), 42, False))
+        cursor = DiscoveryPagination.encode_cursor(0.125, 7, backwards=True)
+        self.assertEqual(DiscoveryPagination.decode_cursor(cursor), (0.125, 7, True))
+
+    def test_pages_follow_the_ordering_without_repeats(self):
+        expected = list(
+            Profile.objects.exclude(pk=self.viewer.pk).order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        seen, params = [], {'limit': 3}
+        while True:
+            page = self._page(**params)
+            seen += [item['id'] for item in page['results']]
+            if not page['next_cursor']:
+                break
+            params = {'limit': 3, 'cursor': page['next_cursor']}
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_the_prior_page(self):
+        first = self._page(limit=4)
+        self.assertIsNone(first['previous_cursor'])
+        second = self._page(limit=4, cursor=first['next_cursor'])
+        back = self._page(limit=4, cursor=second['previous_cursor'])
+        self.assertEqual([item['id'] for item in back['results']], [item['id'] for item in first['results']])
+
+    def test_include_total(self):
+        page = self._page(limit=2, include_total='true')
+        self.assertEqual(page['approximate_total'], len(self.others))
+        self.assertNotIn('approximate_total', self._page(limit=2))
+
+    def test_tampered_cursor_is_rejected(self):
+        response = self.client.get('/api/profiles/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/profiles/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ContactMaskingTests(WorkerStateTestCase):
+    """Locked viewers see a masked name, "LOCKED" contacts and no private image."""
+
+    def setUp(self):
+        super().setUp()
+        self.owner = make_profile(
+            name='Rahim Chowdhury', phone='+8801700000000', facebook_profile='https://facebook.com/rahim',
+            profile_image='profiles/rahim.jpg', profile_image_privacy='matches',
+        )
+        self.stranger = make_profile(name='Stranger')
+        self.client = APIClient()
+
+    def _view(self, viewer):
+        """The owner's profile as `viewer` sees it in the detail and the card list."""
+        self.client.force_authenticate(viewer.user)
+        detail = self.client.get(f'/api/profiles/{self.owner.pk}/').json()
+        cards = self.client.get('/api/profiles/', {'view': 'card', 'limit': 50}).json()['results']
+        card = next((item for item in cards if item['id'] == self.owner.pk), None)
+        return [detail] if card is None else [detail, card]
+
+    def test_mask_name(self):
+        self.assertEqual(mask_name('Rahim Chowdhury'), 'Chowdhury')
+        self.assertEqual(mask_name('md. rahman'), 'Rahman')
+        self.assertEqual(mask_name('john smith'), 'J. *****')
+        self.assertEqual(mask_name(''), 'Member')
+        self.assertEqual(mask_name(None), 'Member')
+
+    def test_stranger_sees_masked_profile(self):
+        views = self._view(self.stranger)
+        self.assertEqual(len(views), 2)
+        for data in views:
+            self.assertFalse(data['is_unlocked'])
+            self.assertEqual(data['name'], 'Chowdhury')
+            self.assertIsNone(data['profile_image'])
+            for field in ('phone', 'facebook_profile'):
+                if field in data:
+                    self.assertEqual(data[field], LOCKED)
+
+    def _projection(self):
+        return Profile.objects.values_list(*PROJECTION_FIELDS).get(pk=self.owner.pk)
+
+    def test_writes_without_save_refresh_projection(self):
+        flags = lambda *fields: sum(1 << CONTACT_FIELDS.index(field) for field in fields)
+        Profile.objects.filter(pk=self.owner.pk).update(name='John Smith', instagram_profile='https://instagram.com/john')
+        self.assertEqual(self._projection(), ('J. *****', flags('facebook_profile', 'instagram_profile', 'phone'), 'matches'))
+
+        owner = Profile.objects.only('pk', *PROJECTION_SOURCES).get(pk=self.owner.pk)
+        owner.name, owner.profile_image_privacy = 'Karim Khan', 'public'
+        Profile.objects.bulk_update([owner], ['name', 'profile_image_privacy'])
+        self.assertEqual(self._projection(), ('Khan', flags('facebook_profile', 'instagram_profile', 'phone'), 'public'))
+
+        owner = Profile.objects.get(pk=self.owner.pk)
+        owner.name, owner.phone, owner.facebook_profile = 'Anika Das', '', ''
+        owner.save(update_fields=['name', 'phone', 'facebook_profile'])
+        self.assertEqual(self._projection(), ('Das', flags('instagram_profile'), 'public'))
+        self.assertEqual(self._view(self.stranger)[0]['name'], 'Das')
+
+    def test_rows_written_without_projection_stay_masked(self):
+        # Raw SQL skips every projection refresh, so the stored projection is stale
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE api_profile SET name = %s, masked_name = %s, instagram_profile = %s, contact_flags = 0, '
+                'image_visibility = %s WHERE id = %s',
+                ['John Smith', '', 'https://instagram.com/john', 'public', self.owner.pk],
+            )
+        detail, *_ = self._view(self.stranger)
+        self.assertEqual(detail['name'], 'J. *****')
+        self.assertEqual(detail['phone'], LOCKED)
+        self.assertEqual(detail['instagram_profile'], LOCKED)
+        self.assertIsNone(detail['profile_image'])
+
+    def test_match_and_owner_see_everything(self):
+        Interest.objects.create(sender=self.stranger, receiver=self.owner, status='accepted', share_type='full')
+        for viewer in (self.stranger, self.owner):
+            detail = self._view(viewer)[0]
+            with self.subTest(viewer=viewer.name):
+                self.assertTrue(detail['is_unlocked'])
+                self.assertEqual(detail['name'], 'Rahim Chowdhury')
+                self.assertEqual(detail['phone'], '+8801700000000')
+                self.assertIsNotNone(detail['profile_image'])
+
+
+class WithinKmFilterTests(WorkerStateTestCase):
+    """?within_km= keeps profiles whose gazetteer city lies within the radius."""
+
+    def setUp(self):
+        super().setUp()
+        make_cities()
+        self.viewer = make_profile(name='Viewer', current_city='Dhaka', current_country='BD')
+        self.dhaka = make_profile(current_city='dhaka', current_country='BD')
+        self.narayanganj = make_profile(current_city='Narayanganj', current_country='BD')
+        self.chittagong = make_profile(current_city='Chittagong', current_country='BD')
+        self.unlocated = make_profile(current_city='Atlantis')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer.user)
+
+    def _ids(self, **params):
+        response = self.client.get('/api/profiles/', {'limit': 50, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id'] for item in response.json()['results']}
+
+    def test_radius_around_own_city(self):
+        self.assertEqual(self._ids(within_km=50), {self.dhaka.pk, self.narayanganj.pk})
+        self.assertEqual(self._ids(within_km=5), {self.dhaka.pk})
+        self.assertEqual(
+            self._ids(within_km=300), {self.dhaka.pk, self.narayanganj.pk, self.chittagong.pk})
+
+    def test_radius_around_named_city(self):
+        self.assertEqual(self._ids(within_km=50, near='Chittagong', near_country='BD'), {self.chittagong.pk})
+
+    def test_radius_is_capped(self):
+        # London is ~8000 km away, beyond MAX_RADIUS_KM
+        london = make_profile(current_city='London', current_country='GB')
+        self.assertNotIn(london.pk, self._ids(within_km=1e9))
+
+    def test_invalid_radius_is_rejected(self):
+        for value in ('nan', 'inf', '-inf', '1e400', 'abc'):
+            with self.subTest(value=value):
+                response = self.client.get('/api/profiles/', {'within_km': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('within_km', response.json())
+
+
+class ProfileSaveTests(WorkerStateTestCase):
+    """update_fields saves recompute and write only the columns derived from the saved ones."""
+
+    def setUp(self):
+        super().setUp()
+        make_cities()
+        self.profile = make_profile(current_city='Dhaka', current_country='BD', faith_tags=['Hijab'])
+
+    def _stored(self, *fields):
+        return Profile.objects.values_list(*fields).get(pk=self.profile.pk)
+
+    def test_unrelated_save_skips_lookups(self):
+        self.profile.current_city = 'Chittagong'
+        self.profile.about = 'Hello'
+        with mock.patch.object(Gazetteer, 'get') as gazetteer, \
+                mock.patch.object(FaithTagService, 'canonical_ids') as canonical_ids, \
+                self.assertNumQueries(1):
+            self.profile.save(update_fields=['about'])
+        gazetteer.assert_not_called()
+        canonical_ids.assert_not_called()
+        self.assertEqual(self._stored('about', 'current_city'), ('Hello', 'Dhaka'))
+
+    def test_location_save_writes_city(self):
+        chittagong = City.objects.get(name='Chittagong')
+        self.profile.current_city = 'chittagong'
+        self.profile.save(update_fields=['current_city'])
+        self.assertEqual(self._stored('gazetteer_city'), (chittagong.pk,))
+
+    def test_tags_are_mapped_when_saved_later(self):
+        self.profile.faith_tags = ['Hijab', 'Fasting']
+        self.profile.save(update_fields=['about'])
+        self.assertEqual(len(self._stored('faith_tag_ids')[0]), 1)
+        # The unsaved tags still differ from the stored ones
+        self.profile.save(update_fields=['faith_tags'])
+        self.assertEqual(self._stored('faith_tag_ids')[0], FaithTagService.canonical_ids(['Hijab', 'Fasting']))
+
+
+class FaithTagTests(WorkerStateTestCase):
+    """Faith tags are matched by vocabulary ID, exactly or by Jaccard similarity."""
+
+    def test_tags_map_to_shared_vocabulary_ids(self):
+        first = make_profile(faith_tags=['Halal  food', 'Prays five times', 7, ''])
+        second = make_profile(faith_tags=['prays five times', ' HALAL FOOD '])
+        self.assertEqual(len(first.faith_tag_ids), 2)
+        self.assertEqual(first.faith_tag_ids, second.faith_tag_ids)
+        self.assertEqual(FaithTagService.lookup(['Prays five times', 'halal food']), (first.faith_tag_ids, True))
+        known, all_known = FaithTagService.lookup(['halal food', 'unknown tag'])
+        self.assertEqual((len(known), all_known), (1, False))
+        self.assertIn(known[0], first.faith_tag_ids)
+
+    def test_similarity_points_are_floored_jaccard(self):
+        rnd = random.Random(5)
+        lists = [rnd.sample(range(200), rnd.randint(0, 8)) for _ in range(100)]
+        bits, counts = tag_bitsets(lists)
+        points = tag_similarity_points(bits[:, None], counts[:, None], bits[None, :], counts[None, :])
+        for i, j in itertools.product(range(len(lists)), repeat=2):
+            a, b = set(lists[i]), set(lists[j])
+            expected = 100 * len(a & b) // len(a | b) if a and b else 0
+            self.assertEqual(points[i, j], expected, (lists[i], lists[j]))
+
+    def test_invalid_similarity_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(make_profile().user)
+        for value in ('nan', 'inf', 'abc'):
+            with self.subTest(value=value):
+                response = client.get('/api/profiles/', {'faith_tags': 'halal food', 'tag_similarity': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('tag_similarity', response.json())
+
+    @requires_postgres
+    def test_filter(self):
+        viewer = make_profile(name='Viewer')
+        both = make_profile(faith_tags=['Halal food', 'Prays five times'])
+        one = make_profile(faith_tags=['halal food', 'Hijab', 'Quran study', 'Fasting'])
+        make_profile(faith_tags=['Hijab'])
+        client = APIClient()
+        client.force_authenticate(viewer.user)
+
+        def ids(**params):
+            response = client.get('/api/profiles/', {'limit': 50, **params})
+            self.assertEqual(response.status_code, 200, response.content)
+            return {item['id'] for item in response.json()['results']}
+
+        self.assertEqual(ids(faith_tags='halal food,PRAYS FIVE TIMES'), {both.pk})
+        self.assertEqual(ids(faith_tags='halal food,unknown tag'), set())
+        # Jaccard with {halal food, prays five times}: 2/2 and 1/5
+        self.assertEqual(ids(faith_tags='halal food,prays five times', tag_similarity='0.2'), {both.pk, one.pk})
+        self.assertEqual(ids(faith_tags='halal food,prays five times', tag_similarity='0.5'), {both.pk})
+
+
+class ProfileSyncTests(WorkerStateTestCase):
+    """Derived profile state is refreshed once per commit, never on rollback."""
+
+    def setUp(self):
+        super().setUp()
+        self.profile = make_profile(name='Member')
+        ProfileSyncService._pending.entries = {}
+        # The search document is PostgreSQL-only
+        patcher = mock.patch.object(ProfileSearchService, 'refresh')
+        self.search_refresh = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _save_everything(self):
+        self.profile.about = 'Updated'
+        self.profile.save()
+        Preference.objects.create(profile=self.profile, min_age=25)
+        for title in ('Engineer', 'Doctor', 'Teacher'):
+            WorkExperience.objects.create(profile=self.profile, title=title, company='Test')
+
+    def test_saves_in_one_transaction_refresh_once(self):
+        with mock.patch.object(MatchFeatureService, 'refresh', wraps=MatchFeatureService.refresh) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self._save_everything()
+                self.assertFalse(refresh.called)
+        refresh.assert_called_once_with(self.profile.pk)
+        self.search_refresh.assert_called_once_with(self.profile.pk)
+        features = Profile.objects.get(pk=self.profile.pk).match_features
+        self.assertEqual(len(features.profession_ids), 3)
+
+    def test_rolled_back_saves_refresh_nothing(self):
+        with mock.patch.object(MatchFeatureService, 'refresh') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self._save_everything()
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+        refresh.assert_not_called()
@@ -5,12 +5,12 @@ from .views import (
     CountryListView, ProfessionListView, NotificationListView, 
     MarkNotificationAsReadView, UnreadNotificationCountView,
     VerificationDocumentViewSet, AdminVerificationDocumentViewSet,
-    RecommendedMatchesView, EducationDegreeListView, TransactionListView,
+    RecommendedMatchesView, EducationDegreeListView, TransactionListView, MapClustersView,
     # Analytics views
     get_basic_stats, who_viewed_me, get_advanced_analytics, get_profile_strength,
     DebugEmailView
 )
-from .views_analytics import AdminDashboardAnalyticsView
+from .views_analytics import AdminDashboardAnalyticsView, RecommendationMetricsView
 
 router = DefaultRouter()
 router.register('profiles', ProfileViewSet, basename='profile')
@@ -29,6 +29,7 @@ urlpatterns = [
     path('professions/', ProfessionListView.as_view(), name='profession-list'),
     path('education-degrees/', EducationDegreeListView.as_view(), name='education-degrees'),
     path('profiles/recommendations/', RecommendedMatchesView.as_view(), name='profile-recommendations'),
+    path('map/', MapClustersView.as_view(), name='map-clusters'),
     path('notifications/', NotificationListView.as_view(), name='notification-list'),
     path('notifications/mark-read/', MarkNotificationAsReadView.as_view(), name='notification-mark-read'),
     path('notifications/unread-count/', UnreadNotificationCountView.as_view(), name='notification-unread-count'),
@@ -38,6 +39,7 @@ urlpatterns = [
     path('analytics/advanced/', get_advanced_analytics, name='analytics-advanced'),
     path('analytics/strength/', get_profile_strength, name='analytics-strength'),
     path('analytics/admin/', AdminDashboardAnalyticsView.as_view(), name='admin-analytics'),
+    path('analytics/admin/recommendations/', RecommendationMetricsView.as_view(), name='admin-recommendation-metrics'),
     path('transactions/', TransactionListView.as_view(), name='transaction-list'),
     path('debug-email/', DebugEmailView.as_view(), name='debug-email'),
     path('', include(router.urls)),
@@ -0,0 +1,87 @@
+"""
+Write-time privacy projection of a profile.
+
+What a viewer sees of a locked (not matched) profile depends only on the
+profile itself, so it is computed when the profile is written and stored
+next to the unmasked columns: the masked display name, which contact fields
+exist (to show as "LOCKED"), and the image visibility class.
+
+Every ORM write that changes a PROJECTION_SOURCES column refreshes it:
+Profile.save (also with update_fields), and the Profile queryset's update,
+bulk_update and bulk_create (api.models.ProfileQuerySet). Raw SQL does not,
+so masking never trusts the stored projection alone: locked_contacts() and
+image_is_public() also decide from the row's own values, and the stored
+contact_flags / image_visibility can only add masking, never remove it.
+"""
+
+# Surnames shown in place of the full name of a locked profile
+COMMON_SURNAMES = frozenset({
+    'Chowdhury', 'Syed', 'Khan', 'Ali', 'Zaman', 'Haque', 'Ahmed',
+    'Hussain', 'Majumder', 'Talukdar', 'Bhuiyan', 'Rahman', 'Islam', 'Uddin',
+    'Siddique', 'Miah', 'Sheikh', 'Ghosh', 'Das', 'Roy',
+})
+
+# Contact fields masked as "LOCKED"; bit i of Profile.contact_flags is CONTACT_FIELDS[i]
+CONTACT_FIELDS = ('facebook_profile', 'instagram_profile', 'linkedin_profile', 'phone')
+
+LOCKED = "LOCKED"
+
+# Profile.image_visibility values
+IMAGE_NONE = 'none'          # no profile image
+IMAGE_PUBLIC = 'public'      # shown to everyone
+IMAGE_MATCHES = 'matches'    # shown to matches with a 'full' share
+
+# Columns the projection is computed from, and the columns it is stored in
+PROJECTION_SOURCES = frozenset({'name', *CONTACT_FIELDS, 'profile_image', 'profile_image_privacy'})
+PROJECTION_FIELDS = ('masked_name', 'contact_flags', 'image_visibility')
+
+
+def mask_name(full_name):
+    """Name shown before a match: a common surname if present, else the first initial."""
+    words = (full_name or '').split()
+    for word in words:
+        # Clean punctuation from word
+        clean_word = "".join(filter(str.isalpha, word)).capitalize()
+        if clean_word in COMMON_SURNAMES:
+            return clean_word
+    if words:
+        return f"{words[0][0].upper()}. {'*' * 5}"
+    return "Member"
+
+
+def contact_flags(profile):
+    """Bitmask of the CONTACT_FIELDS the profile has filled in."""
+    return sum(1 << bit for bit, field in enumerate(CONTACT_FIELDS) if getattr(profile, field))
+
+
+def image_visibility(profile):
+    """Visibility class of the profile image (IMAGE_NONE, IMAGE_PUBLIC or IMAGE_MATCHES)."""
+    if not profile.profile_image:
+        return IMAGE_NONE
+    return IMAGE_PUBLIC if profile.profile_image_privacy == 'public' else IMAGE_MATCHES
+
+
+def project(profile):
+    """Set the stored projection (PROJECTION_FIELDS) of a profile from its PROJECTION_SOURCES, without saving."""
+    profile.masked_name = mask_name(profile.name)
+    profile.contact_flags = contact_flags(profile)
+    profile.image_visibility = image_visibility(profile)
+
+
+def display_name(profile):
+    """Name shown to a locked viewer: the stored masked name, or computed if it was never projected."""
+    return profile.masked_name or mask_name(profile.name)
+
+
+def locked_contacts(profile):
+    """{field: "LOCKED"} for every contact field that is filled in or flagged in contact_flags."""
+    flags = profile.contact_flags or 0
+    return {
+        field: LOCKED for bit, field in enumerate(CONTACT_FIELDS)
+        if getattr(profile, field) or flags & (1 << bit)
+    }
+
+
+def image_is_public(profile):
+    """Whether every viewer may see the profile image (a stored 'matches' visibility can only hide it)."""
+    return profile.profile_image_privacy == 'public' and profile.image_visibility != IMAGE_MATCHES
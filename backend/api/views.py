@@ -1,13 +1,15 @@
 from rest_framework.response import Response
 import logging
+import math
 import smtplib
 
 logger = logging.getLogger(__name__)
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from .serializers import (
-    UserSerializer, ProfileSerializer, InterestSerializer, 
+    UserSerializer, ProfileSerializer, ProfileCardSerializer, InterestSerializer, 
     NotificationSerializer, VerificationDocumentSerializer, TransactionSerializer
 )
 from django.contrib.auth.models import User
@@ -18,10 +20,22 @@ from django.core import signing
 from django.shortcuts import redirect
 from django.conf import settings
 from .services.email_service import EmailService
-from django.db.models import Q
+from .services.candidate_index import CandidateIndex
+from .services.coview_similarity import CoViewSimilarityService
+from .services.faith_tags import FaithTagService
+from .services.geo_index import MAX_RADIUS_KM, Gazetteer
+from .services.map_tiles import MAP_MAX_ZOOM, MAP_WORLD_MAX_ZOOM, MapService
+from .services.pair_score_cache import PairScoreCache
+from .services.pipeline_metrics import PipelineMetrics
+from .services.profession_index import ProfessionIndex
+from .services.profile_search import ProfileSearchService
+from .services.seen_filter import SeenFilterService
+from .services.viewer_context import ViewerContext
+from django.db.models import Prefetch, Q
 from .models import Profile, Interest, WorkExperience, Education, Notification, VerificationDocument
 from subscription.models import Transaction
 from .utils.country_utils import COUNTRY_MASTER_LIST
+from .utils.privacy import display_name, image_is_public
 from rest_framework.views import APIView
 
 
@@ -76,7 +90,7 @@ class DebugEmailView(APIView):
         return Response(degrees)
 from rest_framework.decorators import action
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from rest_framework.pagination import PageNumberPagination
+from .pagination import DiscoveryPagination
 from .services.matching_service import MatchingService
 from django.shortcuts import get_object_or_404
 from datetime import date, timedelta
@@ -157,12 +171,41 @@ class RecommendedMatchesView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        # Duration and query count of every pipeline stage, see PipelineMetrics
+        trace = PipelineMetrics.start()
+        try:
+            response = self._recommendations(request)
+        finally:
+            PipelineMetrics.finish(trace)
+        response['Server-Timing'] = trace.server_timing()
+        return response
+
+    def _recommendations(self, request):
         try:
             profile = request.user.profile
             
             # Use MatchingService to get top matches with fallback logic
             limit = int(request.query_params.get('limit', 5))
-            result = MatchingService.get_ranked_recommendations(profile, limit=limit)
+
+            # Opaque cursor from the previous page's 'next_cursor'
+            cursor = request.query_params.get('cursor')
+            try:
+                after = MatchingService.decode_cursor(cursor) if cursor else None
+            except (signing.BadSignature, ValueError, TypeError):
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Optional ranking backend override ('python' or 'sql', see MatchingService.scoring_backend)
+            backend = request.query_params.get('backend')
+
+            # ?view=card serializes light profile cards (see ProfileCardSerializer)
+            only = ProfileCardSerializer.CARD_FIELDS if request.query_params.get('view') == 'card' else None
+
+            # Profiles already shown, opened or exchanged interests with are skipped
+            with PipelineMetrics.stage('seen'):
+                seen = SeenFilterService.get(profile.pk)
+            result = MatchingService.get_ranked_recommendations(
+                profile, limit=limit, after=after, backend=backend, seen=seen, only=only
+            )
             
             # Extract data from result
             ranked_matches = result['matches']
@@ -171,15 +214,24 @@ class RecommendedMatchesView(APIView):
             
             # Serialize profiles using ProfileSerializer to apply privacy/masking logic
             profiles = [item['profile'] for item in ranked_matches]
-            serializer = ProfileSerializer(
+
+            # This page is not recommended again (the filter is written once per request)
+            with PipelineMetrics.stage('seen'):
+                seen = SeenFilterService.remember(profile.pk, result['seen'], [p.pk for p in profiles])
+                SeenFilterService.save(profile.pk, seen)
+
+            serializer = (ProfileCardSerializer if only else ProfileSerializer)(
                 profiles, 
                 many=True, 
                 context={'request': request}
             )
             
+            with PipelineMetrics.stage('serialize'):
+                serialized = serializer.data
+
             # Combine serialized data with their scores and reasons
             data = []
-            for i, item in enumerate(serializer.data):
+            for i, item in enumerate(serialized):
                 item['compatibility_score'] = ranked_matches[i]['score']
                 item['match_reasons'] = ranked_matches[i]['reasons']
                 data.append(item)
@@ -187,17 +239,55 @@ class RecommendedMatchesView(APIView):
             # Build response with fallback metadata
             response_data = {
                 'matches': data,
-                'is_fallback': is_fallback
+                'is_fallback': is_fallback,
+                'next_cursor': result['next_cursor'],
             }
             
             if fallback_message:
                 response_data['fallback_message'] = fallback_message
+
+            # Cache hit/miss and entry age, to measure the recommendation cache
+            response_data['cache'] = result['cache']
                 
             return Response(response_data)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class MapClustersView(APIView):
+    """
+    Clustered member counts for the global map (see MapService).
+
+    ?z=<zoom>&x=<column>&y=<row> returns one Web Mercator tile; ?z=<zoom>
+    alone returns every non-empty tile, for zoom levels up to
+    MAP_WORLD_MAX_ZOOM. Each tile holds at most CLUSTER_GRID ** 2 clusters.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            zoom = int(request.query_params.get('z', 0))
+            x = request.query_params.get('x')
+            y = request.query_params.get('y')
+            x = int(x) if x is not None else None
+            y = int(y) if y is not None else None
+        except ValueError:
+            return Response({'error': 'z, x and y must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not 0 <= zoom <= MAP_MAX_ZOOM:
+            return Response({'error': f'z must be between 0 and {MAP_MAX_ZOOM}'}, status=status.HTTP_400_BAD_REQUEST)
+        if (x is None) != (y is None):
+            return Response({'error': 'x and y must be given together'}, status=status.HTTP_400_BAD_REQUEST)
+        if x is None and zoom > MAP_WORLD_MAX_ZOOM:
+            return Response(
+                {'error': f'x and y are required above zoom {MAP_WORLD_MAX_ZOOM}'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if x is not None and not (0 <= x < 1 << zoom and 0 <= y < 1 << zoom):
+            return Response({'error': 'Tile out of range for this zoom'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(MapService.tiles(zoom, x, y))
+
+
 class ProfileDetailView(generics.RetrieveUpdateAPIView):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
@@ -235,7 +325,14 @@ class ProfileViewSet(viewsets.ModelViewSet):
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = (MultiPartParser, FormParser, JSONParser)
-    pagination_class = PageNumberPagination
+    pagination_class = DiscoveryPagination
+
+    def _card_view(self):
+        # ?view=card lists light profile cards (see ProfileCardSerializer)
+        return self.action == 'list' and self.request.query_params.get('view') == 'card'
+
+    def get_serializer_class(self):
+        return ProfileCardSerializer if self._card_view() else ProfileSerializer
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -271,6 +368,42 @@ class ProfileViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """
+        Profiles like this one: viewed by the same people ("viewers also
+        viewed", precomputed nightly), or with ?by=attributes the most
+        similar profiles by attributes that pass your hard filters.
+        """
+        profile = get_object_or_404(Profile, pk=pk, is_deleted=False)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 50)
+        except ValueError:
+            limit = 10
+
+        own = getattr(request.user, 'profile', None)
+        if request.query_params.get('by') == 'attributes':
+            ids, similarities = MatchingService.more_like_this(own, profile.pk, k=limit)
+            profiles = Profile.objects.select_related('user').prefetch_related(
+                'work_experience', 'education', 'additional_images', 'preference'
+            ).in_bulk(ids.tolist())
+            similar = [
+                (profiles[pid], round(float(similarity), 4))
+                for pid, similarity in zip(ids.tolist(), similarities) if pid in profiles
+            ]
+        else:
+            similar = CoViewSimilarityService.similar_profiles(
+                profile.pk, limit=limit, exclude_ids={own.pk} if own else set()
+            )
+        serializer = ProfileSerializer(
+            [neighbour for neighbour, _ in similar], many=True, context={'request': request}
+        )
+        data = []
+        for item, (_, score) in zip(serializer.data, similar):
+            item['similarity'] = score
+            data.append(item)
+        return Response({'profile_id': profile.pk, 'similar': data})
+
     def get_queryset(self):
         # Optimize queryset with select_related and prefetch_related to reduce queries
         queryset = Profile.objects.select_related('user').prefetch_related(
@@ -278,7 +411,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
             'education',
             'additional_images',
             'preference'
-        )
+        ).defer('search_document')
 
         if self.action == 'list':
             queryset = queryset.exclude(user=self.request.user)
@@ -307,16 +440,14 @@ class ProfileViewSet(viewsets.ModelViewSet):
             gender_filter = self.request.query_params.get('gender', None)
             interest_filter = self.request.query_params.get(
                 'interest', None)  # Assuming this is a text search for now
+            profession_filter = self.request.query_params.get('profession', None)
+            faith_tags_filter = self.request.query_params.get('faith_tags', None)
+            within_km_filter = self.request.query_params.get('within_km', None)
 
             if search_term:
-                queryset = queryset.filter(
-                    Q(name__icontains=search_term) |
-                    Q(current_city__icontains=search_term) |
-                    Q(origin_city__icontains=search_term) |
-                    Q(about__icontains=search_term) |
-                    Q(looking_for__icontains=search_term) |
-                    Q(work_experience__title__icontains=search_term)
-                ).distinct()
+                # Full-text match on the GIN-indexed search document, plus
+                # trigram matching of misspelled names/cities, ranked by relevance
+                queryset = ProfileSearchService.search(queryset, search_term)
 
             if age_filter:
                 min_birth_year, max_birth_year = _get_birth_year_range_from_age(
@@ -325,28 +456,68 @@ class ProfileViewSet(viewsets.ModelViewSet):
                     queryset = queryset.filter(
                         birth_year__gte=min_birth_year, birth_year__lte=max_birth_year)
 
+            # Gender is matched through the spellings known to the candidate
+            # index, so the filter is an exact IN (indexable) instead of iexact
+            # (still iexact for a spelling the index does not know)
             if gender_filter:
-                queryset = queryset.filter(gender__iexact=gender_filter)
+                queryset = queryset.filter(
+                    CandidateIndex.get().iexact_q('gender', gender_filter))
             else:
                 # Default to user's "looking_for_gender" preference from survey
-                try:
-                    user_profile = self.request.user.profile
-                    if hasattr(user_profile, 'preference'):
-                        pref = user_profile.preference
-                        if pref.looking_for_gender == 'bride':
-                            queryset = queryset.filter(gender__iexact='female')
-                        elif pref.looking_for_gender == 'groom':
-                            queryset = queryset.filter(gender__iexact='male')
-                except (AttributeError, Profile.DoesNotExist):
-                    pass
+                pref = ViewerContext.of(self.request).preference
+                if pref is not None:
+                    if pref.looking_for_gender == 'bride':
+                        queryset = queryset.filter(
+                            CandidateIndex.get().iexact_q('gender', 'female'))
+                    elif pref.looking_for_gender == 'groom':
+                        queryset = queryset.filter(
+                            CandidateIndex.get().iexact_q('gender', 'male'))
 
             if interest_filter:
-                # For now, treat interest_filter as a general text search across relevant fields
-                queryset = queryset.filter(
-                    Q(about__icontains=interest_filter) |
-                    Q(looking_for__icontains=interest_filter) |
-                    Q(work_experience__title__icontains=interest_filter)
-                ).distinct()
+                # Text search restricted to job titles, looking_for and about
+                queryset = ProfileSearchService.search_interests(queryset, interest_filter)
+
+            if profession_filter:
+                # Resolved through the profession index (job titles matching
+                # the term word-by-word) instead of a title substring join
+                queryset = queryset.filter(ProfessionIndex.get().profile_filter(profession_filter))
+
+            if faith_tags_filter:
+                # Comma-separated tags: profiles with all of them, or with
+                # ?tag_similarity=0.5 those whose tag set is at least that similar
+                min_similarity = self.request.query_params.get('tag_similarity')
+                if min_similarity is not None:
+                    try:
+                        min_similarity = float(min_similarity)
+                    except ValueError:
+                        min_similarity = math.nan
+                    if not math.isfinite(min_similarity):
+                        raise ValidationError({'tag_similarity': 'Must be a number between 0 and 1'})
+                queryset = FaithTagService.filter_profiles(
+                    queryset, faith_tags_filter.split(','), min_similarity=min_similarity)
+
+            if within_km_filter:
+                # Profiles whose gazetteer city lies within the radius of ?near=<city>
+                # (default: the user's own city), from the in-memory grid index
+                try:
+                    radius_km = float(within_km_filter)
+                except ValueError:
+                    radius_km = None
+                if radius_km is None or not math.isfinite(radius_km):
+                    raise ValidationError({'within_km': 'Must be a number of kilometres'})
+                radius_km = min(max(radius_km, 0.0), MAX_RADIUS_KM)
+                gazetteer = Gazetteer.get()
+                near = self.request.query_params.get('near')
+                if near:
+                    center = gazetteer.resolve(near, self.request.query_params.get('near_country'))
+                else:
+                    center = Profile.objects.filter(user=self.request.user).values_list(
+                        'gazetteer_city_id', flat=True).first()
+                city_ids, _ = gazetteer.within_of_city(center, radius_km)
+                queryset = queryset.filter(gazetteer_city_id__in=city_ids.tolist())
+
+            if self._card_view():
+                queryset = ProfileCardSerializer.card_queryset(queryset)
 
         return queryset
 
@@ -366,7 +537,7 @@ class InterestViewSet(viewsets.ModelViewSet):
             user_profile = self.request.user.profile
             return Interest.objects.filter(
                 Q(sender=user_profile) | Q(receiver=user_profile)
-            )
+            ).select_related('sender', 'receiver')
         except Profile.DoesNotExist:
             return Interest.objects.none()
 
@@ -711,60 +882,33 @@ def who_viewed_me(request):
     profile = request.user.profile
     days = int(request.GET.get('days', 30))
     
-    # Get viewers
-    views = AnalyticsService.get_profile_views(profile, days=days)
+    # Get viewers (with their job titles in one prefetch)
+    views = list(AnalyticsService.get_profile_views(profile, days=days).prefetch_related(
+        Prefetch('viewer__work_experience', queryset=WorkExperience.objects.order_by('id'))
+    ))
+    
+    # Score all visitors through the pair-score cache (one batch for the misses)
+    match_results = PairScoreCache.get_many(profile, {view.viewer_id for view in views})
     
-    # Import MatchingService for compatibility scores
-    from api.services.matching_service import MatchingService
+    # Interests with all visitors in one query
+    viewer_context = ViewerContext.of(request)
+    viewer_context.load_interests(view.viewer_id for view in views)
     
     # Format response
     viewers = []
     for view in views:
         visitor = view.viewer
-        # Calculate match score
-        result = MatchingService.calculate_compatibility_score(profile, visitor)
-        match_score = result['score'] if result and isinstance(result, dict) else result
-        
-        # Consistent Name Masking (Match Discover page logic)
-        full_name = visitor.name or "Member"
-        common_surnames = [
-            'Chowdhury', 'Syed', 'Khan', 'Ali', 'Zaman', 'Haque', 'Ahmed', 
-            'Hussain', 'Majumder', 'Talukdar', 'Bhuiyan', 'Rahman', 'Islam', 'Uddin',
-            'Siddique', 'Miah', 'Sheikh', 'Ghosh', 'Das', 'Roy'
-        ]
-        
-        words = full_name.split()
-        masked_name = "Member"
-        
-        if words:
-            found_surname = None
-            for word in words:
-                clean_word = "".join(filter(str.isalpha, word))
-                if clean_word.capitalize() in common_surnames:
-                    found_surname = clean_word.capitalize()
-                    break
-            
-            if found_surname:
-                masked_name = found_surname
-            else:
-                first_word = words[0]
-                masked_name = f"{first_word[0].upper()}. {'*' * 5}"
+        # Look up match score
+        result = match_results.get(visitor.id)
+        match_score = result['score'] if result else None
         
         # Get profession
-        profession = None
-        if visitor.work_experience.exists():
-            latest_work = visitor.work_experience.first()
-            profession = latest_work.title if latest_work else None
-        
-        # Determine image visibility
-        from .models import Interest
-        is_matched = Interest.objects.filter(
-            (Q(sender=profile, receiver=visitor) | Q(sender=visitor, receiver=profile)),
-            status='accepted'
-        ).exists()
+        work_experience = visitor.work_experience.all()
+        profession = work_experience[0].title if work_experience else None
         
         # Share the image if it's public OR they are matched
-        show_img = (visitor.profile_image_privacy == 'public') or is_matched
+        is_matched = viewer_context.accepted_interest(visitor.id) is not None
+        show_img = image_is_public(visitor) or is_matched
         
         # Get absolute image URL
         profile_picture = None
@@ -773,7 +917,7 @@ def who_viewed_me(request):
         
         viewers.append({
             'profile_id': visitor.id,
-            'name': masked_name,  # Masked name for privacy
+            'name': display_name(visitor),  # Masked name for privacy (precomputed on save)
             'age': visitor.age,
             'height': visitor.height,
             'profession': profession,
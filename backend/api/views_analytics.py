@@ -7,6 +7,7 @@ from django.db.models.functions import TruncDate
 from django.utils import timezone
 from datetime import timedelta
 from subscription.models import Transaction
+from .services.pipeline_metrics import PipelineMetrics
 
 class AdminDashboardAnalyticsView(APIView):
     """
@@ -87,3 +88,14 @@ class AdminDashboardAnalyticsView(APIView):
         }
         
         return Response(data)
+
+
+class RecommendationMetricsView(APIView):
+    """
+    Per-stage timing histograms of the recommendation pipeline, merged
+    across workers (see PipelineMetrics). Only accessible by staff/admin.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(PipelineMetrics.snapshot())